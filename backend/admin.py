@@ -0,0 +1,24 @@
+import hmac
+import os
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+# Guard for operational endpoints (profiling, slow queries). They only exist
+# when ADMIN_TOKEN is set, and every call must send it as X-Admin-Token.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+
+def admin_enabled():
+    return bool(ADMIN_TOKEN)
+
+
+def is_admin_token(token: Optional[str]):
+    return admin_enabled() and token is not None and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not admin_enabled():
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
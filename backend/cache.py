@@ -0,0 +1,310 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from metrics import counter
+
+# Two-tier cache used for everything server.py caches outside PostgreSQL.
+#
+# The local tier is a per-process LRU. The shared tier is what several uvicorn
+# workers have in common, configured through CACHE_URL:
+#   (unset)               local tier only
+#   sqlite:///path/to.db  SQLite file shared by the workers of one host
+#   redis://host:6379/0   Redis (or any Redis-protocol server)
+# Values must be JSON-serializable. Keys are namespaced ("search", "igdb", ...)
+# and every entry has a TTL.
+CACHE_URL = os.environ.get('CACHE_URL')
+LOCAL_CACHE_MAX_ENTRIES = int(os.environ.get('LOCAL_CACHE_MAX_ENTRIES', 10000))
+# Upper bound on how long the local tier keeps a copy of a shared entry, so a
+# value replaced by another worker does not linger here for the full TTL
+LOCAL_TTL_WITH_SHARED_TIER = 30
+LOAD_LOCK_TTL = 30
+LOAD_LOCK_POLL_INTERVAL = 0.05
+
+cache_lookups = counter("cache_lookups_total", "get_or_load outcomes per namespace", ["namespace", "outcome"])
+
+
+class LocalLRUCache:
+    """In-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries: int = LOCAL_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.entries[key] = (value, time.monotonic() + ttl if ttl else None)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def delete(self, key):
+        self.entries.pop(key, None)
+
+
+class SQLiteCache:
+    """Shared tier backed by a SQLite file, for several workers on one host
+
+    Queries run in a worker thread, one at a time, so a busy file does not
+    block the event loop.
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self.lock = threading.Lock()
+
+    def execute(self, sql: str, params):
+        with self.lock:
+            cursor = self.conn.execute(sql, params)
+            return cursor.fetchone(), cursor.rowcount
+
+    async def get(self, key):
+        row, _ = await asyncio.to_thread(
+            self.execute, "SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        )
+        return json.loads(row[0]) if row else None
+
+    async def set(self, key, value, ttl=None):
+        await asyncio.to_thread(
+            self.execute, "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time() + ttl if ttl else None)
+        )
+
+    def add_now(self, key, value, ttl):
+        now = time.time()
+        with self.lock:
+            self.conn.execute("DELETE FROM cache WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + ttl)
+            )
+            return cursor.rowcount == 1
+
+    async def add(self, key, value, ttl):
+        """Set only if absent (or expired); True when this call set it"""
+        return await asyncio.to_thread(self.add_now, key, value, ttl)
+
+    async def delete(self, key):
+        await asyncio.to_thread(self.execute, "DELETE FROM cache WHERE key = ?", (key,))
+
+
+class RedisCache:
+    """Shared tier backed by a Redis-protocol server"""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url)
+
+    async def get(self, key):
+        value = await self.redis.get(key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key, value, ttl=None):
+        await self.redis.set(key, json.dumps(value), ex=int(ttl) if ttl else None)
+
+    async def add(self, key, value, ttl):
+        return bool(await self.redis.set(key, json.dumps(value), ex=int(ttl), nx=True))
+
+    async def delete(self, key):
+        await self.redis.delete(key)
+
+
+class InflightLoad:
+    """A running load and the number of callers waiting for it"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class TieredCache:
+    def __init__(self, local: LocalLRUCache, shared=None, prefix: str = "media_trakker"):
+        self.local = local
+        self.shared = shared
+        self.prefix = prefix
+        self.inflight = {}
+        self.stats = {}
+
+    def full_key(self, namespace: str, key: str):
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def count(self, namespace: str, outcome: str):
+        counts = self.stats.setdefault(namespace, {})
+        counts[outcome] = counts.get(outcome, 0) + 1
+        cache_lookups.inc(namespace=namespace, outcome=outcome)
+
+    def local_ttl(self, ttl):
+        if self.shared is None:
+            return ttl
+        return min(ttl, LOCAL_TTL_WITH_SHARED_TIER) if ttl else LOCAL_TTL_WITH_SHARED_TIER
+
+    async def get(self, namespace: str, key: str):
+        full_key = self.full_key(namespace, key)
+        value = self.local.get(full_key)
+        if value is not None:
+            return value
+        if self.shared is not None:
+            try:
+                value = await self.shared.get(full_key)
+            except Exception as e:
+                logging.error(f"Shared cache get failed: {str(e)}")
+                return None
+            if value is not None:
+                self.local.set(full_key, value, LOCAL_TTL_WITH_SHARED_TIER)
+        return value
+
+    async def set(self, namespace: str, key: str, value, ttl=None):
+        full_key = self.full_key(namespace, key)
+        self.local.set(full_key, value, self.local_ttl(ttl))
+        if self.shared is not None:
+            try:
+                await self.shared.set(full_key, value, ttl)
+            except Exception as e:
+                logging.error(f"Shared cache set failed: {str(e)}")
+
+    async def delete(self, namespace: str, key: str):
+        full_key = self.full_key(namespace, key)
+        self.local.delete(full_key)
+        if self.shared is not None:
+            try:
+                await self.shared.delete(full_key)
+            except Exception as e:
+                logging.error(f"Shared cache delete failed: {str(e)}")
+
+    @asynccontextmanager
+    async def lock(self, name: str, ttl: float = LOAD_LOCK_TTL):
+        """Hold `name` against the other workers sharing the shared tier (nothing to hold without one).
+
+        Waits up to `ttl` for a worker holding it, after which its entry has
+        expired; yields whether the lock was taken.
+        """
+        lock_key = self.full_key("lock", name)
+        locked = False
+        if self.shared is not None:
+            deadline = time.monotonic() + ttl
+            try:
+                while not (locked := await self.shared.add(lock_key, os.getpid(), ttl)) and time.monotonic() < deadline:
+                    await asyncio.sleep(LOAD_LOCK_POLL_INTERVAL)
+            except Exception as e:
+                logging.error(f"Shared cache lock failed: {str(e)}")
+        try:
+            yield locked
+        finally:
+            if locked:
+                try:
+                    await self.shared.delete(lock_key)
+                except Exception as e:
+                    logging.error(f"Shared cache unlock failed: {str(e)}")
+
+    async def get_or_load(self, namespace: str, key: str, loader, ttl):
+        """Return (value, was_cached), calling `loader` at most once per key at a time.
+
+        Concurrent misses in this process share one load task; with a shared
+        tier, a short lock entry makes other workers wait for it too instead of
+        hitting the provider in parallel. A caller that is cancelled (its client
+        went away) stops waiting, and the load itself is cancelled once no
+        caller is waiting for it any more. `ttl` may be a function of the loaded
+        value. None results are returned but not cached. was_cached is only
+        True for values found in the cache; callers that joined a running
+        load get False, as the caller that started it does.
+        """
+        value = await self.get(namespace, key)
+        if value is not None:
+            self.count(namespace, "hit")
+            return value, True
+
+        full_key = self.full_key(namespace, key)
+        load = self.inflight.get(full_key)
+        if load is None:
+            self.count(namespace, "miss")
+            load = InflightLoad(asyncio.create_task(self.load_once(namespace, key, loader, ttl)))
+            self.inflight[full_key] = load
+            load.task.add_done_callback(lambda task: self.finish_load(full_key, load))
+        else:
+            self.count(namespace, "coalesced")
+
+        load.waiters += 1
+        try:
+            return await asyncio.shield(load.task), False
+        finally:
+            load.waiters -= 1
+            if load.waiters == 0 and not load.task.done():
+                self.count(namespace, "cancelled")
+                load.task.cancel()
+
+    def finish_load(self, full_key: str, load):
+        if self.inflight.get(full_key) is load:
+            del self.inflight[full_key]
+        if not load.task.cancelled():
+            # Mark the exception retrieved when every waiter had already gone
+            load.task.exception()
+
+    async def load_once(self, namespace: str, key: str, loader, ttl):
+        lock_key = self.full_key("lock", f"{namespace}:{key}")
+        locked = False
+        if self.shared is not None:
+            try:
+                locked = await self.shared.add(lock_key, os.getpid(), LOAD_LOCK_TTL)
+                if not locked:
+                    # Another worker is loading; wait for its result up to the lock TTL
+                    deadline = time.monotonic() + LOAD_LOCK_TTL
+                    while time.monotonic() < deadline:
+                        await asyncio.sleep(LOAD_LOCK_POLL_INTERVAL)
+                        value = await self.shared.get(self.full_key(namespace, key))
+                        if value is not None:
+                            self.local.set(self.full_key(namespace, key), value, LOCAL_TTL_WITH_SHARED_TIER)
+                            return value
+                        if await self.shared.get(lock_key) is None:
+                            break
+            except Exception as e:
+                logging.error(f"Shared cache lock failed: {str(e)}")
+
+        try:
+            value = await loader()
+            if value is not None:
+                await self.set(namespace, key, value, ttl(value) if callable(ttl) else ttl)
+            return value
+        finally:
+            if locked:
+                try:
+                    await self.shared.delete(lock_key)
+                except Exception as e:
+                    logging.error(f"Shared cache unlock failed: {str(e)}")
+
+
+def create_shared_tier():
+    if not CACHE_URL:
+        return None
+    try:
+        if CACHE_URL.startswith("sqlite:///"):
+            return SQLiteCache(CACHE_URL[len("sqlite:///"):])
+        if CACHE_URL.startswith(("redis://", "rediss://")):
+            return RedisCache(CACHE_URL)
+        logging.error(f"Unsupported CACHE_URL scheme: {CACHE_URL.split(':', 1)[0]} - using local cache only")
+    except Exception as e:
+        logging.error(f"Shared cache unavailable: {str(e)} - using local cache only")
+    return None
+
+
+cache = TieredCache(LocalLRUCache(), create_shared_tier())
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import Dict, Set
+
+# Per-user event fan-out for the /api/events stream.
+#
+# Every worker process publishes the events for the mutations it handles. With a
+# single worker the in-process broker is enough; with several workers set
+# EVENT_BROKER_URL=redis://... so that a tab connected to one worker also sees
+# changes made through another.
+EVENT_BROKER_URL = os.environ.get('EVENT_BROKER_URL')
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class InProcessBroker:
+    """Fan-out through asyncio queues, one per connected stream"""
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    async def publish(self, user_id: str, event: dict):
+        for queue in list(self.subscribers.get(user_id, ())):
+            if queue.full():
+                # A stalled client loses its oldest event rather than blocking writers;
+                # versions in the events let it notice the gap and resync
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: str):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            self.subscribers[user_id].discard(queue)
+            if not self.subscribers[user_id]:
+                del self.subscribers[user_id]
+
+
+class RedisBroker:
+    """Fan-out through Redis pub/sub, one channel per user"""
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url)
+
+    @staticmethod
+    def channel(user_id: str):
+        return f"media_trakker:events:{user_id}"
+
+    async def publish(self, user_id: str, event: dict):
+        await self.redis.publish(self.channel(user_id), json.dumps(event))
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: str):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self.channel(user_id))
+
+        async def forward():
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(json.loads(message["data"]))
+
+        forwarder = asyncio.create_task(forward())
+        try:
+            yield queue
+        finally:
+            forwarder.cancel()
+            await pubsub.unsubscribe(self.channel(user_id))
+            await pubsub.close()
+
+
+def create_broker():
+    if EVENT_BROKER_URL and EVENT_BROKER_URL.startswith("redis"):
+        try:
+            broker = RedisBroker(EVENT_BROKER_URL)
+            logging.info("Publishing live updates through Redis")
+            return broker
+        except ImportError:
+            logging.error("EVENT_BROKER_URL is set but the redis package is not installed - using in-process events")
+    return InProcessBroker()
+
+
+broker = create_broker()
+
+
+async def publish_event(user_id: str, event_type: str, data: dict):
+    """Publish an event; delivery is best effort and never fails the caller"""
+    try:
+        await broker.publish(user_id, {"type": event_type, "data": data})
+    except Exception as e:
+        logging.error(f"Error publishing {event_type} event: {str(e)}")
+
+
+def format_sse(event: dict):
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
@@ -0,0 +1,335 @@
+import base64
+from typing import List, Optional
+
+import strawberry
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from strawberry.dataloader import DataLoader
+from strawberry.scalars import JSON
+from strawberry.types import Info
+
+from database import MediaItem, UserList, UserPreferences, db_available, memory_storage
+
+# GraphQL endpoint over the same models as the REST API, so a client can load
+# preferences, a page of its library, stats and search results in one request.
+MAX_PAGE_SIZE = 500
+
+
+@strawberry.type(name="MediaItem")
+class MediaItemType:
+    id: str
+    external_id: Optional[str]
+    title: Optional[str]
+    media_type: str
+    year: Optional[int] = None
+    genres: List[str] = strawberry.field(default_factory=list)
+    poster_path: Optional[str] = None
+    overview: Optional[str] = None
+    backdrop_path: Optional[str] = None
+    vote_average: Optional[float] = None
+    release_date: Optional[str] = None
+    seasons: Optional[int] = None
+    episodes: Optional[int] = None
+    chapters: Optional[int] = None
+    volumes: Optional[int] = None
+    authors: List[str] = strawberry.field(default_factory=list)
+    publisher: Optional[str] = None
+    page_count: Optional[int] = None
+    platforms: List[str] = strawberry.field(default_factory=list)
+    developers: List[str] = strawberry.field(default_factory=list)
+    publishers: List[str] = strawberry.field(default_factory=list)
+    release_year: Optional[int] = None
+    rating: Optional[float] = None
+    game_modes: List[str] = strawberry.field(default_factory=list)
+
+    @classmethod
+    def from_item(cls, item):
+        """Build from a MediaItem row or a MediaItemResponse"""
+        return cls(
+            id=item.id,
+            external_id=item.external_id,
+            title=item.title,
+            media_type=item.media_type,
+            year=item.year,
+            genres=item.genres or [],
+            poster_path=item.poster_path,
+            overview=item.overview,
+            backdrop_path=item.backdrop_path,
+            vote_average=item.vote_average,
+            release_date=item.release_date,
+            seasons=item.seasons,
+            episodes=item.episodes,
+            chapters=item.chapters,
+            volumes=item.volumes,
+            authors=item.authors or [],
+            publisher=item.publisher,
+            page_count=item.page_count,
+            platforms=item.platforms or [],
+            developers=item.developers or [],
+            publishers=item.publishers or [],
+            release_year=item.release_year,
+            rating=item.rating,
+            game_modes=item.game_modes or []
+        )
+
+    @classmethod
+    def from_dict(cls, item: dict):
+        """Build from a serialized MediaItemResponse, as search responses are cached"""
+        return cls(
+            id=item['id'],
+            external_id=item.get('external_id'),
+            title=item.get('title'),
+            media_type=item['media_type'],
+            year=item.get('year'),
+            genres=item.get('genres') or [],
+            poster_path=item.get('poster_path'),
+            overview=item.get('overview'),
+            backdrop_path=item.get('backdrop_path'),
+            vote_average=item.get('vote_average'),
+            release_date=item.get('release_date'),
+            seasons=item.get('seasons'),
+            episodes=item.get('episodes'),
+            chapters=item.get('chapters'),
+            volumes=item.get('volumes'),
+            authors=item.get('authors') or [],
+            publisher=item.get('publisher'),
+            page_count=item.get('page_count'),
+            platforms=item.get('platforms') or [],
+            developers=item.get('developers') or [],
+            publishers=item.get('publishers') or [],
+            release_year=item.get('release_year'),
+            rating=item.get('rating'),
+            game_modes=item.get('game_modes') or []
+        )
+
+    @classmethod
+    def from_memory(cls, entry: dict):
+        """Build from the media information kept on an in-memory list entry"""
+        return cls(
+            id=entry['media_id'],
+            external_id=entry['media_id'],
+            title=entry.get('title'),
+            media_type=entry['media_type'],
+            year=entry.get('year'),
+            genres=entry.get('genres') or [],
+            poster_path=entry.get('poster_path'),
+            overview=entry.get('overview'),
+            vote_average=entry.get('vote_average'),
+            seasons=entry.get('seasons'),
+            episodes=entry.get('episodes'),
+            chapters=entry.get('chapters'),
+            volumes=entry.get('volumes'),
+            authors=entry.get('authors') or [],
+            publisher=entry.get('publisher'),
+            page_count=entry.get('page_count'),
+            platforms=entry.get('platforms') or [],
+            developers=entry.get('developers') or [],
+            publishers=entry.get('publishers') or [],
+            release_year=entry.get('release_year'),
+            game_modes=entry.get('game_modes') or []
+        )
+
+
+@strawberry.type(name="LibraryEntry")
+class LibraryEntryType:
+    id: str
+    media_id: str
+    media_type: str
+    status: str
+    rating: Optional[float]
+    notes: Optional[str]
+    progress: Optional[JSON]
+    version: Optional[int]
+    created_at: str
+    updated_at: str
+    memory_entry: strawberry.Private[Optional[dict]] = None
+
+    @classmethod
+    def from_row(cls, item):
+        return cls(
+            id=item.id,
+            media_id=item.media_id,
+            media_type=item.media_type,
+            status=item.status,
+            rating=item.rating,
+            notes=item.notes,
+            progress=item.progress,
+            version=item.version,
+            created_at=item.created_at.isoformat(),
+            updated_at=item.updated_at.isoformat()
+        )
+
+    @classmethod
+    def from_memory(cls, entry: dict):
+        return cls(
+            id=entry['id'],
+            media_id=entry['media_id'],
+            media_type=entry['media_type'],
+            status=entry['status'],
+            rating=entry['rating'],
+            notes=entry['notes'],
+            progress=entry['progress'],
+            version=entry.get('version'),
+            created_at=entry['created_at'],
+            updated_at=entry['updated_at'],
+            memory_entry=entry
+        )
+
+    @strawberry.field
+    async def media_item(self, info: Info) -> Optional[MediaItemType]:
+        if self.memory_entry is not None:
+            return MediaItemType.from_memory(self.memory_entry)
+        # Batched: every entry resolved in this request shares one query
+        return await info.context["media_item_loader"].load(self.media_id)
+
+
+@strawberry.type
+class LibraryPage:
+    entries: List[LibraryEntryType]
+    total_count: int
+    end_cursor: Optional[str]
+    has_next_page: bool
+
+
+@strawberry.type
+class StatCount:
+    media_type: str
+    status: str
+    count: int
+
+
+@strawberry.type
+class Preferences:
+    theme: str
+    language: str
+    notifications_enabled: bool
+
+
+@strawberry.type
+class SearchResults:
+    results: List[MediaItemType]
+    source: str
+
+
+def encode_cursor(offset: int):
+    return base64.urlsafe_b64encode(f"offset:{offset}".encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]):
+    if not cursor:
+        return 0
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode().split(":", 1)[1])
+    except (ValueError, IndexError):
+        raise ValueError("Invalid cursor")
+
+
+def create_media_item_loader(db: Session):
+    """DataLoader collapsing all media item lookups of a request into one query"""
+    async def load_media_items(ids: List[str]):
+        rows = db.query(MediaItem).filter(MediaItem.id.in_(ids)).all()
+        by_id = {row.id: MediaItemType.from_item(row) for row in rows}
+        return [by_id.get(media_id) for media_id in ids]
+    return DataLoader(load_fn=load_media_items)
+
+
+def create_context(db: Session, search):
+    """Per-request context; `search` is the REST search pipeline (server.run_search)"""
+    return {
+        "db": db,
+        "search": search,
+        "media_item_loader": create_media_item_loader(db) if db and db_available else None
+    }
+
+
+def using_database(info: Info):
+    return info.context["db"] is not None and db_available
+
+
+@strawberry.type
+class Query:
+    @strawberry.field
+    def preferences(self, info: Info) -> Preferences:
+        if using_database(info):
+            preferences = info.context["db"].query(UserPreferences).filter(
+                UserPreferences.user_id == "demo_user"
+            ).first()
+            if preferences:
+                return Preferences(
+                    theme=preferences.theme,
+                    language=preferences.language,
+                    notifications_enabled=preferences.notifications_enabled
+                )
+        return Preferences(**memory_storage['user_preferences'])
+
+    @strawberry.field
+    def library(
+        self,
+        info: Info,
+        status: Optional[str] = None,
+        media_type: Optional[str] = None,
+        first: int = 50,
+        after: Optional[str] = None
+    ) -> LibraryPage:
+        first = max(1, min(first, MAX_PAGE_SIZE))
+        offset = decode_cursor(after)
+
+        if using_database(info):
+            query = info.context["db"].query(UserList).filter(UserList.user_id == "demo_user")
+            if status:
+                query = query.filter(UserList.status == status)
+            if media_type:
+                query = query.filter(UserList.media_type == media_type)
+            total_count = query.count()
+            rows = query.order_by(UserList.created_at, UserList.id).offset(offset).limit(first).all()
+            entries = [LibraryEntryType.from_row(row) for row in rows]
+        else:
+            items = [
+                i for i in memory_storage['user_list']
+                if (not status or i['status'] == status) and (not media_type or i['media_type'] == media_type)
+            ]
+            total_count = len(items)
+            entries = [LibraryEntryType.from_memory(i) for i in items[offset:offset + first]]
+
+        next_offset = offset + len(entries)
+        return LibraryPage(
+            entries=entries,
+            total_count=total_count,
+            end_cursor=encode_cursor(next_offset) if entries else after,
+            has_next_page=next_offset < total_count
+        )
+
+    @strawberry.field
+    def stats(self, info: Info) -> List[StatCount]:
+        if using_database(info):
+            rows = info.context["db"].query(
+                UserList.media_type, UserList.status, func.count(UserList.id)
+            ).filter(UserList.user_id == "demo_user").group_by(UserList.media_type, UserList.status).all()
+            return [StatCount(media_type=media_type, status=status, count=count) for media_type, status, count in rows]
+
+        counts = {}
+        for i in memory_storage['user_list']:
+            counts[(i['media_type'], i['status'])] = counts.get((i['media_type'], i['status']), 0) + 1
+        return [StatCount(media_type=media_type, status=status, count=count)
+                for (media_type, status), count in counts.items()]
+
+    @strawberry.field
+    async def media_item(self, info: Info, id: str) -> Optional[MediaItemType]:
+        if not using_database(info):
+            return None
+        return await info.context["media_item_loader"].load(id)
+
+    @strawberry.field
+    async def search(self, info: Info, query: str, media_type: str, page: int = 1) -> SearchResults:
+        try:
+            response = await info.context["search"](query, media_type, page)
+        except HTTPException as e:
+            raise ValueError(e.detail)
+        return SearchResults(
+            results=[MediaItemType.from_dict(item) for item in response["results"]],
+            source=response["source"]
+        )
+
+
+schema = strawberry.Schema(query=Query)
@@ -0,0 +1,225 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import httpx
+
+import database
+from database import CatalogIngestState, session_scope
+from titles import backfill_titles
+
+# Offline catalog ingestion from provider bulk exports.
+#
+# TMDB publishes a gzipped JSON-lines file of every movie and TV series id
+# each day (https://developer.themoviedb.org/docs/daily-id-exports), with the
+# original title and a popularity score. Each export is read line by line and
+# loaded in batches: COPY into a temporary staging table, then one upsert into
+# media_items. New titles become rows marked with catalog_source, which
+# retention never evicts and searches fill in with details the first time
+# they return them. Titles already present only get their popularity
+# refreshed, and only when it moved noticeably, so a daily run writes the
+# changed ids rather than the whole catalog. Existing titles are left as
+# they are, because they are usually localized.
+#
+# Progress is committed together with each batch (catalog_ingest_state), so
+# an interrupted run resumes after the last merged batch, and an export that
+# was already ingested is skipped.
+#
+#     python ingest.py tmdb-movie                     # today's export
+#     python ingest.py tmdb-tv --date 2024-05-15
+#     python ingest.py tmdb-movie ./movie_ids_05_15_2024.json.gz
+TMDB_EXPORT_URL = "http://files.tmdb.org/p/exports/{kind}_ids_{date:%m_%d_%Y}.json.gz"
+INGEST_BATCH_SIZE = 20000
+# Relative popularity change below which an existing row is not rewritten
+POPULARITY_CHANGE_THRESHOLD = 0.1
+
+
+def tmdb_movie_row(record):
+    if record.get("adult") or record.get("video"):
+        return None
+    return str(record["id"]), "movie", record.get("original_title"), record.get("popularity")
+
+
+def tmdb_tv_row(record):
+    if record.get("adult"):
+        return None
+    return str(record["id"]), "tv", record.get("original_name"), record.get("popularity")
+
+
+# source -> (export kind in the TMDB URL, record -> (external_id, media_type, title, popularity) or None)
+EXPORT_FORMATS = {
+    "tmdb-movie": ("movie", tmdb_movie_row),
+    "tmdb-tv": ("tv_series", tmdb_tv_row),
+}
+
+CREATE_STAGING_SQL = """
+CREATE TEMPORARY TABLE IF NOT EXISTS catalog_staging (
+    external_id TEXT NOT NULL,
+    media_type TEXT NOT NULL,
+    title TEXT,
+    popularity DOUBLE PRECISION
+) ON COMMIT DELETE ROWS
+"""
+
+COPY_STAGING_SQL = "COPY catalog_staging (external_id, media_type, title, popularity) FROM STDIN WITH (FORMAT csv)"
+
+MERGE_STAGING_SQL = """
+WITH merged AS (
+    INSERT INTO media_items (id, external_id, media_type, title, additional_data, catalog_source, created_at, updated_at)
+    SELECT DISTINCT ON (external_id, media_type)
+        gen_random_uuid()::text, external_id, media_type, title,
+        json_build_object('popularity', popularity), %(source)s,
+        now() AT TIME ZONE 'utc', now() AT TIME ZONE 'utc'
+    FROM catalog_staging
+    WHERE title IS NOT NULL
+    ORDER BY external_id, media_type
+    ON CONFLICT (external_id, media_type) DO UPDATE SET
+        additional_data = (COALESCE(media_items.additional_data::jsonb, '{}'::jsonb) || EXCLUDED.additional_data::jsonb)::json,
+        updated_at = EXCLUDED.updated_at
+    WHERE abs(COALESCE((media_items.additional_data->>'popularity')::float, 0) - (EXCLUDED.additional_data->>'popularity')::float)
+          > %(threshold)s * GREATEST((EXCLUDED.additional_data->>'popularity')::float, 1)
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged
+"""
+
+SAVE_STATE_SQL = """
+INSERT INTO catalog_ingest_state (source, export_name, lines_done, rows_inserted, rows_updated, completed_at, updated_at)
+VALUES (%(source)s, %(export_name)s, %(lines_done)s, %(rows_inserted)s, %(rows_updated)s, %(completed_at)s, now() AT TIME ZONE 'utc')
+ON CONFLICT (source) DO UPDATE SET
+    export_name = EXCLUDED.export_name,
+    lines_done = EXCLUDED.lines_done,
+    rows_inserted = EXCLUDED.rows_inserted,
+    rows_updated = EXCLUDED.rows_updated,
+    completed_at = EXCLUDED.completed_at,
+    updated_at = EXCLUDED.updated_at
+"""
+
+
+def export_url(source: str, day: date):
+    return TMDB_EXPORT_URL.format(kind=EXPORT_FORMATS[source][0], date=day)
+
+
+def download(url: str, directory: str):
+    """Stream an export to a local file; exports are published around 08:00 UTC"""
+    path = os.path.join(directory, url.rsplit("/", 1)[-1])
+    with httpx.stream("GET", url, timeout=60, follow_redirects=True) as response:
+        response.raise_for_status()
+        with open(path, "wb") as f:
+            for chunk in response.iter_bytes(1 << 20):
+                f.write(chunk)
+    return path
+
+
+def read_export(path: str, skip_lines: int):
+    """(line number, record) for every line after the first `skip_lines`, without loading the file"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if number <= skip_lines or not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                logging.warning(f"Skipping malformed line {number} of {path}")
+
+
+def load_state(source: str):
+    with session_scope() as db:
+        state = db.get(CatalogIngestState, source)
+        if state is None:
+            return None
+        return {column: getattr(state, column) for column in ("export_name", "lines_done", "rows_inserted", "rows_updated", "completed_at")}
+
+
+def merge_batch(connection, source: str, rows, state):
+    """Stage and merge one batch and record the progress, in one transaction"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_STAGING_SQL)
+        cursor.copy_expert(COPY_STAGING_SQL, buffer)
+        cursor.execute(MERGE_STAGING_SQL, {"source": source, "threshold": POPULARITY_CHANGE_THRESHOLD})
+        inserted, updated = cursor.fetchone()
+        state["rows_inserted"] += inserted
+        state["rows_updated"] += updated
+        cursor.execute(SAVE_STATE_SQL, {"source": source, **state})
+    connection.commit()
+
+
+def ingest(source: str, path: str, export_name: str, batch_size: int = INGEST_BATCH_SIZE, min_popularity: float = 0):
+    """Merge one export into media_items, resuming where an earlier run of the same export stopped"""
+    _, to_row = EXPORT_FORMATS[source]
+    previous = load_state(source)
+    if previous and previous["export_name"] == export_name and previous["completed_at"]:
+        logging.info(f"{source}: {export_name} was already ingested")
+        return previous
+    if previous and previous["export_name"] == export_name:
+        state = {**previous, "export_name": export_name}
+        logging.info(f"{source}: resuming {export_name} after line {state['lines_done']}")
+    else:
+        state = {"export_name": export_name, "lines_done": 0, "rows_inserted": 0, "rows_updated": 0, "completed_at": None}
+
+    started = time.monotonic()
+    connection = database.engine.raw_connection()
+    try:
+        rows = []
+        for number, record in read_export(path, state["lines_done"]):
+            row = to_row(record)
+            if row is not None and (row[3] or 0) >= min_popularity:
+                rows.append(row)
+            state["lines_done"] = number
+            if len(rows) >= batch_size:
+                merge_batch(connection, source, rows, state)
+                rows = []
+                logging.info(f"{source}: {number} lines, {state['rows_inserted']} new, {state['rows_updated']} updated "
+                             f"({number / (time.monotonic() - started):.0f} lines/s)")
+        state["completed_at"] = datetime.utcnow()
+        merge_batch(connection, source, rows, state)
+    finally:
+        connection.close()
+    logging.info(f"{source}: {export_name} done, {state['rows_inserted']} new, {state['rows_updated']} updated")
+    # New rows' (original) titles become searchable in all their forms
+    backfill_titles()
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge a provider bulk export into media_items")
+    parser.add_argument("source", choices=sorted(EXPORT_FORMATS))
+    parser.add_argument("path", nargs="?", help="local export file; downloaded for --date when omitted")
+    parser.add_argument("--date", type=date.fromisoformat, help="export date (default: today, or yesterday before 08:00 UTC)")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--min-popularity", type=float, default=0, help="skip titles less popular than this")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not database.db_available:
+        sys.exit("PostgreSQL is not reachable at POSTGRES_URL")
+    database.create_tables()
+
+    if args.path:
+        ingest(args.source, args.path, os.path.basename(args.path), args.batch_size, args.min_popularity)
+        return
+    now = datetime.utcnow()
+    day = args.date or (now.date() if now.hour >= 8 else now.date() - timedelta(days=1))
+    url = export_url(args.source, day)
+    directory = tempfile.mkdtemp(prefix="media-trakker-ingest-")
+    try:
+        ingest(args.source, download(url, directory), url.rsplit("/", 1)[-1], args.batch_size, args.min_popularity)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+from functools import lru_cache
+
+from sqlalchemy import and_, cast, func, literal_column, or_, select
+from sqlalchemy.dialects.postgresql import JSONB
+
+from database import MediaItem, UserList, search_document
+from titles import normalize_title
+
+# Searching, filtering and sorting within a user's library.
+#
+# GET /api/user-list/query answers with one page of the matching list entries
+# and their total, instead of the whole library. Text search matches the
+# start of the words of a media item's title and overview, e.g. "kag lov"
+# finds "Kaguya-sama: Love Is War". Genres, platforms and authors match list
+# entries having any of the given values; the other filters take ranges or
+# exact values. With PostgreSQL the query runs against the user_lists
+# composite indexes, and for the text and array filters against the GIN
+# indexes on media_items (database.py); without it the in-memory entries are
+# filtered the same way.
+SORT_FIELDS = ["updated", "added", "title", "year", "rating", "status", "media_type", "genre", "platform", "author", "relevance"]
+# Sorts that start with the highest value unless an order is given
+DESCENDING_SORTS = {"updated", "added", "year", "rating", "relevance"}
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def query_words(text):
+    return normalize_title(text).split()
+
+
+def sort_descending(sort: str, order):
+    return order == "desc" if order else sort in DESCENDING_SORTS
+
+
+def any_element(column, values):
+    """The JSON array column holds at least one of `values` (ix_media_items_* GIN indexes)"""
+    return or_(*(cast(column, JSONB).contains([value]) for value in values))
+
+
+def text_query(words):
+    # normalize_title leaves no tsquery operators in the words
+    return func.to_tsquery(literal_column("'simple'"), " & ".join(f"{word}:*" for word in words))
+
+
+def media_year(media_item):
+    return func.coalesce(media_item.year, media_item.release_year)
+
+
+def filter_conditions(q=None, genres=None, platforms=None, authors=None, year_min=None, year_max=None,
+                      rating_min=None, rating_max=None, statuses=None, media_types=None):
+    conditions = []
+    words = query_words(q or "")
+    if words:
+        conditions.append(search_document(MediaItem.title, MediaItem.overview).op("@@")(text_query(words)))
+    if genres:
+        conditions.append(any_element(MediaItem.genres, genres))
+    if platforms:
+        conditions.append(any_element(MediaItem.platforms, platforms))
+    if authors:
+        conditions.append(any_element(MediaItem.authors, authors))
+    if year_min is not None:
+        conditions.append(media_year(MediaItem) >= year_min)
+    if year_max is not None:
+        conditions.append(media_year(MediaItem) <= year_max)
+    if rating_min is not None:
+        conditions.append(UserList.rating >= rating_min)
+    if rating_max is not None:
+        conditions.append(UserList.rating <= rating_max)
+    if statuses:
+        conditions.append(UserList.status.in_(statuses))
+    if media_types:
+        conditions.append(UserList.media_type.in_(media_types))
+    return conditions
+
+
+def sort_expression(sort: str, words):
+    if sort == "relevance" and words:
+        return func.ts_rank(search_document(MediaItem.title, MediaItem.overview), text_query(words))
+    return {
+        "added": UserList.created_at,
+        "title": func.lower(MediaItem.title),
+        "year": media_year(MediaItem),
+        "rating": UserList.rating,
+        "status": UserList.status,
+        "media_type": UserList.media_type,
+        "genre": MediaItem.genres[0].as_string(),
+        "platform": MediaItem.platforms[0].as_string(),
+        "author": MediaItem.authors[0].as_string(),
+    }.get(sort, UserList.updated_at)
+
+
+def query_library(db, user_id: str, filters, sort: str = "updated", order=None,
+                  limit: int = DEFAULT_PAGE_SIZE, offset: int = 0):
+    """(total, [(UserList, MediaItem)]) of one page of the user's matching list entries"""
+    matching = (
+        select(UserList, MediaItem)
+        .join(MediaItem, MediaItem.id == UserList.media_id)
+        .where(and_(UserList.user_id == user_id, *filter_conditions(**filters)))
+    )
+    total = db.execute(select(func.count()).select_from(matching.subquery())).scalar()
+    key = sort_expression(sort, query_words(filters.get("q") or ""))
+    key = key.desc() if sort_descending(sort, order) else key.asc()
+    rows = db.execute(matching.order_by(key.nulls_last(), UserList.id).limit(limit).offset(offset)).all()
+    return total, rows
+
+
+@lru_cache(maxsize=65536)
+def memory_document(title, overview):
+    return normalize_title(f"{title or ''} {overview or ''}").split()
+
+
+def memory_entry_matches(item, words, genres=None, platforms=None, authors=None, year_min=None, year_max=None,
+                         rating_min=None, rating_max=None, statuses=None, media_types=None):
+    if words:
+        document = memory_document(item.get('title'), item.get('overview'))
+        if not all(any(word.startswith(query_word) for word in document) for query_word in words):
+            return False
+    for values, field in ((genres, 'genres'), (platforms, 'platforms'), (authors, 'authors')):
+        if values and not set(values) & set(item.get(field) or []):
+            return False
+    year = item.get('year') or item.get('release_year')
+    if (year_min is not None or year_max is not None) and year is None:
+        return False
+    if (year_min is not None and year < year_min) or (year_max is not None and year > year_max):
+        return False
+    rating = item.get('rating')
+    if (rating_min is not None or rating_max is not None) and rating is None:
+        return False
+    if (rating_min is not None and rating < rating_min) or (rating_max is not None and rating > rating_max):
+        return False
+    if statuses and item['status'] not in statuses:
+        return False
+    if media_types and item['media_type'] not in media_types:
+        return False
+    return True
+
+
+def memory_sort_value(item, sort: str, words):
+    if sort == "relevance" and words:
+        # Matches in the title before matches in the overview only
+        title = normalize_title(item.get('title') or '').split()
+        return sum(any(word.startswith(query_word) for word in title) for query_word in words)
+    if sort in ("genre", "platform", "author"):
+        values = item.get(f"{sort}s") or []
+        return values[0] if values else None
+    if sort == "title":
+        return (item.get('title') or '').lower() or None
+    if sort == "year":
+        return item.get('year') or item.get('release_year')
+    field = {"added": "created_at", "rating": "rating", "status": "status", "media_type": "media_type"}.get(sort, "updated_at")
+    return item.get(field)
+
+
+def query_memory_library(items, filters, sort: str = "updated", order=None,
+                         limit: int = DEFAULT_PAGE_SIZE, offset: int = 0):
+    """(total, [item]) of one page of the matching in-memory list entries, ordered like query_library"""
+    words = query_words(filters.get("q") or "")
+    conditions = {name: value for name, value in filters.items() if name != "q"}
+    matching = [item for item in items if memory_entry_matches(item, words, **conditions)]
+    descending = sort_descending(sort, order)
+    # Stable sorts: by id first, then by the key with missing values last either way
+    matching.sort(key=lambda item: item['id'])
+    with_value = [item for item in matching if memory_sort_value(item, sort, words) is not None]
+    without_value = [item for item in matching if memory_sort_value(item, sort, words) is None]
+    with_value.sort(key=lambda item: memory_sort_value(item, sort, words), reverse=descending)
+    ordered = with_value + without_value
+    return len(ordered), ordered[offset:offset + limit]
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import re
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from cache import cache
+from database import MediaItemLocalization, UserPreferences, db_available, memory_storage, session_scope
+from titles import store_titles
+
+# Localized metadata.
+#
+# Searches use the language from the user's preferences. media_items rows
+# always hold the default locale (METADATA_DEFAULT_LOCALE), so they read the
+# same for everyone; the title and overview in any other locale are kept in
+# media_item_localizations next to them and laid over the default when a user
+# of that locale is served. Where a locale has no value (no translation, or
+# a provider without localized data such as Google Books and IGDB) the default
+# shows through.
+#
+# Locales are "language" or "language-REGION" (de, pt-BR). Every language
+# other than the default's has its own search cache entries and TMDB details,
+# so users of different languages do not replace each other's cached results.
+DEFAULT_LOCALE_SETTING = os.environ.get('METADATA_DEFAULT_LOCALE', 'en')
+USER_LOCALE_CACHE_TTL = 300
+LOCALE_PATTERN = re.compile(r"^([A-Za-z]{2,3})(?:[-_]([A-Za-z]{2}))?$")
+
+
+def normalize_locale(value, default: str = None):
+    """"pt_br" -> "pt-BR", "DE" -> "de"; anything unrecognizable is the default locale"""
+    match = LOCALE_PATTERN.match((value or "").strip())
+    if not match:
+        return default if default is not None else DEFAULT_LOCALE
+    language, region = match.groups()
+    return f"{language.lower()}-{region.upper()}" if region else language.lower()
+
+
+DEFAULT_LOCALE = normalize_locale(DEFAULT_LOCALE_SETTING, default="en")
+
+
+def locale_language(locale: str):
+    return locale.split("-", 1)[0]
+
+
+def is_default_locale(locale: str):
+    return locale_language(locale) == locale_language(DEFAULT_LOCALE)
+
+
+def locale_cache_suffix(locale: str):
+    """Cache key suffix separating a locale's entries; empty for the default locale"""
+    return "" if is_default_locale(locale) else f"|{locale}"
+
+
+def read_user_language(user_id: str):
+    if not db_available:
+        return memory_storage['user_preferences'].get('language')
+    with session_scope() as db:
+        return db.execute(select(UserPreferences.language).where(UserPreferences.user_id == user_id)).scalar()
+
+
+async def user_locale(user_id: str = "demo_user"):
+    """The user's preferred locale, cached until their preferences change"""
+    async def load():
+        return await asyncio.to_thread(read_user_language, user_id) or DEFAULT_LOCALE
+
+    language, _ = await cache.get_or_load("preferences", f"{user_id}:language", load, ttl=USER_LOCALE_CACHE_TTL)
+    return normalize_locale(language)
+
+
+async def forget_user_locale(user_id: str = "demo_user"):
+    await cache.delete("preferences", f"{user_id}:language")
+
+
+def tmdb_localized_fields(details):
+    # TMDB answers an empty overview when there is no translation
+    return {"title": details.get("title") or details.get("name"), "overview": details.get("overview") or None}
+
+
+def anilist_localized_fields(item, locale: str):
+    # AniList has english, romaji and native titles and English descriptions only
+    if locale_language(locale) == "ja":
+        return {"title": (item.get("title") or {}).get("native"), "overview": None}
+    return {}
+
+
+def store_localization(db, media_item, locale: str, fields):
+    """Keep a stored media item's fields in `locale`, and its localized title as an alternate title"""
+    if not fields.get("title") and not fields.get("overview"):
+        return
+    values = {"title": fields.get("title"), "overview": fields.get("overview"), "updated_at": datetime.utcnow()}
+    db.execute(pg_insert(MediaItemLocalization).values(
+        media_item_id=media_item.id, locale=locale, **values
+    ).on_conflict_do_update(index_elements=["media_item_id", "locale"], set_=values))
+    store_titles(db, [(media_item.id, media_item.media_type, f"title:{locale}", fields.get("title"))])
+    db.commit()
+
+
+def load_localizations(db, media_item_ids, locale: str):
+    """{media_item_id: fields} in `locale`, or in its language when there is no entry for the region"""
+    if not media_item_ids or is_default_locale(locale):
+        return {}
+    candidates = {locale, locale_language(locale)}
+    rows = db.execute(
+        select(MediaItemLocalization.media_item_id, MediaItemLocalization.locale,
+               MediaItemLocalization.title, MediaItemLocalization.overview)
+        .where(MediaItemLocalization.media_item_id.in_(media_item_ids), MediaItemLocalization.locale.in_(candidates))
+    ).all()
+    localized = {}
+    # The exact locale wins over the bare language
+    for media_item_id, row_locale, title, overview in sorted(rows, key=lambda row: row[1] == locale):
+        localized[media_item_id] = {"title": title, "overview": overview}
+    return localized
+
+
+def localize_results(results, localized):
+    """Lay localized fields over MediaItemResponse results; missing values keep the default locale"""
+    for result in results:
+        for field, value in localized.get(result.id, {}).items():
+            if value:
+                setattr(result, field, value)
+    return results
@@ -0,0 +1,195 @@
+import asyncio
+import bisect
+import threading
+import time
+
+# Minimal Prometheus-compatible metrics registry, rendered by GET /metrics.
+# Metrics are per process; with several workers each one is scraped separately
+# (or the values are summed by the collector).
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in zip(labelnames, values)) + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            self.values[()] = 0
+
+    def key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, value in self.samples():
+            lines.append(f"{name}{format_labels(self.labelnames, key)} {value}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(self.key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        return self.values.get(self.key(labels), 0)
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self.values[()] = self.empty()
+
+    def empty(self):
+        # Per-bucket (non-cumulative) counts, +Inf last, then sum
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = self.empty()
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            items = [(key, list(counts)) for key, counts in self.values.items()]
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", key + (format_bound(bound),), cumulative))
+            samples.append((f"{self.name}_sum", key, counts[-1]))
+            samples.append((f"{self.name}_count", key, cumulative))
+        return samples
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, value in self.samples():
+            labelnames = self.labelnames + ("le",) if name.endswith("_bucket") else self.labelnames
+            lines.append(f"{name}{format_labels(labelnames, key)} {value}")
+        return "\n".join(lines)
+
+
+def format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def register(self, metric: Metric):
+        if metric.name in self.metrics:
+            return self.metrics[metric.name]
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collect):
+        """`collect()` runs before every render, for gauges read from elsewhere (pool size, ...)"""
+        self.collectors.append(collect)
+
+    def render(self):
+        for collect in self.collectors:
+            collect()
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames=()):
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+requests_in_flight = gauge("http_requests_in_flight", "HTTP requests being handled")
+event_loop_lag = histogram(
+    "event_loop_lag_seconds", "Delay of a timer on the event loop past its due time",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+EVENT_LOOP_PROBE_INTERVAL = 0.5
+
+
+class InFlightMiddleware:
+    """ASGI middleware maintaining http_requests_in_flight"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            requests_in_flight.dec()
+
+
+async def monitor_event_loop_lag():
+    """Background task: a callback that is late means the loop was blocked or saturated"""
+    while True:
+        due = time.monotonic() + EVENT_LOOP_PROBE_INTERVAL
+        await asyncio.sleep(EVENT_LOOP_PROBE_INTERVAL)
+        event_loop_lag.observe(max(time.monotonic() - due, 0))
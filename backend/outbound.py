@@ -0,0 +1,192 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from metrics import counter, gauge
+from timing import record, span
+
+# Admission control for outbound provider calls.
+#
+# Every provider has a fixed number of concurrent call slots. Callers beyond
+# that queue by priority class - interactive searches first, then user
+# initiated bulk work, then background jobs - and the last slot of each
+# provider is kept for interactive calls. A call that is not expected to get a
+# slot within its class's wait budget is shed right away with
+# ProviderOverloaded instead of timing out later; one that does wait past the
+# budget is shed then.
+#
+# The class is taken from the current context, so a background job sets it
+# once (outbound_priority(BACKGROUND)) and every provider call below inherits it.
+INTERACTIVE = "interactive"
+BULK = "bulk"
+BACKGROUND = "background"
+PRIORITY_RANK = {INTERACTIVE: 0, BULK: 1, BACKGROUND: 2}
+MAX_QUEUE_WAIT_SECONDS = {
+    INTERACTIVE: float(os.environ.get('PROVIDER_MAX_WAIT_INTERACTIVE', 5)),
+    BULK: float(os.environ.get('PROVIDER_MAX_WAIT_BULK', 60)),
+    BACKGROUND: float(os.environ.get('PROVIDER_MAX_WAIT_BACKGROUND', 600)),
+}
+# Concurrent calls per provider, overridable as PROVIDER_CONCURRENCY="tmdb=8,anilist=2"
+DEFAULT_PROVIDER_CONCURRENCY = {"tmdb": 8, "anilist": 4, "google_books": 4, "igdb": 4}
+RESERVED_INTERACTIVE_SLOTS = 1
+# Starting estimate of a call's duration, refined from observed calls
+INITIAL_SERVICE_TIME_SECONDS = 0.5
+SERVICE_TIME_SMOOTHING = 0.2
+
+current_priority = ContextVar("outbound_priority", default=INTERACTIVE)
+
+queue_depth = gauge("provider_queue_depth", "Provider calls waiting for a slot", ["provider", "priority"])
+in_flight = gauge("provider_calls_in_flight", "Provider calls holding a slot", ["provider"])
+queue_wait_seconds = counter("provider_queue_wait_seconds_total", "Time provider calls spent waiting for a slot", ["provider", "priority"])
+admitted = counter("provider_calls_admitted_total", "Provider calls that got a slot", ["provider", "priority"])
+shed = counter("provider_calls_shed_total", "Provider calls rejected because they would miss their deadline", ["provider", "priority"])
+
+
+class ProviderOverloaded(Exception):
+    """The provider's slots are taken for longer than the caller may wait"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider} is busy, retry in {retry_after:.0f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+def parse_concurrency(value):
+    limits = dict(DEFAULT_PROVIDER_CONCURRENCY)
+    for part in filter(None, (value or "").split(",")):
+        try:
+            name, limit = part.split("=", 1)
+            limits[name.strip()] = max(int(limit), 1)
+        except ValueError:
+            logging.error(f"Ignoring invalid PROVIDER_CONCURRENCY entry: {part}")
+    return limits
+
+
+class ProviderSlots:
+    """Concurrency slots of one provider with a priority-ordered wait queue"""
+
+    def __init__(self, provider: str, concurrency: int):
+        self.provider = provider
+        self.concurrency = concurrency
+        self.active = 0
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.service_time = INITIAL_SERVICE_TIME_SECONDS
+
+    def limit(self, rank: int):
+        if rank == PRIORITY_RANK[INTERACTIVE]:
+            return self.concurrency
+        return max(self.concurrency - RESERVED_INTERACTIVE_SLOTS, 1)
+
+    def waiting_ahead(self, rank: int):
+        return sum(1 for waiter_rank, _, future in self.waiters if waiter_rank <= rank and not future.done())
+
+    def estimated_wait(self, rank: int):
+        return (self.waiting_ahead(rank) + 1) * self.service_time / self.concurrency
+
+    def dispatch(self):
+        while self.waiters:
+            rank, _, future = self.waiters[0]
+            if future.done():
+                # Gave up waiting
+                heapq.heappop(self.waiters)
+                continue
+            if self.active >= self.limit(rank):
+                return
+            heapq.heappop(self.waiters)
+            self.active += 1
+            future.set_result(None)
+
+    def release(self):
+        self.active -= 1
+        self.dispatch()
+
+    async def acquire(self, priority: str):
+        rank = PRIORITY_RANK[priority]
+        if self.active < self.limit(rank) and not self.waiting_ahead(rank):
+            self.active += 1
+            return 0.0
+
+        max_wait = MAX_QUEUE_WAIT_SECONDS[priority]
+        estimate = self.estimated_wait(rank)
+        if estimate > max_wait:
+            shed.inc(provider=self.provider, priority=priority)
+            raise ProviderOverloaded(self.provider, estimate)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (rank, next(self.sequence), future))
+        queue_depth.inc(provider=self.provider, priority=priority)
+        started = time.monotonic()
+        try:
+            await asyncio.wait({future}, timeout=max_wait)
+        except asyncio.CancelledError:
+            self.abandon(future)
+            raise
+        finally:
+            queue_depth.dec(provider=self.provider, priority=priority)
+
+        if not future.done():
+            self.abandon(future)
+            shed.inc(provider=self.provider, priority=priority)
+            raise ProviderOverloaded(self.provider, self.estimated_wait(rank))
+        return time.monotonic() - started
+
+    def abandon(self, future):
+        if future.done() and not future.cancelled():
+            # The slot was handed over just as the caller gave up
+            self.release()
+        else:
+            future.cancel()
+
+    def observe(self, duration: float):
+        self.service_time += SERVICE_TIME_SMOOTHING * (duration - self.service_time)
+
+    @asynccontextmanager
+    async def slot(self, priority: str):
+        waited = await self.acquire(priority)
+        queue_wait_seconds.inc(waited, provider=self.provider, priority=priority)
+        admitted.inc(provider=self.provider, priority=priority)
+        if waited:
+            record(f"{self.provider}-wait", waited)
+        in_flight.inc(provider=self.provider)
+        started = time.monotonic()
+        try:
+            with span(self.provider):
+                yield
+        finally:
+            self.observe(time.monotonic() - started)
+            in_flight.dec(provider=self.provider)
+            self.release()
+
+
+class OutboundScheduler:
+    def __init__(self, concurrency):
+        self.providers = {name: ProviderSlots(name, limit) for name, limit in concurrency.items()}
+
+    def slot(self, provider: str):
+        """Async context manager holding one of the provider's slots for a call"""
+        if provider not in self.providers:
+            self.providers[provider] = ProviderSlots(provider, 1)
+        return self.providers[provider].slot(current_priority.get())
+
+
+scheduler = OutboundScheduler(parse_concurrency(os.environ.get('PROVIDER_CONCURRENCY')))
+
+
+def provider_slot(provider: str):
+    return scheduler.slot(provider)
+
+
+@contextmanager
+def outbound_priority(priority: str):
+    """Run provider calls made inside the block (and tasks started from it) at `priority`"""
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
@@ -0,0 +1,176 @@
+import os
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+
+from starlette.responses import JSONResponse, PlainTextResponse
+
+from admin import is_admin_token
+
+# On-demand profiling for admins (see admin.py).
+#
+# Sampling profiler: a request sent with "X-Profile: 1" and the admin token is
+# handled as usual, but answered with a profile of the event loop thread while
+# it ran instead of its response, in the folded-stack format read by
+# flamegraph.pl, speedscope and similar tools. Other requests running at the
+# same time show up in the profile too; profile on an otherwise idle worker
+# for a clean result.
+#
+# tracemalloc: start tracing, take a baseline snapshot, exercise the code and
+# compare, to see which lines allocate (and keep) memory.
+PROFILE_INTERVAL_SECONDS = float(os.environ.get('PROFILE_INTERVAL', 0.001))
+MAX_STACK_DEPTH = 128
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def fold_stack(frame):
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread"""
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="stack-sampler", daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[fold_stack(frame)] += 1
+                self.samples += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+        return False
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfilingMiddleware:
+    """ASGI middleware answering admin requests that carry X-Profile with their profile"""
+
+    def __init__(self, app):
+        self.app = app
+        self.busy = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if b"x-profile" not in headers:
+            await self.app(scope, receive, send)
+            return
+        token = headers.get(b"x-admin-token")
+        if not is_admin_token(token.decode("latin-1") if token else None):
+            await JSONResponse({"detail": "Profiling requires the admin token"}, status_code=403)(scope, receive, send)
+            return
+        if self.busy:
+            # Two samplers would each see both requests
+            await JSONResponse({"detail": "Another request is being profiled"}, status_code=409)(scope, receive, send)
+            return
+
+        status = 500
+        async def discard_response(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        self.busy = True
+        try:
+            with StackSampler(threading.get_ident()) as sampler:
+                await self.app(scope, receive, discard_response)
+        finally:
+            self.busy = False
+        response = PlainTextResponse(sampler.folded(), headers={
+            "X-Profile-Status": str(status),
+            "X-Profile-Samples": str(sampler.samples),
+            "X-Profile-Interval": str(sampler.interval)
+        })
+        await response(scope, receive, send)
+
+
+def start_tracing(frames: int):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return {"tracing": True, "frames": tracemalloc.get_traceback_limit()}
+
+
+def stop_tracing():
+    tracemalloc.stop()
+    memory_snapshots.clear()
+    return {"tracing": False}
+
+
+# Baseline snapshot for diffs, replaced by every /snapshot call
+memory_snapshots = {}
+
+
+def app_filters(app_only: bool):
+    if not app_only:
+        return []
+    # Keep traces with any frame in the backend, so library allocations made on
+    # behalf of e.g. search_sources are included
+    return [tracemalloc.Filter(True, os.path.join(BACKEND_DIR, "*"), all_frames=True)]
+
+
+def describe_stat(stat, diff: bool):
+    # Frames are ordered oldest first; report the allocating line first
+    frames = [f"{frame.filename}:{frame.lineno}" for frame in reversed(stat.traceback)]
+    entry = {
+        "location": frames[0] if frames else None,
+        "size_kb": round(stat.size / 1024, 1),
+        "count": stat.count,
+        "traceback": frames
+    }
+    if diff:
+        entry["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+        entry["count_diff"] = stat.count_diff
+    return entry
+
+
+def take_snapshot(limit: int, key_type: str, app_only: bool):
+    """Store a new baseline and return its top allocation sites"""
+    snapshot = tracemalloc.take_snapshot().filter_traces(app_filters(app_only))
+    memory_snapshots["baseline"] = snapshot
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "traced_kb": round(current / 1024, 1),
+        "peak_kb": round(peak / 1024, 1),
+        "top": [describe_stat(stat, diff=False) for stat in snapshot.statistics(key_type)[:limit]]
+    }
+
+
+def diff_snapshot(limit: int, key_type: str, app_only: bool):
+    """Compare a new snapshot with the baseline; largest growth first"""
+    snapshot = tracemalloc.take_snapshot().filter_traces(app_filters(app_only))
+    stats = snapshot.compare_to(memory_snapshots["baseline"], key_type)
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "traced_kb": round(current / 1024, 1),
+        "peak_kb": round(peak / 1024, 1),
+        "top": [describe_stat(stat, diff=True) for stat in stats[:limit]]
+    }
+
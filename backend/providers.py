@@ -0,0 +1,357 @@
+import logging
+import os
+import re
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+
+from cache import cache
+from metrics import histogram
+from outbound import provider_slot
+from replay import PROVIDER_REPLAY_MODE, ReplayTransport
+
+# Outbound calls to the metadata providers (TMDB, AniList, Google Books, IGDB)
+# and the mapping of their payloads to media_items columns. Used by the search
+# endpoint and by the background jobs that fill the cache ahead of requests.
+# Every call goes through provider_client(), which holds one of the provider's
+# slots (outbound.py) and records the call's latency.
+load_dotenv(Path(__file__).parent / '.env')
+
+# External API Configuration
+TMDB_API_KEY = os.environ.get('TMDB_API_KEY')
+TMDB_BASE_URL = "https://api.themoviedb.org/3"
+TMDB_IMAGE_BASE_URL = "https://image.tmdb.org/t/p/w500"
+ANILIST_API_URL = "https://graphql.anilist.co"
+GOOGLE_BOOKS_API_URL = "https://www.googleapis.com/books/v1/volumes"
+IGDB_CLIENT_ID = os.environ.get('IGDB_CLIENT_ID')
+IGDB_CLIENT_SECRET = os.environ.get('IGDB_CLIENT_SECRET')
+IGDB_BASE_URL = "https://api.igdb.com/v4"
+TWITCH_AUTH_URL = "https://id.twitch.tv/oauth2/token"
+# Token endpoints per provider, kept out of recordings (see replay.py)
+CREDENTIAL_URLS = {"igdb": {TWITCH_AUTH_URL}}
+TMDB_DETAILS_CACHE_TTL = int(os.environ.get('TMDB_DETAILS_CACHE_TTL', 86400))
+PROVIDER_ERROR_CACHE_TTL = 60
+
+provider_latency = histogram(
+    "provider_request_duration_seconds", "Latency of provider HTTP requests until the response headers",
+    ["provider", "endpoint", "status"]
+)
+# Numeric path segments after the first (/3/movie/603 -> /3/movie/{id})
+NUMERIC_PATH_SEGMENT = re.compile(r"(?<=[^/])/\d+(?=/|$)")
+
+
+class MeteredTransport(httpx.AsyncBaseTransport):
+    """Observes provider_request_duration_seconds around another transport"""
+
+    def __init__(self, provider: str, transport: httpx.AsyncBaseTransport):
+        self.provider = provider
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        # Ids in paths would make a series per title
+        endpoint = NUMERIC_PATH_SEGMENT.sub("/{id}", request.url.path)
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await self.transport.handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            provider_latency.observe(time.perf_counter() - started, provider=self.provider, endpoint=endpoint, status=status)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def network_transport(provider: str):
+    transport = httpx.AsyncHTTPTransport()
+    if PROVIDER_REPLAY_MODE:
+        # Recorded responses in front of the network, see replay.py
+        return ReplayTransport(provider, transport, credential_urls=CREDENTIAL_URLS.get(provider, ()))
+    return transport
+
+
+# Builds the transport each provider call is sent through; replaced with local
+# stand-ins by the benchmarks (benchmarks/mock_providers.py)
+transport_factory = network_transport
+
+
+def set_transport_factory(factory):
+    """Send provider calls through `factory(provider)`; None restores the network"""
+    global transport_factory
+    transport_factory = factory or network_transport
+
+
+@asynccontextmanager
+async def provider_client(provider: str):
+    """HTTP client for one call to `provider`, holding one of its slots"""
+    async with provider_slot(provider):
+        async with httpx.AsyncClient(transport=MeteredTransport(provider, transport_factory(provider))) as client:
+            yield client
+
+# External API Functions
+def tmdb_params(language: str = None, **params):
+    if language:
+        params["language"] = language
+    return {"api_key": TMDB_API_KEY, **params}
+
+async def search_tmdb_movies(query: str, page: int = 1, language: str = None):
+    async with provider_client("tmdb") as client:
+        response = await client.get(
+            f"{TMDB_BASE_URL}/search/movie",
+            params=tmdb_params(language, query=query, page=page)
+        )
+        return response.json()
+
+async def search_tmdb_tv_shows(query: str, page: int = 1, language: str = None):
+    async with provider_client("tmdb") as client:
+        response = await client.get(
+            f"{TMDB_BASE_URL}/search/tv",
+            params=tmdb_params(language, query=query, page=page)
+        )
+        return response.json()
+
+def tmdb_details_ttl(details):
+    # TMDB error payloads have no id; keep those only briefly
+    return TMDB_DETAILS_CACHE_TTL if "id" in details else PROVIDER_ERROR_CACHE_TTL
+
+async def get_movie_details(tmdb_id: int, language: str = None):
+    """Details in the provider's default language, or in `language` (e.g. "de", "pt-BR")"""
+    async def fetch():
+        async with provider_client("tmdb") as client:
+            response = await client.get(
+                f"{TMDB_BASE_URL}/movie/{tmdb_id}",
+                params=tmdb_params(language)
+            )
+            return response.json()
+    
+    key = f"{tmdb_id}:{language}" if language else str(tmdb_id)
+    details, _ = await cache.get_or_load("tmdb_movie", key, fetch, ttl=tmdb_details_ttl)
+    return details
+
+async def get_tv_details(tmdb_id: int, language: str = None):
+    """Details in the provider's default language, or in `language` (e.g. "de", "pt-BR")"""
+    async def fetch():
+        async with provider_client("tmdb") as client:
+            response = await client.get(
+                f"{TMDB_BASE_URL}/tv/{tmdb_id}",
+                params=tmdb_params(language)
+            )
+            return response.json()
+    
+    key = f"{tmdb_id}:{language}" if language else str(tmdb_id)
+    details, _ = await cache.get_or_load("tmdb_tv", key, fetch, ttl=tmdb_details_ttl)
+    return details
+
+async def search_anilist(query: str, media_type: str, page: int = 1):
+    graphql_query = """
+    query ($search: String, $type: MediaType, $page: Int, $perPage: Int) {
+        Page(page: $page, perPage: $perPage) {
+            media(search: $search, type: $type) {
+                id
+                title { romaji english native }
+                synonyms
+                format status episodes chapters volumes genres averageScore
+                startDate { year month day }
+                endDate { year month day }
+                coverImage { large medium }
+                bannerImage description
+                studios { nodes { name } }
+            }
+        }
+    }
+    """
+    
+    variables = {
+        "search": query,
+        "type": media_type.upper(),
+        "page": page,
+        "perPage": 10
+    }
+    
+    async with provider_client("anilist") as client:
+        response = await client.post(
+            ANILIST_API_URL,
+            json={"query": graphql_query, "variables": variables}
+        )
+        return response.json()
+
+async def search_google_books(query: str, page: int = 1):
+    start_index = (page - 1) * 10
+    async with provider_client("google_books") as client:
+        try:
+            response = await client.get(
+                GOOGLE_BOOKS_API_URL,
+                params={"q": query, "startIndex": start_index, "maxResults": 10}
+            )
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return {"items": []}
+        except Exception as e:
+            logging.error(f"Google Books API error: {str(e)}")
+            return {"items": []}
+
+# IGDB API Functions
+async def get_igdb_access_token():
+    """Get access token for IGDB API, shared by all workers until shortly before it expires"""
+    async def fetch():
+        async with provider_client("igdb") as client:
+            try:
+                response = await client.post(
+                    TWITCH_AUTH_URL,
+                    params={
+                        "client_id": IGDB_CLIENT_ID,
+                        "client_secret": IGDB_CLIENT_SECRET,
+                        "grant_type": "client_credentials"
+                    }
+                )
+                if response.status_code == 200:
+                    return response.json()
+                else:
+                    logging.error(f"IGDB Auth error: {response.status_code}")
+                    return None
+            except Exception as e:
+                logging.error(f"IGDB Auth error: {str(e)}")
+                return None
+    
+    token, _ = await cache.get_or_load(
+        "igdb", "access_token", fetch,
+        ttl=lambda token: max(token.get("expires_in", 3600) - 300, 60)
+    )
+    return token["access_token"] if token else None
+
+async def search_igdb_games(query: str, page: int = 1):
+    """Search games using IGDB API"""
+    token = await get_igdb_access_token()
+    if not token:
+        return []
+    
+    offset = (page - 1) * 10
+    
+    # IGDB query to get games with all relevant fields
+    igdb_query = f"""
+    fields name, summary, cover.url, cover.image_id, platforms.name, 
+           involved_companies.company.name, involved_companies.developer,
+           involved_companies.publisher, first_release_date, rating, 
+           game_modes.name, genres.name, release_dates.human, 
+           release_dates.y, screenshots.image_id;
+    search "{query}";
+    limit 10;
+    offset {offset};
+    """
+    
+    headers = {
+        "Client-ID": IGDB_CLIENT_ID,
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "text/plain"
+    }
+    
+    async with provider_client("igdb") as client:
+        try:
+            response = await client.post(
+                f"{IGDB_BASE_URL}/games",
+                headers=headers,
+                content=igdb_query
+            )
+            if response.status_code == 200:
+                return response.json()
+            else:
+                logging.error(f"IGDB Games API error: {response.status_code}")
+                return []
+        except Exception as e:
+            logging.error(f"IGDB Games API error: {str(e)}")
+            return []
+
+# Feeds used to warm the cache ahead of searches
+ANILIST_FEED_QUERY = """
+query ($type: MediaType, $sort: [MediaSort], $season: MediaSeason, $seasonYear: Int, $perPage: Int) {
+    Page(page: 1, perPage: $perPage) {
+        media(type: $type, sort: $sort, season: $season, seasonYear: $seasonYear, isAdult: false) {
+            id
+            title { romaji english native }
+            synonyms
+            format status episodes chapters volumes genres averageScore
+            startDate { year month day }
+            endDate { year month day }
+            coverImage { large medium }
+            bannerImage description
+            studios { nodes { name } }
+        }
+    }
+}
+"""
+
+async def get_tmdb_feed(path: str, page: int = 1):
+    """One page of a TMDB list endpoint, e.g. "trending/movie/week" or "tv/popular" """
+    async with provider_client("tmdb") as client:
+        response = await client.get(
+            f"{TMDB_BASE_URL}/{path}",
+            params={"api_key": TMDB_API_KEY, "page": page}
+        )
+        response.raise_for_status()
+        return response.json().get("results", [])
+
+async def get_anilist_feed(media_type: str, sort: str, season: str = None, season_year: int = None, per_page: int = 50):
+    """AniList media sorted by `sort` (TRENDING_DESC, POPULARITY_DESC), optionally for one season"""
+    variables = {"type": media_type.upper(), "sort": [sort], "perPage": per_page}
+    if season:
+        variables.update(season=season, seasonYear=season_year)
+    async with provider_client("anilist") as client:
+        response = await client.post(
+            ANILIST_API_URL,
+            json={"query": ANILIST_FEED_QUERY, "variables": variables}
+        )
+        response.raise_for_status()
+        return response.json().get("data", {}).get("Page", {}).get("media", [])
+
+# Payload to media_items column mapping
+def media_data_from_tmdb_movie(movie_data):
+    return {
+        "external_id": str(movie_data["id"]),
+        "title": movie_data["title"],
+        "media_type": "movie",
+        "year": int(movie_data["release_date"][:4]) if movie_data.get("release_date") else None,
+        "genres": [genre["name"] for genre in movie_data.get("genres", [])],
+        "poster_path": f"{TMDB_IMAGE_BASE_URL}{movie_data['poster_path']}" if movie_data.get("poster_path") else None,
+        "overview": movie_data.get("overview"),
+        "backdrop_path": f"{TMDB_IMAGE_BASE_URL}{movie_data['backdrop_path']}" if movie_data.get("backdrop_path") else None,
+        "vote_average": movie_data.get("vote_average"),
+        "release_date": movie_data.get("release_date")
+    }
+
+def media_data_from_tmdb_tv(tv_data):
+    return {
+        "external_id": str(tv_data["id"]),
+        "title": tv_data.get("name", tv_data.get("original_name")),
+        "media_type": "tv",
+        "year": int(tv_data["first_air_date"][:4]) if tv_data.get("first_air_date") else None,
+        "genres": [genre["name"] for genre in tv_data.get("genres", [])],
+        "poster_path": f"{TMDB_IMAGE_BASE_URL}{tv_data['poster_path']}" if tv_data.get("poster_path") else None,
+        "overview": tv_data.get("overview"),
+        "backdrop_path": f"{TMDB_IMAGE_BASE_URL}{tv_data['backdrop_path']}" if tv_data.get("backdrop_path") else None,
+        "vote_average": tv_data.get("vote_average"),
+        "release_date": tv_data.get("first_air_date"),
+        "seasons": tv_data.get("number_of_seasons"),
+        "episodes": tv_data.get("number_of_episodes")
+    }
+
+def media_data_from_anilist(item_data, media_type: str):
+    title = item_data["title"]["english"] or item_data["title"]["romaji"] or item_data["title"]["native"]
+    start_date = item_data.get("startDate")
+    return {
+        "external_id": str(item_data["id"]),
+        "title": title,
+        "media_type": media_type.lower(),
+        "year": start_date.get("year") if start_date else None,
+        "genres": item_data.get("genres", []),
+        "poster_path": (item_data.get("coverImage") or {}).get("large"),
+        "overview": item_data.get("description"),
+        "vote_average": item_data.get("averageScore", 0) / 10 if item_data.get("averageScore") else None,
+        "episodes": item_data.get("episodes"),
+        "chapters": item_data.get("chapters"),
+        "volumes": item_data.get("volumes")
+    }
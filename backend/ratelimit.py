@@ -0,0 +1,190 @@
+import logging
+import math
+import os
+from time import monotonic
+
+from starlette.responses import JSONResponse
+
+from cache import RedisCache, cache
+from metrics import counter
+
+# Per-client token buckets in front of the API.
+#
+# Requests are grouped into route classes with their own rate and burst:
+# searches (each miss costs provider quota), other reads, and writes. A client
+# is its remote address, or the first X-Forwarded-For hop with
+# RATE_LIMIT_TRUST_FORWARDED_FOR=1 behind a proxy. Limits are configured as
+#   RATE_LIMITS="search=2/s:20,read=20/s:100,write=10/s:50"
+# (rate per s/m/h, then burst). Buckets live in this process by default; with
+# RATE_LIMIT_BACKEND=shared and a Redis CACHE_URL every worker draws from the
+# same buckets. RATE_LIMITING=0 turns limiting off.
+RATE_LIMITING_ENABLED = os.environ.get('RATE_LIMITING', '1') != '0'
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'local')
+TRUST_FORWARDED_FOR = os.environ.get('RATE_LIMIT_TRUST_FORWARDED_FOR') == '1'
+DEFAULT_RATE_LIMITS = "search=2/s:20,read=20/s:100,write=10/s:50"
+MAX_LOCAL_BUCKETS = 100000
+PERIOD_SECONDS = {"s": 1, "m": 60, "h": 3600}
+UNLIMITED_PATHS = ("/api/events",)
+MAX_ROUTE_CACHE_ENTRIES = 10000
+
+rate_limited = counter("rate_limited_requests_total", "Requests rejected with 429", ["route_class"])
+
+# Atomic refill-and-take on a Redis hash; returns the wait in seconds (0 when allowed)
+TAKE_TOKEN_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+def parse_rate_limits(value):
+    """"search=2/s:20,read=20/m:100" -> {"search": (2.0, 20), "read": (0.33, 100)}"""
+    limits = {}
+    for part in filter(None, value.split(",")):
+        try:
+            name, spec = part.split("=", 1)
+            rate, burst = spec.split(":", 1)
+            amount, period = rate.split("/", 1)
+            limits[name.strip()] = (float(amount) / PERIOD_SECONDS[period.strip()], int(burst))
+        except (ValueError, KeyError):
+            logging.error(f"Ignoring invalid RATE_LIMITS entry: {part}")
+    return limits
+
+
+def route_class(path: str, method: str):
+    if not path.startswith("/api/") or path in UNLIMITED_PATHS:
+        return None
+    if path.startswith("/api/search") or path.startswith("/api/graphql"):
+        return "search"
+    return "read" if method == "GET" or method == "HEAD" else "write"
+
+
+def client_key(scope):
+    if TRUST_FORWARDED_FOR:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").split(",", 1)[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class TokenBuckets:
+    """In-process buckets of one route class, keyed by client"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        # client -> [tokens, last refill]
+        self.buckets = {}
+
+    def take(self, key, now):
+        """Take one token; returns 0 when allowed, else the seconds until one is available"""
+        try:
+            bucket = self.buckets[key]
+        except KeyError:
+            if len(self.buckets) >= MAX_LOCAL_BUCKETS:
+                self.prune(now)
+            self.buckets[key] = [self.burst - 1, now]
+            return 0
+        tokens = bucket[0] + (now - bucket[1]) * self.rate
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1 if tokens <= self.burst else self.burst - 1
+            return 0
+        bucket[0] = tokens
+        return (1 - tokens) / self.rate
+
+    def prune(self, now):
+        # A bucket that has refilled completely is the same as no bucket
+        full_after = self.burst / self.rate
+        self.buckets = {key: bucket for key, bucket in self.buckets.items() if now - bucket[1] < full_after}
+
+
+class SharedTokenBuckets:
+    """Buckets of one route class kept in Redis, shared by every worker"""
+
+    def __init__(self, redis, route_class_name: str, rate: float, burst: int):
+        self.redis = redis
+        self.prefix = cache.full_key("ratelimit", route_class_name) + ":"
+        self.rate = rate
+        self.burst = burst
+        self.script = redis.register_script(TAKE_TOKEN_SCRIPT)
+
+    async def take(self, key):
+        try:
+            return float(await self.script(keys=[self.prefix + key], args=[self.rate, self.burst]))
+        except Exception as e:
+            # Fail open: an unreachable cache must not take the API down
+            logging.error(f"Shared rate limit check failed: {str(e)}")
+            return 0
+
+
+def create_buckets(limits):
+    if RATE_LIMIT_BACKEND == "shared":
+        if isinstance(cache.shared, RedisCache):
+            return {name: SharedTokenBuckets(cache.shared.redis, name, rate, burst) for name, (rate, burst) in limits.items()}
+        logging.error("RATE_LIMIT_BACKEND=shared needs a redis:// CACHE_URL - using in-process buckets")
+    return {name: TokenBuckets(rate, burst) for name, (rate, burst) in limits.items()}
+
+
+class RateLimitMiddleware:
+    """ASGI middleware answering 429 with Retry-After once a client's bucket is empty"""
+
+    def __init__(self, app, limits=None):
+        self.app = app
+        self.buckets = create_buckets(limits if limits is not None else parse_rate_limits(
+            os.environ.get('RATE_LIMITS', DEFAULT_RATE_LIMITS)
+        ))
+        self.local = all(isinstance(buckets, TokenBuckets) for buckets in self.buckets.values())
+        # path -> (buckets for reads, buckets for writes); keeps classification off the hot path
+        self.routes = {}
+
+    def route_buckets(self, path: str):
+        if len(self.routes) >= MAX_ROUTE_CACHE_ENTRIES:
+            self.routes.clear()
+        entry = self.routes[path] = (
+            self.buckets.get(route_class(path, "GET")),
+            self.buckets.get(route_class(path, "POST"))
+        )
+        return entry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            path = scope["path"]
+            entry = self.routes.get(path) or self.route_buckets(path)
+            method = scope["method"]
+            buckets = entry[0] if method == "GET" or method == "HEAD" else entry[1]
+            if buckets is not None:
+                client = scope.get("client")
+                key = client[0] if client and not TRUST_FORWARDED_FOR else client_key(scope)
+                if self.local:
+                    wait = buckets.take(key, monotonic())
+                else:
+                    wait = await buckets.take(key)
+                if wait:
+                    await self.reject(wait, scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
+
+    async def reject(self, wait, scope, receive, send):
+        rate_limited.inc(route_class=route_class(scope["path"], scope["method"]))
+        response = JSONResponse(
+            {"detail": "Too many requests"},
+            status_code=429,
+            headers={"Retry-After": str(math.ceil(wait))}
+        )
+        await response(scope, receive, send)
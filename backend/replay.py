@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import httpx
+
+from metrics import counter
+
+# Recorded provider responses.
+#
+# PROVIDER_REPLAY selects what happens to provider calls:
+#   record       call the provider and store every successful response
+#   replay       answer from the store, calling (and recording) the provider on a miss
+#   replay-only  answer from the store only; a miss is a 503 and nothing touches the network
+#   fallback     call the provider and record, but answer from the store when the
+#                provider fails (connection error, 429 or 5xx)
+# Unset (the default) leaves provider calls alone.
+#
+# Responses are kept compressed in one SQLite file (PROVIDER_REPLAY_PATH),
+# keyed by a hash of the normalized request: method, URL with sorted query
+# parameters and credentials removed, and the body with JSON keys sorted and
+# whitespace collapsed, so e.g. re-indenting a GraphQL query does not change the
+# key. PROVIDER_REPLAY_LATENCY adds a delay to replayed responses: a number of
+# seconds, or "recorded" for the duration of the original call.
+#
+# Token requests (a provider's credential_urls) are never recorded: they always
+# go to the network, except in replay-only mode, where they are answered with a
+# placeholder token since the recorded responses do not depend on it.
+PROVIDER_REPLAY_MODE = os.environ.get('PROVIDER_REPLAY', '').lower() or None
+PROVIDER_REPLAY_PATH = os.environ.get('PROVIDER_REPLAY_PATH', str(Path(__file__).parent / 'provider_recordings.sqlite3'))
+PROVIDER_REPLAY_LATENCY = os.environ.get('PROVIDER_REPLAY_LATENCY', '0')
+REPLAY_MODES = {"record", "replay", "replay-only", "fallback"}
+# Query parameters that identify us rather than the request
+CREDENTIAL_PARAMS = {"api_key", "client_id", "client_secret", "key"}
+KEPT_HEADERS = ("content-type",)
+PLACEHOLDER_TOKEN = {"access_token": "replay", "expires_in": 3600, "token_type": "bearer"}
+
+replay_calls = counter("provider_replay_total", "Provider calls by record/replay outcome", ["provider", "outcome"])
+
+if PROVIDER_REPLAY_MODE and PROVIDER_REPLAY_MODE not in REPLAY_MODES:
+    logging.error(f"Ignoring unknown PROVIDER_REPLAY mode: {PROVIDER_REPLAY_MODE}")
+    PROVIDER_REPLAY_MODE = None
+
+
+def normalize_body(request: httpx.Request):
+    content = request.content
+    if not content:
+        return ""
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return " ".join(content.decode("utf-8", "replace").split())
+    if isinstance(data, dict) and isinstance(data.get("query"), str):
+        data = {**data, "query": " ".join(data["query"].split())}
+    return json.dumps(data, sort_keys=True, separators=(",", ":"))
+
+
+def request_key(request: httpx.Request):
+    url = request.url
+    params = sorted((name, value) for name, value in url.params.multi_items() if name not in CREDENTIAL_PARAMS)
+    normalized = "\n".join([request.method, f"{url.host}{url.path}", json.dumps(params), normalize_body(request)])
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+class RecordingStore:
+    """Recorded responses in a SQLite file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS recordings (
+                    key TEXT PRIMARY KEY,
+                    provider TEXT NOT NULL,
+                    method TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    status INTEGER NOT NULL,
+                    headers TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    duration REAL NOT NULL,
+                    recorded_at REAL NOT NULL
+                )
+            """)
+        return self.connection
+
+    def get(self, key: str):
+        with self.lock:
+            row = self.connect().execute(
+                "SELECT status, headers, body, duration FROM recordings WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, headers, body, duration = row
+        return status, json.loads(headers), zlib.decompress(body), duration
+
+    def put(self, key: str, provider: str, request: httpx.Request, response: httpx.Response, duration: float):
+        # The URL is kept for inspection only, without credentials
+        url = request.url.copy_with(params=[
+            (name, value) for name, value in request.url.params.multi_items() if name not in CREDENTIAL_PARAMS
+        ])
+        headers = {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers}
+        with self.lock:
+            connection = self.connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO recordings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, request.method, str(url), response.status_code, json.dumps(headers),
+                 zlib.compress(response.content), duration, time.time())
+            )
+            connection.commit()
+
+
+recording_store = RecordingStore(PROVIDER_REPLAY_PATH)
+
+
+def replay_delay(recorded_duration: float):
+    if PROVIDER_REPLAY_LATENCY == "recorded":
+        return recorded_duration
+    return float(PROVIDER_REPLAY_LATENCY)
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Records and replays the responses of another transport (see PROVIDER_REPLAY)"""
+
+    def __init__(self, provider: str, transport: httpx.AsyncBaseTransport,
+                 mode: str = PROVIDER_REPLAY_MODE, store: RecordingStore = recording_store,
+                 credential_urls=()):
+        self.provider = provider
+        self.transport = transport
+        self.mode = mode
+        self.store = store
+        self.credential_urls = set(credential_urls)
+
+    async def handle_async_request(self, request):
+        if str(request.url.copy_with(query=None)) in self.credential_urls:
+            if self.mode == "replay-only":
+                return httpx.Response(200, json=PLACEHOLDER_TOKEN, request=request)
+            return await self.transport.handle_async_request(request)
+
+        key = request_key(request)
+        if self.mode in ("replay", "replay-only"):
+            response = await self.replay(key, request)
+            if response is not None:
+                return response
+            replay_calls.inc(provider=self.provider, outcome="missed")
+            if self.mode == "replay-only":
+                return httpx.Response(503, json={"status_message": "No recorded response"}, request=request)
+
+        started = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+            await response.aread()
+        except httpx.TransportError:
+            if self.mode == "fallback":
+                fallback = await self.replay(key, request, outcome="fallback")
+                if fallback is not None:
+                    return fallback
+            raise
+        duration = time.perf_counter() - started
+
+        if response.status_code < 300:
+            await asyncio.to_thread(self.store.put, key, self.provider, request, response, duration)
+            replay_calls.inc(provider=self.provider, outcome="recorded")
+        elif self.mode == "fallback" and (response.status_code == 429 or response.status_code >= 500):
+            fallback = await self.replay(key, request, outcome="fallback")
+            if fallback is not None:
+                return fallback
+        return response
+
+    async def replay(self, key: str, request: httpx.Request, outcome: str = "replayed"):
+        recording = await asyncio.to_thread(self.store.get, key)
+        if recording is None:
+            return None
+        status, headers, body, duration = recording
+        delay = replay_delay(duration) if outcome == "replayed" else 0
+        if delay:
+            await asyncio.sleep(delay)
+        replay_calls.inc(provider=self.provider, outcome=outcome)
+        return httpx.Response(status, headers={**headers, "x-replayed": "1"}, content=body, request=request)
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, text, update
+
+from database import MediaItem, db_available, session_scope
+from metrics import counter, gauge
+from suggest import suggester
+
+# Retention for the media_items cache table.
+#
+# Searches add rows to media_items that nobody may ever look at again. Rows
+# referenced by a user list and the catalog imported by ingest.py are always
+# kept; other rows are evicted once they have not been accessed for
+# MEDIA_ITEM_MAX_AGE_DAYS, and beyond the MEDIA_ITEM_MAX_UNREFERENCED most
+# recently accessed ones.
+#
+# Accesses are recorded in memory and written in one UPDATE per flush
+# interval, not one write per read. Evicted rows are dropped from this
+# process's suggestion index; cached search responses may still list them
+# and are filtered when served (existing_media_item_ids).
+MEDIA_ITEM_MAX_AGE_DAYS = int(os.environ.get('MEDIA_ITEM_MAX_AGE_DAYS', 30))
+MEDIA_ITEM_MAX_UNREFERENCED = int(os.environ.get('MEDIA_ITEM_MAX_UNREFERENCED', 200000))
+COMPACTION_INTERVAL_SECONDS = int(os.environ.get('MEDIA_ITEM_COMPACTION_INTERVAL', 3600))
+ACCESS_FLUSH_INTERVAL_SECONDS = 60
+ACCESS_FLUSH_CHUNK_SIZE = 5000
+EVICTION_BATCH_SIZE = 1000
+# Capacity eviction leaves rows accessed more recently than this alone: their
+# access may still be waiting in another worker's AccessTracker, and a user may
+# be adding a search result to their list
+CAPACITY_MIN_IDLE_SECONDS = ACCESS_FLUSH_INTERVAL_SECONDS + 3600
+
+media_items_rows = gauge("media_items_rows", "Estimated number of rows in media_items")
+media_items_table_bytes = gauge("media_items_table_bytes", "Size of media_items including indexes and TOAST")
+media_items_evicted = counter("media_items_evicted_total", "Rows evicted from media_items", ["reason"])
+media_items_access_writes = counter("media_items_access_writes_total", "Rows whose last_accessed_at was written")
+compaction_runs = counter("media_items_compaction_runs_total", "Completed media_items compaction runs")
+
+# Evicting a row that a concurrent request is adding to a list would leave a
+# dangling reference; the age cutoff (days, or at least
+# CAPACITY_MIN_IDLE_SECONDS for capacity eviction) and the access tracking on
+# every search response make that practically impossible, since rows being
+# added were just returned by a search.
+EVICT_STALE_SQL = text("""
+DELETE FROM media_items WHERE id IN (
+    SELECT m.id FROM media_items m
+    WHERE COALESCE(m.last_accessed_at, m.created_at) < :cutoff
+      AND m.catalog_source IS NULL
+      AND NOT EXISTS (SELECT 1 FROM user_lists u WHERE u.media_id = m.id)
+    LIMIT :batch_size
+)
+RETURNING id
+""")
+
+# Last access of the least recently accessed row within capacity; the rows
+# accessed before it are evicted like stale ones, so the unreferenced rows
+# are sorted once per run rather than once per batch
+CAPACITY_CUTOFF_SQL = text("""
+SELECT COALESCE(m.last_accessed_at, m.created_at) FROM media_items m
+WHERE m.catalog_source IS NULL
+  AND NOT EXISTS (SELECT 1 FROM user_lists u WHERE u.media_id = m.id)
+ORDER BY 1 DESC
+OFFSET :offset
+LIMIT 1
+""")
+
+TABLE_SIZE_SQL = text("""
+SELECT c.reltuples::bigint AS row_estimate, pg_total_relation_size(c.oid) AS total_bytes
+FROM pg_class c
+WHERE c.oid = 'media_items'::regclass
+""")
+
+
+class AccessTracker:
+    """Collects accessed media item ids between flushes"""
+
+    def __init__(self):
+        self.pending = set()
+
+    def touch(self, media_ids):
+        if db_available:
+            self.pending.update(media_id for media_id in media_ids if media_id)
+
+    def drain(self):
+        pending, self.pending = self.pending, set()
+        return pending
+
+
+access_tracker = AccessTracker()
+
+
+def write_access_times(media_ids):
+    if not media_ids:
+        return
+    now = datetime.utcnow()
+    media_ids = list(media_ids)
+    with session_scope() as db:
+        if db is None:
+            return
+        for start in range(0, len(media_ids), ACCESS_FLUSH_CHUNK_SIZE):
+            chunk = media_ids[start:start + ACCESS_FLUSH_CHUNK_SIZE]
+            db.execute(
+                update(MediaItem).where(MediaItem.id.in_(chunk)).values(last_accessed_at=now),
+                execution_options={"synchronize_session": False}
+            )
+        db.commit()
+    media_items_access_writes.inc(len(media_ids))
+
+
+def evict_in_batches(db, cutoff, reason):
+    """Ids of the evicted rows last accessed before `cutoff`"""
+    evicted = []
+    while True:
+        deleted = db.execute(EVICT_STALE_SQL, {"cutoff": cutoff, "batch_size": EVICTION_BATCH_SIZE}).scalars().all()
+        db.commit()
+        evicted.extend(deleted)
+        media_items_evicted.inc(len(deleted), reason=reason)
+        if len(deleted) < EVICTION_BATCH_SIZE:
+            return evicted
+
+
+def evict_over_capacity(db, keep: int):
+    cutoff = db.execute(CAPACITY_CUTOFF_SQL, {"offset": max(keep - 1, 0)}).scalar()
+    if cutoff is None:
+        return []
+    cutoff = min(cutoff, datetime.utcnow() - timedelta(seconds=CAPACITY_MIN_IDLE_SECONDS))
+    return evict_in_batches(db, cutoff, "capacity")
+
+
+def existing_media_item_ids(media_item_ids):
+    """The given ids whose rows are still stored, e.g. of a cached search response"""
+    with session_scope() as db:
+        if db is None:
+            return set(media_item_ids)
+        return set(db.execute(select(MediaItem.id).where(MediaItem.id.in_(media_item_ids))).scalars())
+
+
+def refresh_table_metrics(db):
+    row = db.execute(TABLE_SIZE_SQL).first()
+    if row:
+        media_items_rows.set(max(row.row_estimate, 0))
+        media_items_table_bytes.set(row.total_bytes)
+
+
+def compact_media_items():
+    """Evict cold unreferenced media_items rows; returns the number of rows removed"""
+    with session_scope() as db:
+        if db is None:
+            return 0
+        started = time.monotonic()
+        cutoff = datetime.utcnow() - timedelta(days=MEDIA_ITEM_MAX_AGE_DAYS)
+        evicted = evict_in_batches(db, cutoff, "age")
+        evicted += evict_over_capacity(db, MEDIA_ITEM_MAX_UNREFERENCED)
+        refresh_table_metrics(db)
+        suggester.forget(evicted)
+        compaction_runs.inc()
+        logging.info(f"media_items compaction evicted {len(evicted)} rows in {time.monotonic() - started:.1f}s")
+        return len(evicted)
+
+
+async def run_retention_jobs():
+    """Background loop: flush access times every minute, compact every interval"""
+    next_compaction = time.monotonic() + COMPACTION_INTERVAL_SECONDS
+    while True:
+        await asyncio.sleep(ACCESS_FLUSH_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(write_access_times, access_tracker.drain())
+            if time.monotonic() >= next_compaction:
+                next_compaction = time.monotonic() + COMPACTION_INTERVAL_SECONDS
+                await asyncio.to_thread(compact_media_items)
+        except Exception as e:
+            logging.error(f"media_items retention job failed: {str(e)}")
@@ -2,11 +2,15 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from fastapi import FastAPI, APIRouter, HTTPException, Query, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Depends, Request, Response
 from dotenv import load_dotenv
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from starlette.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from database import get_db, create_tables, UserList, UserPreferences, MediaItem, db_available
+from sqlalchemy import update, delete, select, func, bindparam, text, or_, null
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from database import engine, get_db, session_scope, create_tables, UserList, UserListTombstone, UserPreferences, MediaItem, MediaItemTitle, UserSyncState, db_available
 import os
 import logging
 from pathlib import Path
@@ -14,31 +18,96 @@ from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime
-import httpx
 import json
+import asyncio
+import hashlib
+import tracemalloc
+from contextlib import nullcontext
+from events import broker, publish_event, format_sse
+from cache import cache
+from providers import (
+    PROVIDER_ERROR_CACHE_TTL, TMDB_IMAGE_BASE_URL, search_tmdb_movies, search_tmdb_tv_shows, get_movie_details, get_tv_details,
+    search_anilist, search_google_books, search_igdb_games,
+    media_data_from_tmdb_movie, media_data_from_tmdb_tv, media_data_from_anilist
+)
+from metrics import REGISTRY as METRICS_REGISTRY, InFlightMiddleware, counter, monitor_event_loop_lag
+from retention import access_tracker, existing_media_item_ids, run_retention_jobs, write_access_times
+from outbound import ProviderOverloaded
+from ratelimit import RATE_LIMITING_ENABLED, RateLimitMiddleware
+from admin import admin_enabled, require_admin
+from profiling import ProfilingMiddleware, memory_snapshots, start_tracing, stop_tracing, take_snapshot, diff_snapshot
+from timing import TimedJSONResponse, TimingMiddleware, install_db_timing, span
+from slowquery import QueryCountMiddleware, install_slow_query_log, slow_query_log
+from library import DEFAULT_PAGE_SIZE as LIBRARY_PAGE_SIZE, MAX_PAGE_SIZE as LIBRARY_MAX_PAGE_SIZE, SORT_FIELDS as LIBRARY_SORT_FIELDS, query_library, query_memory_library
+from locales import (
+    DEFAULT_LOCALE, anilist_localized_fields, forget_user_locale, is_default_locale, load_localizations,
+    localize_results, locale_cache_suffix, normalize_locale, store_localization, tmdb_localized_fields, user_locale
+)
+from suggest import DEFAULT_LIMIT as SUGGEST_DEFAULT_LIMIT, MAX_LIMIT as SUGGEST_MAX_LIMIT, SUGGEST_ENABLED, run_suggest_index, suggester
+from titles import anilist_titles, backfill_titles, normalize_title, store_item_titles, tmdb_titles
+from warming import CACHE_WARMING_ENABLED, query_log, foreground, run_cache_warming
+from strawberry.fastapi import GraphQLRouter
+from graphql_schema import schema as graphql_schema, create_context as create_graphql_context
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # Create PostgreSQL tables
 create_tables()
+install_db_timing(engine)
+install_slow_query_log(engine)
 
 # Create the main app without a prefix
 app = FastAPI()
 
+async def sync_memory_storage(request: Request):
+    """Share the in-memory fallback data between workers through the shared cache tier.
+
+    Only active while PostgreSQL is unavailable and CACHE_URL is set. The worker
+    handling a request adopts the newest snapshot first and publishes its own
+    state again if the request changed it. Requests that may write hold a
+    shared-tier lock from reading the snapshot until publishing it, so two
+    workers never both write on top of the same snapshot.
+    """
+    if db_available or cache.shared is None:
+        yield
+        return
+    
+    from database import memory_storage
+    key = cache.full_key("fallback", "memory_storage")
+    
+    def revision(state):
+        return state['library_version'] + state['preferences_version']
+    
+    writes = request.method not in ("GET", "HEAD", "OPTIONS")
+    async with cache.lock("fallback:memory_storage") if writes else nullcontext():
+        try:
+            snapshot = await cache.shared.get(key)
+            if snapshot and revision(snapshot) > revision(memory_storage):
+                memory_storage.update(snapshot)
+        except Exception as e:
+            logging.error(f"Error loading shared fallback storage: {str(e)}")
+        
+        before = revision(memory_storage)
+        yield
+        if revision(memory_storage) != before:
+            try:
+                await cache.shared.set(key, memory_storage)
+            except Exception as e:
+                logging.error(f"Error saving shared fallback storage: {str(e)}")
+
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
-
-# External API Configuration
-TMDB_API_KEY = os.environ.get('TMDB_API_KEY')
-TMDB_BASE_URL = "https://api.themoviedb.org/3"
-TMDB_IMAGE_BASE_URL = "https://image.tmdb.org/t/p/w500"
-ANILIST_API_URL = "https://graphql.anilist.co"
-GOOGLE_BOOKS_API_URL = "https://www.googleapis.com/books/v1/volumes"
-IGDB_CLIENT_ID = os.environ.get('IGDB_CLIENT_ID')
-IGDB_CLIENT_SECRET = os.environ.get('IGDB_CLIENT_SECRET')
-IGDB_BASE_URL = "https://api.igdb.com/v4"
-TWITCH_AUTH_URL = "https://id.twitch.tv/oauth2/token"
+api_router = APIRouter(prefix="/api", dependencies=[Depends(sync_memory_storage)], default_response_class=TimedJSONResponse)
+
+MAX_BATCH_OPERATIONS = 500
+SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 3600))
+EVENT_HEARTBEAT_SECONDS = 15
+
+abandoned_requests = counter("http_requests_abandoned_total", "Requests whose client disconnected before the response", ["endpoint"])
+search_responses = counter(
+    "search_responses_total", "Search responses by where they came from: search_cache, db (media_items) or external",
+    ["media_type", "source"]
+)
 
 # Pydantic Models
 class MediaItemResponse(BaseModel):
@@ -102,156 +171,25 @@ class UserListItemUpdate(BaseModel):
     rating: Optional[float] = None
     notes: Optional[str] = None
 
+class ProgressIncrement(BaseModel):
+    episode: int = 0
+    chapter: int = 0
+    page: int = 0
+    season: Optional[int] = None
+
+class UserListBatchUpdate(UserListItemUpdate):
+    id: str
+
+class UserListBatchRequest(BaseModel):
+    add: List[UserListItemCreate] = []
+    update: List[UserListBatchUpdate] = []
+    delete: List[str] = []
+
 class UserPreferencesUpdate(BaseModel):
     theme: Optional[str] = None
     language: Optional[str] = None
     notifications_enabled: Optional[bool] = None
 
-# External API Functions
-async def search_tmdb_movies(query: str, page: int = 1):
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{TMDB_BASE_URL}/search/movie",
-            params={"api_key": TMDB_API_KEY, "query": query, "page": page}
-        )
-        return response.json()
-
-async def search_tmdb_tv_shows(query: str, page: int = 1):
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{TMDB_BASE_URL}/search/tv",
-            params={"api_key": TMDB_API_KEY, "query": query, "page": page}
-        )
-        return response.json()
-
-async def get_movie_details(tmdb_id: int):
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{TMDB_BASE_URL}/movie/{tmdb_id}",
-            params={"api_key": TMDB_API_KEY}
-        )
-        return response.json()
-
-async def get_tv_details(tmdb_id: int):
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{TMDB_BASE_URL}/tv/{tmdb_id}",
-            params={"api_key": TMDB_API_KEY}
-        )
-        return response.json()
-
-async def search_anilist(query: str, media_type: str, page: int = 1):
-    graphql_query = """
-    query ($search: String, $type: MediaType, $page: Int, $perPage: Int) {
-        Page(page: $page, perPage: $perPage) {
-            media(search: $search, type: $type) {
-                id
-                title { romaji english native }
-                format status episodes chapters volumes genres averageScore
-                startDate { year month day }
-                endDate { year month day }
-                coverImage { large medium }
-                bannerImage description
-                studios { nodes { name } }
-            }
-        }
-    }
-    """
-    
-    variables = {
-        "search": query,
-        "type": media_type.upper(),
-        "page": page,
-        "perPage": 10
-    }
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            ANILIST_API_URL,
-            json={"query": graphql_query, "variables": variables}
-        )
-        return response.json()
-
-async def search_google_books(query: str, page: int = 1):
-    start_index = (page - 1) * 10
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                GOOGLE_BOOKS_API_URL,
-                params={"q": query, "startIndex": start_index, "maxResults": 10}
-            )
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return {"items": []}
-        except Exception as e:
-            logging.error(f"Google Books API error: {str(e)}")
-            return {"items": []}
-
-# IGDB API Functions
-async def get_igdb_access_token():
-    """Get access token for IGDB API"""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                TWITCH_AUTH_URL,
-                params={
-                    "client_id": IGDB_CLIENT_ID,
-                    "client_secret": IGDB_CLIENT_SECRET,
-                    "grant_type": "client_credentials"
-                }
-            )
-            if response.status_code == 200:
-                return response.json()["access_token"]
-            else:
-                logging.error(f"IGDB Auth error: {response.status_code}")
-                return None
-        except Exception as e:
-            logging.error(f"IGDB Auth error: {str(e)}")
-            return None
-
-async def search_igdb_games(query: str, page: int = 1):
-    """Search games using IGDB API"""
-    token = await get_igdb_access_token()
-    if not token:
-        return []
-    
-    offset = (page - 1) * 10
-    
-    # IGDB query to get games with all relevant fields
-    igdb_query = f"""
-    fields name, summary, cover.url, cover.image_id, platforms.name, 
-           involved_companies.company.name, involved_companies.developer,
-           involved_companies.publisher, first_release_date, rating, 
-           game_modes.name, genres.name, release_dates.human, 
-           release_dates.y, screenshots.image_id;
-    search "{query}";
-    limit 10;
-    offset {offset};
-    """
-    
-    headers = {
-        "Client-ID": IGDB_CLIENT_ID,
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "text/plain"
-    }
-    
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"{IGDB_BASE_URL}/games",
-                headers=headers,
-                content=igdb_query
-            )
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logging.error(f"IGDB Games API error: {response.status_code}")
-                return []
-        except Exception as e:
-            logging.error(f"IGDB Games API error: {str(e)}")
-            return []
-
 # Helper functions to create MediaItem objects and cache them in PostgreSQL
 def create_temp_media_item(media_data):
     """Create a temporary media item object when database is not available"""
@@ -282,6 +220,35 @@ def create_temp_media_item(media_data):
         'game_modes': media_data.get('game_modes', [])
     })()
 
+def keep_localization(db: Session, media_item, locale: str, fields, localized):
+    """Use a result's fields in a non-default locale for this response and, with a database, later ones"""
+    localized[media_item.id] = fields
+    if db and db_available:
+        try:
+            store_localization(db, media_item, locale, fields)
+        except Exception as e:
+            db.rollback()
+            logging.error(f"Error storing localized fields: {str(e)}")
+
+def complete_catalog_stub(media_item, media_data, titles, db: Session):
+    """Fill a row imported by ingest.py, which only has a title, with the provider's details
+
+    The provider's titles are recorded for every stored row, including rows
+    created before their alternate titles were indexed.
+    """
+    if media_item.catalog_source and media_item.overview is None:
+        listed = UserList.media_id == media_item.id, UserList.user_id == "demo_user"
+        if db.execute(select(UserList.id).where(*listed).limit(1)).first():
+            # List entries are served with their media item: a new library version
+            # invalidates list ETags and sends the entries through the change feed
+            version = bump_library_version(db)
+            db.execute(update(UserList).where(*listed).values(version=version, updated_at=UserList.updated_at))
+        for column, value in media_data.items():
+            setattr(media_item, column, value)
+        db.commit()
+    store_item_titles(db, media_item, titles)
+    return media_item
+
 def create_media_item_from_tmdb_movie(movie_data, db: Session):
     if not db or not db_available:
         # Return a temporary media item without saving to database
@@ -303,18 +270,7 @@ def create_media_item_from_tmdb_movie(movie_data, db: Session):
             'release_year': None, 'rating': None, 'game_modes': []
         })()
         
-    media_data = {
-        "external_id": str(movie_data["id"]),
-        "title": movie_data["title"],
-        "media_type": "movie",
-        "year": int(movie_data["release_date"][:4]) if movie_data.get("release_date") else None,
-        "genres": [genre["name"] for genre in movie_data.get("genres", [])],
-        "poster_path": f"{TMDB_IMAGE_BASE_URL}{movie_data['poster_path']}" if movie_data.get("poster_path") else None,
-        "overview": movie_data.get("overview"),
-        "backdrop_path": f"{TMDB_IMAGE_BASE_URL}{movie_data['backdrop_path']}" if movie_data.get("backdrop_path") else None,
-        "vote_average": movie_data.get("vote_average"),
-        "release_date": movie_data.get("release_date")
-    }
+    media_data = media_data_from_tmdb_movie(movie_data)
     
     try:
         # Check if already exists
@@ -324,12 +280,13 @@ def create_media_item_from_tmdb_movie(movie_data, db: Session):
         ).first()
         
         if existing:
-            return existing
+            return complete_catalog_stub(existing, media_data, tmdb_titles(movie_data), db)
         
         media_item = MediaItem(**media_data)
         db.add(media_item)
         db.commit()
         db.refresh(media_item)
+        store_item_titles(db, media_item, tmdb_titles(movie_data))
         return media_item
     except Exception as e:
         logging.error(f"Error saving movie to database: {str(e)}")
@@ -361,20 +318,7 @@ def create_media_item_from_tmdb_tv(tv_data, db: Session):
             'episodes': tv_data.get("number_of_episodes")
         })
         
-    media_data = {
-        "external_id": str(tv_data["id"]),
-        "title": tv_data.get("name", tv_data.get("original_name")),
-        "media_type": "tv",
-        "year": int(tv_data["first_air_date"][:4]) if tv_data.get("first_air_date") else None,
-        "genres": [genre["name"] for genre in tv_data.get("genres", [])],
-        "poster_path": f"{TMDB_IMAGE_BASE_URL}{tv_data['poster_path']}" if tv_data.get("poster_path") else None,
-        "overview": tv_data.get("overview"),
-        "backdrop_path": f"{TMDB_IMAGE_BASE_URL}{tv_data['backdrop_path']}" if tv_data.get("backdrop_path") else None,
-        "vote_average": tv_data.get("vote_average"),
-        "release_date": tv_data.get("first_air_date"),
-        "seasons": tv_data.get("number_of_seasons"),
-        "episodes": tv_data.get("number_of_episodes")
-    }
+    media_data = media_data_from_tmdb_tv(tv_data)
     
     try:
         # Check if already exists
@@ -384,12 +328,13 @@ def create_media_item_from_tmdb_tv(tv_data, db: Session):
         ).first()
         
         if existing:
-            return existing
+            return complete_catalog_stub(existing, media_data, tmdb_titles(tv_data), db)
         
         media_item = MediaItem(**media_data)
         db.add(media_item)
         db.commit()
         db.refresh(media_item)
+        store_item_titles(db, media_item, tmdb_titles(tv_data))
         return media_item
     except Exception as e:
         logging.error(f"Error saving TV show to database: {str(e)}")
@@ -422,23 +367,7 @@ def create_media_item_from_anilist(item_data, media_type, db: Session):
             return None
             
     try:
-        title = item_data["title"]["english"] or item_data["title"]["romaji"] or item_data["title"]["native"]
-        start_date = item_data.get("startDate")
-        year = start_date.get("year") if start_date else None
-        
-        media_data = {
-            "external_id": str(item_data["id"]),
-            "title": title,
-            "media_type": media_type.lower(),
-            "year": year,
-            "genres": item_data.get("genres", []),
-            "poster_path": item_data.get("coverImage", {}).get("large"),
-            "overview": item_data.get("description"),
-            "vote_average": item_data.get("averageScore", 0) / 10 if item_data.get("averageScore") else None,
-            "episodes": item_data.get("episodes"),
-            "chapters": item_data.get("chapters"),
-            "volumes": item_data.get("volumes")
-        }
+        media_data = media_data_from_anilist(item_data, media_type)
         
         existing = db.query(MediaItem).filter(
             MediaItem.external_id == media_data["external_id"],
@@ -446,12 +375,14 @@ def create_media_item_from_anilist(item_data, media_type, db: Session):
         ).first()
         
         if existing:
+            store_item_titles(db, existing, anilist_titles(item_data))
             return existing
         
         media_item = MediaItem(**media_data)
         db.add(media_item)
         db.commit()
         db.refresh(media_item)
+        store_item_titles(db, media_item, anilist_titles(item_data))
         return media_item
     except Exception as e:
         logging.error(f"Error creating AniList media item: {str(e)}")
@@ -528,6 +459,7 @@ def create_media_item_from_book(book_data, db: Session):
         db.add(media_item)
         db.commit()
         db.refresh(media_item)
+        store_item_titles(db, media_item, [])
         return media_item
     except Exception as e:
         logging.error(f"Error creating book media item: {str(e)}")
@@ -676,18 +608,407 @@ def create_media_item_from_igdb_game(game_data, db: Session):
         db.add(media_item)
         db.commit()
         db.refresh(media_item)
+        store_item_titles(db, media_item, [])
         return media_item
     except Exception as e:
         logging.error(f"Error creating game media item: {str(e)}")
         return None
 
+def create_memory_list_item(item: UserListItemCreate):
+    """Build an in-memory list entry, keeping the media information sent by the client"""
+    return {
+        'id': str(uuid.uuid4()),
+        'user_id': 'demo_user',
+        'media_id': item.media_id,
+        'media_type': item.media_type,
+        'status': item.status,
+        'rating': item.rating,
+        'notes': item.notes,
+        'progress': item.progress,
+        'version': None,
+        'created_at': datetime.utcnow().isoformat(),
+        'updated_at': datetime.utcnow().isoformat(),
+        # Complete media information
+        'title': item.title,
+        'poster_path': item.poster_path,
+        'year': item.year,
+        'overview': item.overview,
+        'genres': item.genres or [],
+        'vote_average': item.vote_average,
+        'seasons': item.seasons,
+        'episodes': item.episodes,
+        'chapters': item.chapters,
+        'volumes': item.volumes,
+        'authors': item.authors or [],
+        'publisher': item.publisher,
+        'page_count': item.page_count,
+        'platforms': item.platforms or [],
+        'developers': item.developers or [],
+        'publishers': item.publishers or [],
+        'release_year': item.release_year,
+        'game_modes': item.game_modes or []
+    }
+
+# Increments progress in one statement. The row is locked while the new values
+# are computed so concurrent increments from several devices queue up instead of
+# overwriting each other; counters are clamped to the media item's totals and
+# reaching the end of any incremented counter marks the entry completed.
+PROGRESS_INCREMENT_SQL = text("""
+WITH target AS (
+    SELECT u.id,
+           u.status AS previous_status,
+           -- Entries stored before SQL NULL was used for a missing progress hold the JSON null
+           CASE WHEN jsonb_typeof(u.progress::jsonb) = 'object' THEN u.progress::jsonb ELSE '{}'::jsonb END AS progress,
+           m.episodes AS max_episode,
+           m.chapters AS max_chapter,
+           m.page_count AS max_page
+    FROM user_lists u
+    LEFT JOIN media_items m ON m.id = u.media_id
+    WHERE u.id = :list_item_id AND u.user_id = :user_id
+    FOR UPDATE OF u
+), next AS (
+    SELECT id, previous_status, progress, max_episode, max_chapter, max_page,
+           LEAST(GREATEST(COALESCE((progress->>'episode')::int, 0) + :episode, 0),
+                 COALESCE(max_episode, 2147483647)) AS episode,
+           LEAST(GREATEST(COALESCE((progress->>'chapter')::int, 0) + :chapter, 0),
+                 COALESCE(max_chapter, 2147483647)) AS chapter,
+           LEAST(GREATEST(COALESCE((progress->>'page')::int, 0) + :page, 0),
+                 COALESCE(max_page, 2147483647)) AS page
+    FROM target
+), result AS (
+    SELECT id, previous_status, episode, chapter, page,
+           progress
+           || CASE WHEN :episode <> 0 THEN jsonb_build_object('episode', episode) ELSE '{}'::jsonb END
+           || CASE WHEN :chapter <> 0 THEN jsonb_build_object('chapter', chapter) ELSE '{}'::jsonb END
+           || CASE WHEN :page <> 0 THEN jsonb_build_object('page', page) ELSE '{}'::jsonb END
+           || CASE WHEN CAST(:season AS integer) IS NULL THEN '{}'::jsonb
+                   ELSE jsonb_build_object('season', CAST(:season AS integer)) END AS progress,
+           (:episode > 0 AND max_episode IS NOT NULL AND episode >= max_episode)
+           OR (:chapter > 0 AND max_chapter IS NOT NULL AND chapter >= max_chapter)
+           OR (:page > 0 AND max_page IS NOT NULL AND page >= max_page) AS reached_end
+    FROM next
+)
+UPDATE user_lists u
+SET progress = result.progress::json,
+    status = CASE WHEN result.reached_end THEN 'completed' ELSE u.status END,
+    completed_date = CASE WHEN result.reached_end AND u.status <> 'completed' THEN :now
+                          ELSE u.completed_date END,
+    version = :version,
+    updated_at = :now
+FROM result
+WHERE u.id = result.id
+RETURNING u.id, u.media_type, u.progress, u.status, result.previous_status
+""")
+
+def apply_progress_increment(memory_item, increment: ProgressIncrement):
+    """In-memory counterpart of PROGRESS_INCREMENT_SQL"""
+    progress = dict(memory_item.get('progress') or {})
+    reached_end = False
+    for field, total_field in (('episode', 'episodes'), ('chapter', 'chapters'), ('page', 'page_count')):
+        step = getattr(increment, field)
+        if step == 0:
+            continue
+        total = memory_item.get(total_field)
+        value = max(int(progress.get(field) or 0) + step, 0)
+        if total is not None:
+            value = min(value, total)
+            reached_end = reached_end or (step > 0 and value >= total)
+        progress[field] = value
+    if increment.season is not None:
+        progress['season'] = increment.season
+    
+    memory_item['progress'] = progress
+    if reached_end:
+        memory_item['status'] = 'completed'
+    memory_item['updated_at'] = datetime.utcnow().isoformat()
+
+def to_media_item_response(media_item):
+    return MediaItemResponse(
+        id=media_item.id,
+        external_id=media_item.external_id,
+        title=media_item.title,
+        media_type=media_item.media_type,
+        year=media_item.year,
+        genres=media_item.genres or [],
+        poster_path=media_item.poster_path,
+        overview=media_item.overview,
+        backdrop_path=media_item.backdrop_path,
+        vote_average=media_item.vote_average,
+        release_date=media_item.release_date,
+        seasons=media_item.seasons,
+        episodes=media_item.episodes,
+        chapters=media_item.chapters,
+        volumes=media_item.volumes,
+        authors=media_item.authors or [],
+        publisher=media_item.publisher,
+        page_count=media_item.page_count,
+        platforms=media_item.platforms or [],
+        developers=media_item.developers or [],
+        publishers=media_item.publishers or [],
+        release_year=media_item.release_year,
+        rating=media_item.rating,
+        game_modes=media_item.game_modes or []
+    )
+
+def serialize_list_entry(item, media_item):
+    """Shape a list item and its media item the way GET /user-list returns them"""
+    return {
+        "list_item": {
+            "id": item.id,
+            "user_id": item.user_id,
+            "media_id": item.media_id,
+            "media_type": item.media_type,
+            "status": item.status,
+            "rating": item.rating,
+            "notes": item.notes,
+            "progress": item.progress,
+            "version": item.version,
+            "created_at": item.created_at.isoformat(),
+            "updated_at": item.updated_at.isoformat()
+        },
+        "media_item": to_media_item_response(media_item) if media_item else None
+    }
+
+def serialize_memory_list_entry(item):
+    """Shape an in-memory list entry the way GET /user-list returns them"""
+    return {
+        'list_item': {
+            'id': item['id'],
+            'status': item['status'],
+            'rating': item['rating'],
+            'notes': item['notes'],
+            'progress': item['progress'],
+            'version': item.get('version'),
+            'created_at': item['created_at'],
+            'updated_at': item['updated_at']
+        },
+        'media_item': {
+            'id': item['media_id'],
+            'external_id': item['media_id'],
+            'title': item.get('title', f"Unknown {item['media_type']}"),
+            'media_type': item['media_type'],
+            'year': item.get('year'),
+            'genres': item.get('genres', []),
+            'poster_path': item.get('poster_path'),
+            'overview': item.get('overview'),
+            'backdrop_path': None,
+            'vote_average': item.get('vote_average'),
+            'release_date': None,
+            'seasons': item.get('seasons'),
+            'episodes': item.get('episodes'),
+            'chapters': item.get('chapters'),
+            'volumes': item.get('volumes'),
+            'authors': item.get('authors', []),
+            'publisher': item.get('publisher'),
+            'page_count': item.get('page_count'),
+            'platforms': item.get('platforms', []),
+            'developers': item.get('developers', []),
+            'publishers': item.get('publishers', []),
+            'release_year': item.get('release_year'),
+            'rating': item.get('rating'),
+            'game_modes': item.get('game_modes', [])
+        }
+    }
+
+def load_list_entries(db: Session, list_item_ids):
+    """Fetch list items together with their media items in a single query"""
+    if not list_item_ids:
+        return []
+    rows = db.execute(
+        select(UserList, MediaItem)
+        .outerjoin(MediaItem, MediaItem.id == UserList.media_id)
+        .where(UserList.id.in_(list(list_item_ids)), UserList.user_id == "demo_user")
+    ).all()
+    return [serialize_list_entry(item, media_item) for item, media_item in rows]
+
+def compute_stats_delta(before, after):
+    """Difference in /stats counts between two collections of (media_type, status) pairs"""
+    delta = {}
+    for pairs, sign in ((before, -1), (after, 1)):
+        for media_type, status in pairs:
+            counts = delta.setdefault(media_type, {})
+            counts[status] = counts.get(status, 0) + sign
+    return {
+        media_type: {status: count for status, count in counts.items() if count}
+        for media_type, counts in delta.items()
+        if any(counts.values())
+    }
+
+def sql_value(value):
+    """SQL NULL for None; JSON columns would otherwise store None as the JSON value null"""
+    return null() if value is None else value
+
+def bump_sync_version(db: Session, field: str):
+    """Increment one of the user's UserSyncState counters in the current transaction"""
+    column = getattr(UserSyncState, field)
+    stmt = pg_insert(UserSyncState).values({"user_id": "demo_user", "library_version": 0, field: 1})
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserSyncState.user_id],
+        set_={
+            field: func.coalesce(column, 0) + 1,
+            "updated_at": datetime.utcnow()
+        }
+    ).returning(column)
+    return db.execute(stmt).scalar()
+
+def bump_library_version(db: Session):
+    """Increment the user's library version as part of the current transaction.
+
+    Call this before any other write: the upsert locks the user's sync-state row
+    until commit, so mutations for one user commit in version order and the
+    change feed never hands out a version whose rows are not visible yet.
+    """
+    return bump_sync_version(db, "library_version")
+
+def get_sync_versions(db: Session):
+    """(library_version, preferences_version) of the user, read by primary key.
+
+    Returns (None, None) if the versions cannot be read, in which case responses
+    are sent without an ETag.
+    """
+    if not db or not db_available:
+        from database import memory_storage
+        return memory_storage['library_version'], memory_storage['preferences_version']
+    try:
+        row = db.execute(
+            select(UserSyncState.library_version, UserSyncState.preferences_version)
+            .where(UserSyncState.user_id == "demo_user")
+        ).first()
+    except Exception as e:
+        logging.error(f"Database error in get_sync_versions: {str(e)}")
+        db.rollback()
+        return None, None
+    if not row:
+        return 0, 0
+    return row.library_version or 0, row.preferences_version or 0
+
+def make_etag(kind: str, version: Optional[int], *variant):
+    """Strong ETag for a representation that only changes when `version` does"""
+    if version is None:
+        return None
+    return '"' + "-".join([kind, str(version), *[str(v) for v in variant]]) + '"'
+
+def conditional_response(request: Request, response: Response, etag: Optional[str]):
+    """Return a 304 when the client already holds `etag`, else tag the response"""
+    if etag is None:
+        return None
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if "*" in candidates or etag in candidates:
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+    return None
+
+async def publish_list_change(version, stats_delta, entries=(), removed=()):
+    """Broadcast a list mutation to the user's open event streams"""
+    await publish_event("demo_user", "list", jsonable_encoder({
+        "version": version,
+        "entries": list(entries),
+        "removed": list(removed),
+        "stats_delta": stats_delta
+    }))
+
+def count_stats(pairs):
+    """/stats counts for (media_type, status) pairs"""
+    stats = {}
+    for media_type, status in pairs:
+        if media_type not in stats:
+            stats[media_type] = {}
+        if status not in stats[media_type]:
+            stats[media_type][status] = 0
+        
+        stats[media_type][status] += 1
+    return stats
+
+def record_tombstones(db: Session, removed_rows, version):
+    """Remember deleted list items so the change feed can report them"""
+    if not removed_rows:
+        return
+    stmt = pg_insert(UserListTombstone).values([
+        {
+            "id": row.id,
+            "user_id": "demo_user",
+            "media_id": row.media_id,
+            "media_type": row.media_type,
+            "version": version,
+            "deleted_at": datetime.utcnow()
+        }
+        for row in removed_rows
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[UserListTombstone.id],
+        set_={"version": stmt.excluded.version, "deleted_at": stmt.excluded.deleted_at}
+    ))
+
+def bump_memory_library_version():
+    from database import memory_storage
+    memory_storage['library_version'] += 1
+    return memory_storage['library_version']
+
+def record_memory_tombstone(memory_item, version):
+    from database import memory_storage
+    memory_storage['tombstones'].append({
+        'id': memory_item['id'],
+        'media_id': memory_item['media_id'],
+        'media_type': memory_item['media_type'],
+        'version': version
+    })
+
 # API Routes
 @api_router.get("/")
 async def root():
     return {"message": "Media Trakker API - PostgreSQL with Games Support"}
 
+async def wait_for_disconnect(request: Request):
+    # GET requests have no body, so the next message only arrives when the client goes away
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+async def cancel_on_disconnect(request: Request, work):
+    """Await `work`, cancelling it if the client disconnects first; None when it was cancelled"""
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.create_task(wait_for_disconnect(request))
+    finished = False
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        finished = task.done()
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+    if not finished:
+        abandoned_requests.inc(endpoint=request.url.path)
+        return None
+    return task.result()
+
 @api_router.get("/search")
-async def search_media(query: str = Query(...), media_type: str = Query(...), page: int = Query(1), db: Session = Depends(get_db)):
+async def search_media(request: Request, query: str = Query(...), media_type: str = Query(...), page: int = Query(1)):
+    # The frontend searches again as the query is refined; provider calls for an
+    # abandoned search stop unless a coalesced identical search still waits for them
+    response = await cancel_on_disconnect(request, run_search(query, media_type, page))
+    if response is None:
+        return Response(status_code=499)
+    return response
+
+@api_router.get("/suggest")
+async def suggest_titles(q: str = Query(...), media_type: Optional[str] = Query(None),
+                         limit: int = Query(SUGGEST_DEFAULT_LIMIT, ge=1, le=SUGGEST_MAX_LIMIT)):
+    """Typeahead suggestions from the in-process title index, without a provider round trip (suggest.py)"""
+    if media_type is not None and media_type not in ["movie", "tv", "anime", "manga", "book", "game"]:
+        raise HTTPException(status_code=400, detail="Media type must be one of: movie, tv, anime, manga, book, game")
+    return {"suggestions": suggester.suggest(q, media_type, limit)}
+
+def search_ttl(response):
+    """Provider errors come back as empty results, so those are retried soon instead of cached for SEARCH_CACHE_TTL"""
+    return SEARCH_CACHE_TTL if response["results"] else PROVIDER_ERROR_CACHE_TTL
+
+async def run_search(query: str, media_type: str, page: int, locale: Optional[str] = None):
+    """Search the cache, falling back to the external provider for the media type
+
+    Results are in `locale`, by default the one in the user's preferences (locales.py).
+    """
     if not query.strip():
         raise HTTPException(status_code=400, detail="Search query cannot be empty")
     
@@ -695,47 +1016,75 @@ async def search_media(query: str = Query(...), media_type: str = Query(...), pa
     if media_type not in valid_media_types:
         raise HTTPException(status_code=400, detail=f"Media type must be one of: {', '.join(valid_media_types)}")
     
+    # Identical searches share one response, and concurrent ones one provider round
+    normalized_query = " ".join(query.lower().split())
+    locale = normalize_locale(locale) if locale else await user_locale()
+    if page == 1:
+        query_log.record(media_type, normalized_query)
+    async def load():
+        # Shared by coalesced searches and may outlive the request that started it,
+        # so it does not borrow that request's session
+        with session_scope() as db:
+            response = await search_sources(query, media_type, page, db, locale)
+        with span("serialize"):
+            return jsonable_encoder(response)
+    
+    with foreground.track():
+        response, cached = await cache.get_or_load(
+            "search", f"{media_type}:{page}:{normalized_query}{locale_cache_suffix(locale)}", load, ttl=search_ttl
+        )
+    if cached and db_available and response["results"]:
+        # Retention may have evicted rows of a response cached before the eviction
+        stored = await asyncio.to_thread(existing_media_item_ids, [result["id"] for result in response["results"]])
+        response = {**response, "results": [result for result in response["results"] if result["id"] in stored]}
+    access_tracker.touch(result["id"] for result in response["results"])
+    if cached:
+        search_responses.inc(media_type=media_type, source="search_cache")
+        return {**response, "source": "cache"}
+    search_responses.inc(media_type=media_type, source="db" if response["source"] == "cache" else "external")
+    return response
+
+async def refresh_search(normalized_query: str, media_type: str):
+    """Reload the first page of a search, in the default locale, into the cache ahead of its expiry (cache warming)"""
+    with session_scope() as db:
+        response = jsonable_encoder(await search_sources(normalized_query, media_type, 1, db))
+    await cache.set("search", f"{media_type}:1:{normalized_query}", response, ttl=search_ttl(response))
+
+async def search_sources(query: str, media_type: str, page: int, db: Session, locale: str = DEFAULT_LOCALE):
+    """Search the media_items table, then the external provider for the media type"""
+    # Provider language, and the localized fields of results by media item id
+    language = None if is_default_locale(locale) else locale
+    localized = {}
     try:
         # Check PostgreSQL cache first (only if database is available)
         cached_results = []
+        exact_title_match = False
         if db and db_available:
             try:
+                # Any known form of the title (titles.py), by normalized prefix
+                normalized_query = normalize_title(query)
+                title_matches = db.execute(
+                    select(MediaItemTitle.media_item_id, MediaItemTitle.normalized_title).where(
+                        MediaItemTitle.media_type == media_type,
+                        MediaItemTitle.normalized_title.startswith(normalized_query, autoescape=True)
+                    ).limit(10)
+                ).all() if normalized_query else []
+                exact_title_match = any(title == normalized_query for _, title in title_matches)
                 cached_results = db.query(MediaItem).filter(
-                    MediaItem.title.ilike(f"%{query}%"),
-                    MediaItem.media_type == media_type
+                    or_(MediaItem.title.ilike(f"%{query}%"), MediaItem.id.in_([media_id for media_id, _ in title_matches])),
+                    MediaItem.media_type == media_type,
+                    # Imported titles without details yet (ingest.py) are no answer
+                    or_(MediaItem.catalog_source.is_(None), MediaItem.overview.isnot(None))
                 ).limit(10).all()
             except Exception as db_error:
                 logging.error(f"Database query failed: {str(db_error)}")
                 cached_results = []
         
-        if cached_results and len(cached_results) >= 5:
+        # A title known in exactly the searched form is an answer even when few rows match
+        if cached_results and (len(cached_results) >= 5 or exact_title_match):
+            localized = load_localizations(db, [item.id for item in cached_results], locale)
             return {
-                "results": [MediaItemResponse(
-                    id=item.id,
-                    external_id=item.external_id,
-                    title=item.title,
-                    media_type=item.media_type,
-                    year=item.year,
-                    genres=item.genres or [],
-                    poster_path=item.poster_path,
-                    overview=item.overview,
-                    backdrop_path=item.backdrop_path,
-                    vote_average=item.vote_average,
-                    release_date=item.release_date,
-                    seasons=item.seasons,
-                    episodes=item.episodes,
-                    chapters=item.chapters,
-                    volumes=item.volumes,
-                    authors=item.authors or [],
-                    publisher=item.publisher,
-                    page_count=item.page_count,
-                    platforms=item.platforms or [],
-                    developers=item.developers or [],
-                    publishers=item.publishers or [],
-                    release_year=item.release_year,
-                    rating=item.rating,
-                    game_modes=item.game_modes or []
-                ) for item in cached_results],
+                "results": localize_results([to_media_item_response(item) for item in cached_results], localized),
                 "source": "cache"
             }
         
@@ -743,10 +1092,19 @@ async def search_media(query: str = Query(...), media_type: str = Query(...), pa
         results = []
         
         if media_type == "movie":
-            tmdb_results = await search_tmdb_movies(query, page)
+            tmdb_results = await search_tmdb_movies(query, page, language)
             for item in tmdb_results.get("results", []):
                 detailed_data = await get_movie_details(item["id"])
-                media_item = create_media_item_from_tmdb_movie(detailed_data, db)
+                if "id" not in detailed_data:
+                    # Failed lookup (cached briefly, see tmdb_details_ttl): skip the title
+                    continue
+                with span("upsert"):
+                    media_item = create_media_item_from_tmdb_movie(detailed_data, db)
+                if media_item and language:
+                    localized_data = await get_movie_details(item["id"], language)
+                    if "id" in localized_data:
+                        with span("upsert"):
+                            keep_localization(db, media_item, locale, tmdb_localized_fields(localized_data), localized)
                 if media_item:
                     results.append(MediaItemResponse(
                         id=media_item.id,
@@ -762,10 +1120,19 @@ async def search_media(query: str = Query(...), media_type: str = Query(...), pa
                     ))
         
         elif media_type == "tv":
-            tmdb_results = await search_tmdb_tv_shows(query, page)
+            tmdb_results = await search_tmdb_tv_shows(query, page, language)
             for item in tmdb_results.get("results", []):
                 detailed_data = await get_tv_details(item["id"])
-                media_item = create_media_item_from_tmdb_tv(detailed_data, db)
+                if "id" not in detailed_data:
+                    # Failed lookup (cached briefly, see tmdb_details_ttl): skip the title
+                    continue
+                with span("upsert"):
+                    media_item = create_media_item_from_tmdb_tv(detailed_data, db)
+                if media_item and language:
+                    localized_data = await get_tv_details(item["id"], language)
+                    if "id" in localized_data:
+                        with span("upsert"):
+                            keep_localization(db, media_item, locale, tmdb_localized_fields(localized_data), localized)
                 if media_item:
                     results.append(MediaItemResponse(
                         id=media_item.id,
@@ -785,7 +1152,10 @@ async def search_media(query: str = Query(...), media_type: str = Query(...), pa
             anilist_results = await search_anilist(query, media_type, page)
             if anilist_results.get("data") and anilist_results["data"].get("Page"):
                 for item in anilist_results["data"]["Page"]["media"]:
-                    media_item = create_media_item_from_anilist(item, media_type, db)
+                    with span("upsert"):
+                        media_item = create_media_item_from_anilist(item, media_type, db)
+                        if media_item and language:
+                            keep_localization(db, media_item, locale, anilist_localized_fields(item, locale), localized)
                     if media_item:
                         results.append(MediaItemResponse(
                             id=media_item.id,
@@ -805,7 +1175,8 @@ async def search_media(query: str = Query(...), media_type: str = Query(...), pa
         elif media_type == "book":
             books_results = await search_google_books(query, page)
             for item in books_results.get("items", []):
-                media_item = create_media_item_from_book(item, db)
+                with span("upsert"):
+                    media_item = create_media_item_from_book(item, db)
                 if media_item:
                     results.append(MediaItemResponse(
                         id=media_item.id,
@@ -825,7 +1196,8 @@ async def search_media(query: str = Query(...), media_type: str = Query(...), pa
         elif media_type == "game":
             games_results = await search_igdb_games(query, page)
             for item in games_results:
-                media_item = create_media_item_from_igdb_game(item, db)
+                with span("upsert"):
+                    media_item = create_media_item_from_igdb_game(item, db)
                 if media_item:
                     results.append(MediaItemResponse(
                         id=media_item.id,
@@ -845,8 +1217,16 @@ async def search_media(query: str = Query(...), media_type: str = Query(...), pa
                         game_modes=media_item.game_modes or []
                     ))
         
-        return {"results": results, "source": "external"}
+        if not db_available and SUGGEST_ENABLED:
+            suggester.add_results(results)
+        return {"results": localize_results(results, localized), "source": "external"}
     
+    except ProviderOverloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail="The search provider is busy, please try again shortly",
+            headers={"Retry-After": str(max(int(e.retry_after + 0.5), 1))}
+        )
     except Exception as e:
         logging.error(f"Error searching media: {str(e)}")
         raise HTTPException(status_code=500, detail="An error occurred while searching")
@@ -856,8 +1236,6 @@ async def add_to_user_list(item: UserListItemCreate, db: Session = Depends(get_d
     if not db or not db_available:
         # Use in-memory storage when database is not available
         from database import memory_storage
-        import uuid
-        from datetime import datetime
         
         # Check if item already exists
         existing_item = next((i for i in memory_storage['user_list'] 
@@ -867,67 +1245,55 @@ async def add_to_user_list(item: UserListItemCreate, db: Session = Depends(get_d
             raise HTTPException(status_code=400, detail="Item already in your list")
             
         # Add to memory storage with complete media information
-        new_item = {
-            'id': str(uuid.uuid4()),
-            'user_id': 'demo_user',
-            'media_id': item.media_id,
-            'media_type': item.media_type,
-            'status': item.status,
-            'rating': item.rating,
-            'notes': item.notes,
-            'progress': item.progress,
-            'created_at': datetime.utcnow().isoformat(),
-            'updated_at': datetime.utcnow().isoformat(),
-            # Complete media information
-            'title': item.title,
-            'poster_path': item.poster_path,
-            'year': item.year,
-            'overview': item.overview,
-            'genres': item.genres or [],
-            'vote_average': item.vote_average,
-            'seasons': item.seasons,
-            'episodes': item.episodes,
-            'chapters': item.chapters,
-            'volumes': item.volumes,
-            'authors': item.authors or [],
-            'publisher': item.publisher,
-            'page_count': item.page_count,
-            'platforms': item.platforms or [],
-            'developers': item.developers or [],
-            'publishers': item.publishers or [],
-            'release_year': item.release_year,
-            'game_modes': item.game_modes or []
-        }
+        new_item = create_memory_list_item(item)
+        new_item['version'] = bump_memory_library_version()
         memory_storage['user_list'].append(new_item)
         
-        return {"message": "Item added to list", "id": new_item['id']}
+        result = {
+            "message": "Item added to list",
+            "id": new_item['id'],
+            "entry": serialize_memory_list_entry(new_item),
+            "stats_delta": compute_stats_delta([], [(item.media_type, item.status)]),
+            "version": new_item['version']
+        }
+        await publish_list_change(result["version"], result["stats_delta"], entries=[result["entry"]] if result["entry"] else [])
+        return result
         
     try:
-        # Check if item already exists
-        existing_item = db.query(UserList).filter(
-            UserList.user_id == "demo_user",
-            UserList.media_id == item.media_id
-        ).first()
-        
-        if existing_item:
-            raise HTTPException(status_code=400, detail="Item already in your list")
+        version = bump_library_version(db)
         
-        # Create new list item
-        db_item = UserList(
+        # Insert unless the item is already listed; the unique (user_id, media_id)
+        # index makes this safe against concurrent adds of the same item
+        stmt = pg_insert(UserList).values(
             user_id="demo_user",
             media_id=item.media_id,
             media_type=item.media_type,
             status=item.status,
             rating=item.rating,
             notes=item.notes,
-            progress=item.progress
-        )
+            progress=sql_value(item.progress),
+            version=version
+        ).on_conflict_do_nothing(
+            index_elements=[UserList.user_id, UserList.media_id]
+        ).returning(UserList.id)
         
-        db.add(db_item)
+        new_id = db.execute(stmt).scalar()
+        if new_id is None:
+            db.rollback()
+            raise HTTPException(status_code=400, detail="Item already in your list")
+        
+        entries = load_list_entries(db, [new_id])
         db.commit()
-        db.refresh(db_item)
         
-        return {"message": "Item added to list", "id": db_item.id}
+        result = {
+            "message": "Item added to list",
+            "id": new_id,
+            "entry": entries[0] if entries else None,
+            "stats_delta": compute_stats_delta([], [(item.media_type, item.status)]),
+            "version": version
+        }
+        await publish_list_change(result["version"], result["stats_delta"], entries=[result["entry"]] if result["entry"] else [])
+        return result
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
@@ -937,7 +1303,13 @@ async def add_to_user_list(item: UserListItemCreate, db: Session = Depends(get_d
         return {"message": "Item added to list (temporary - database error occurred)"}
 
 @api_router.get("/user-list")
-async def get_user_list(status: Optional[str] = None, media_type: Optional[str] = None, db: Session = Depends(get_db)):
+async def get_user_list(request: Request, response: Response, status: Optional[str] = None, media_type: Optional[str] = None, db: Session = Depends(get_db)):
+    # Answer revalidations from the version counter before touching user_lists
+    library_version, _ = get_sync_versions(db)
+    not_modified = conditional_response(request, response, make_etag("list", library_version, status or "", media_type or ""))
+    if not_modified:
+        return not_modified
+    
     if not db or not db_available:
         # Use in-memory storage when database is not available
         from database import memory_storage
@@ -951,47 +1323,7 @@ async def get_user_list(status: Optional[str] = None, media_type: Optional[str]
             items = [item for item in items if item['media_type'] == media_type]
             
         # Convert to expected format with actual saved data
-        enriched_items = []
-        for item in items:
-            enriched_items.append({
-                'list_item': {
-                    'id': item['id'],
-                    'status': item['status'],
-                    'rating': item['rating'],
-                    'notes': item['notes'],
-                    'progress': item['progress'],
-                    'created_at': item['created_at'],
-                    'updated_at': item['updated_at']
-                },
-                'media_item': {
-                    'id': item['media_id'],
-                    'external_id': item['media_id'],
-                    'title': item.get('title', f"Unknown {item['media_type']}"),
-                    'media_type': item['media_type'],
-                    'year': item.get('year'),
-                    'genres': item.get('genres', []),
-                    'poster_path': item.get('poster_path'),
-                    'overview': item.get('overview'),
-                    'backdrop_path': None,
-                    'vote_average': item.get('vote_average'),
-                    'release_date': None,
-                    'seasons': item.get('seasons'),
-                    'episodes': item.get('episodes'),
-                    'chapters': item.get('chapters'),
-                    'volumes': item.get('volumes'),
-                    'authors': item.get('authors', []),
-                    'publisher': item.get('publisher'),
-                    'page_count': item.get('page_count'),
-                    'platforms': item.get('platforms', []),
-                    'developers': item.get('developers', []),
-                    'publishers': item.get('publishers', []),
-                    'release_year': item.get('release_year'),
-                    'rating': item.get('rating'),
-                    'game_modes': item.get('game_modes', [])
-                }
-            })
-            
-        return enriched_items
+        return [serialize_memory_list_entry(item) for item in items]
         
     try:
         query = db.query(UserList).filter(UserList.user_id == "demo_user")
@@ -1008,66 +1340,174 @@ async def get_user_list(status: Optional[str] = None, media_type: Optional[str]
         for item in list_items:
             media_item = db.query(MediaItem).filter(MediaItem.id == item.media_id).first()
             if media_item:
-                enriched_items.append({
-                    "list_item": {
-                        "id": item.id,
-                        "user_id": item.user_id,
-                        "media_id": item.media_id,
-                        "media_type": item.media_type,
-                        "status": item.status,
-                        "rating": item.rating,
-                        "notes": item.notes,
-                        "progress": item.progress,
-                        "created_at": item.created_at.isoformat(),
-                        "updated_at": item.updated_at.isoformat()
-                    },
-                    "media_item": MediaItemResponse(
-                        id=media_item.id,
-                        external_id=media_item.external_id,
-                        title=media_item.title,
-                        media_type=media_item.media_type,
-                        year=media_item.year,
-                        genres=media_item.genres or [],
-                        poster_path=media_item.poster_path,
-                        overview=media_item.overview,
-                        backdrop_path=media_item.backdrop_path,
-                        vote_average=media_item.vote_average,
-                        release_date=media_item.release_date,
-                        seasons=media_item.seasons,
-                        episodes=media_item.episodes,
-                        chapters=media_item.chapters,
-                        volumes=media_item.volumes,
-                        authors=media_item.authors or [],
-                        publisher=media_item.publisher,
-                        page_count=media_item.page_count,
-                        platforms=media_item.platforms or [],
-                        developers=media_item.developers or [],
-                        publishers=media_item.publishers or [],
-                        release_year=media_item.release_year,
-                        rating=media_item.rating,
-                        game_modes=media_item.game_modes or []
-                    )
-                })
+                enriched_items.append(serialize_list_entry(item, media_item))
         
         return enriched_items
     except Exception as e:
         logging.error(f"Database error in get_user_list: {str(e)}")
         return []
 
+@api_router.get("/user-list/query")
+async def query_user_list(
+    request: Request,
+    response: Response,
+    q: Optional[str] = None,
+    genre: Optional[List[str]] = Query(None),
+    platform: Optional[List[str]] = Query(None),
+    author: Optional[List[str]] = Query(None),
+    year_min: Optional[int] = None,
+    year_max: Optional[int] = None,
+    rating_min: Optional[float] = None,
+    rating_max: Optional[float] = None,
+    status: Optional[List[str]] = Query(None),
+    media_type: Optional[List[str]] = Query(None),
+    sort: str = "updated",
+    order: Optional[str] = None,
+    limit: int = Query(LIBRARY_PAGE_SIZE, ge=1, le=LIBRARY_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db)
+):
+    """One page of the library entries matching a text search and filters, in the given order (library.py).
+
+    genre, platform, author, status and media_type can be repeated and match any
+    of their values. Sorts on updated (default), added, title, year, rating,
+    status, media_type, genre, platform, author or, with q, relevance.
+    """
+    if sort not in LIBRARY_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Sort must be one of: {', '.join(LIBRARY_SORT_FIELDS)}")
+    if order not in (None, "asc", "desc"):
+        raise HTTPException(status_code=400, detail="Order must be asc or desc")
+    
+    # Media rows are matched and sorted on too; rewriting a listed one bumps the
+    # library version as well (complete_catalog_stub)
+    library_version, _ = get_sync_versions(db)
+    variant = hashlib.sha1(str(sorted(request.query_params.multi_items())).encode()).hexdigest()[:16]
+    not_modified = conditional_response(request, response, make_etag("list-query", library_version, variant))
+    if not_modified:
+        return not_modified
+    
+    filters = {
+        "q": q, "genres": genre, "platforms": platform, "authors": author,
+        "year_min": year_min, "year_max": year_max, "rating_min": rating_min, "rating_max": rating_max,
+        "statuses": status, "media_types": media_type
+    }
+    if not db or not db_available:
+        # Use in-memory storage when database is not available
+        from database import memory_storage
+        
+        total, items = query_memory_library(memory_storage['user_list'], filters, sort, order, limit, offset)
+        return {"total": total, "limit": limit, "offset": offset,
+                "items": [serialize_memory_list_entry(item) for item in items]}
+    
+    try:
+        total, rows = query_library(db, "demo_user", filters, sort, order, limit, offset)
+        return {"total": total, "limit": limit, "offset": offset,
+                "items": [serialize_list_entry(item, media_item) for item, media_item in rows]}
+    except Exception as e:
+        logging.error(f"Database error in query_user_list: {str(e)}")
+        raise HTTPException(status_code=500, detail="An error occurred while querying the list")
+
+@api_router.get("/user-list/changes")
+async def get_user_list_changes(since: int = Query(0, ge=0), db: Session = Depends(get_db)):
+    """List entries created or changed, and items removed, after library version `since`.
+
+    Clients pass the returned version as `since` on their next call. A `since` of 0,
+    or one ahead of the server, returns the whole library with reset=true and the
+    client should replace its local copy.
+    """
+    if not db or not db_available:
+        # Use in-memory storage when database is not available
+        from database import memory_storage
+        
+        version = memory_storage['library_version']
+        if since == version:
+            return {"version": version, "reset": False, "changes": [], "removed": []}
+        
+        reset = since == 0 or since > version
+        return {
+            "version": version,
+            "reset": reset,
+            "changes": [serialize_memory_list_entry(i) for i in memory_storage['user_list']
+                        if reset or (i.get('version') or 0) > since],
+            "removed": [] if reset else [t for t in memory_storage['tombstones'] if t['version'] > since]
+        }
+    
+    try:
+        version = db.execute(
+            select(UserSyncState.library_version).where(UserSyncState.user_id == "demo_user")
+        ).scalar() or 0
+        
+        # Nothing changed: answered from the sync-state row alone
+        if since == version:
+            return {"version": version, "reset": False, "changes": [], "removed": []}
+        
+        reset = since == 0 or since > version
+        query = select(UserList, MediaItem).join(
+            MediaItem, MediaItem.id == UserList.media_id
+        ).where(UserList.user_id == "demo_user")
+        if not reset:
+            query = query.where(UserList.version > since, UserList.version <= version).order_by(UserList.version)
+        changes = [serialize_list_entry(item, media_item) for item, media_item in db.execute(query).all()]
+        
+        removed = []
+        if not reset:
+            removed = [
+                {
+                    "id": tombstone.id,
+                    "media_id": tombstone.media_id,
+                    "media_type": tombstone.media_type,
+                    "version": tombstone.version
+                }
+                for tombstone in db.query(UserListTombstone).filter(
+                    UserListTombstone.user_id == "demo_user",
+                    UserListTombstone.version > since,
+                    UserListTombstone.version <= version
+                ).order_by(UserListTombstone.version)
+            ]
+        
+        return {"version": version, "reset": reset, "changes": changes, "removed": removed}
+    except Exception as e:
+        logging.error(f"Database error in get_user_list_changes: {str(e)}")
+        raise HTTPException(status_code=500, detail="An error occurred while reading changes")
+
 @api_router.put("/user-list/{list_item_id}")
 async def update_user_list_item(list_item_id: str, update_data: UserListItemUpdate, db: Session = Depends(get_db)):
     if not db or not db_available:
-        return {"message": "Item updated (temporary - database not available)"}
+        # Use in-memory storage when database is not available
+        from database import memory_storage
+        
+        memory_item = next((i for i in memory_storage['user_list'] 
+                            if i['id'] == list_item_id), None)
+        if not memory_item:
+            raise HTTPException(status_code=404, detail="List item not found")
+        
+        before = [(memory_item['media_type'], memory_item['status'])]
+        for field, value in update_data.model_dump(exclude_none=True).items():
+            memory_item[field] = value
+        memory_item['updated_at'] = datetime.utcnow().isoformat()
+        memory_item['version'] = bump_memory_library_version()
+        
+        result = {
+            "message": "Item updated successfully",
+            "entry": serialize_memory_list_entry(memory_item),
+            "stats_delta": compute_stats_delta(before, [(memory_item['media_type'], memory_item['status'])]),
+            "version": memory_item['version']
+        }
+        await publish_list_change(result["version"], result["stats_delta"], entries=[result["entry"]] if result["entry"] else [])
+        return result
         
     try:
+        version = bump_library_version(db)
         db_item = db.query(UserList).filter(
             UserList.id == list_item_id,
             UserList.user_id == "demo_user"
-        ).first()
+        ).with_for_update().first()
         
         if not db_item:
             raise HTTPException(status_code=404, detail="List item not found")
         
+        before = [(db_item.media_type, db_item.status)]
+        
         # Update fields
         if update_data.status is not None:
             db_item.status = update_data.status
@@ -1079,72 +1519,380 @@ async def update_user_list_item(list_item_id: str, update_data: UserListItemUpda
             db_item.progress = update_data.progress
         
         db_item.updated_at = datetime.utcnow()
+        db_item.version = version
+        db.flush()
+        
+        entry = serialize_list_entry(db_item, db.get(MediaItem, db_item.media_id))
         db.commit()
         
-        return {"message": "Item updated successfully"}
+        result = {
+            "message": "Item updated successfully",
+            "entry": entry,
+            "stats_delta": compute_stats_delta(before, [(entry["list_item"]["media_type"], entry["list_item"]["status"])]),
+            "version": version
+        }
+        await publish_list_change(result["version"], result["stats_delta"], entries=[result["entry"]] if result["entry"] else [])
+        return result
     except HTTPException:
         raise
     except Exception as e:
         logging.error(f"Database error in update_user_list_item: {str(e)}")
         return {"message": "Item updated (temporary - database error occurred)"}
 
+@api_router.post("/user-list/{list_item_id}/progress")
+async def increment_progress(list_item_id: str, increment: ProgressIncrement, db: Session = Depends(get_db)):
+    if increment.episode == 0 and increment.chapter == 0 and increment.page == 0 and increment.season is None:
+        raise HTTPException(status_code=400, detail="No progress change given")
+    
+    if not db or not db_available:
+        # Use in-memory storage when database is not available
+        from database import memory_storage
+        
+        memory_item = next((i for i in memory_storage['user_list'] 
+                            if i['id'] == list_item_id), None)
+        if not memory_item:
+            raise HTTPException(status_code=404, detail="List item not found")
+        
+        before = [(memory_item['media_type'], memory_item['status'])]
+        apply_progress_increment(memory_item, increment)
+        memory_item['version'] = bump_memory_library_version()
+        result = {
+            "message": "Progress updated",
+            "id": memory_item['id'],
+            "progress": memory_item['progress'],
+            "status": memory_item['status'],
+            "entry": serialize_memory_list_entry(memory_item),
+            "stats_delta": compute_stats_delta(before, [(memory_item['media_type'], memory_item['status'])]),
+            "version": memory_item['version']
+        }
+        await publish_list_change(result["version"], result["stats_delta"], entries=[result["entry"]] if result["entry"] else [])
+        return result
+    
+    try:
+        version = bump_library_version(db)
+        row = db.execute(PROGRESS_INCREMENT_SQL, {
+            "list_item_id": list_item_id,
+            "user_id": "demo_user",
+            "episode": increment.episode,
+            "chapter": increment.chapter,
+            "page": increment.page,
+            "season": increment.season,
+            "version": version,
+            "now": datetime.utcnow()
+        }).first()
+        
+        if not row:
+            db.rollback()
+            raise HTTPException(status_code=404, detail="List item not found")
+        
+        entries = load_list_entries(db, [row.id])
+        db.commit()
+        
+        result = {
+            "message": "Progress updated",
+            "id": row.id,
+            "progress": row.progress,
+            "status": row.status,
+            "entry": entries[0] if entries else None,
+            "stats_delta": compute_stats_delta([(row.media_type, row.previous_status)], [(row.media_type, row.status)]),
+            "version": version
+        }
+        await publish_list_change(result["version"], result["stats_delta"], entries=[result["entry"]] if result["entry"] else [])
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Database error in increment_progress: {str(e)}")
+        raise HTTPException(status_code=500, detail="An error occurred while updating progress")
+
 @api_router.delete("/user-list/{list_item_id}")
 async def remove_from_user_list(list_item_id: str, db: Session = Depends(get_db)):
     if not db or not db_available:
-        return {"message": "Item removed from list (temporary - database not available)"}
+        # Use in-memory storage when database is not available
+        from database import memory_storage
+        
+        memory_item = next((i for i in memory_storage['user_list'] 
+                            if i['id'] == list_item_id), None)
+        if not memory_item:
+            raise HTTPException(status_code=404, detail="List item not found")
+        
+        memory_storage['user_list'].remove(memory_item)
+        version = bump_memory_library_version()
+        record_memory_tombstone(memory_item, version)
+        result = {
+            "message": "Item removed from list",
+            "id": list_item_id,
+            "stats_delta": compute_stats_delta([(memory_item['media_type'], memory_item['status'])], []),
+            "version": version
+        }
+        await publish_list_change(result["version"], result["stats_delta"], removed=[result["id"]])
+        return result
         
     try:
-        result = db.query(UserList).filter(
-            UserList.id == list_item_id,
-            UserList.user_id == "demo_user"
-        ).delete()
+        version = bump_library_version(db)
+        removed = db.execute(
+            delete(UserList).where(
+                UserList.id == list_item_id,
+                UserList.user_id == "demo_user"
+            ).returning(UserList.id, UserList.media_id, UserList.media_type, UserList.status)
+        ).all()
         
-        if result == 0:
+        if not removed:
+            db.rollback()
             raise HTTPException(status_code=404, detail="List item not found")
         
+        record_tombstones(db, removed, version)
         db.commit()
-        return {"message": "Item removed from list"}
+        result = {
+            "message": "Item removed from list",
+            "id": list_item_id,
+            "stats_delta": compute_stats_delta([(row.media_type, row.status) for row in removed], []),
+            "version": version
+        }
+        await publish_list_change(result["version"], result["stats_delta"], removed=[result["id"]])
+        return result
     except HTTPException:
         raise
     except Exception as e:
         logging.error(f"Database error in remove_from_user_list: {str(e)}")
         return {"message": "Item removed from list (temporary - database error occurred)"}
 
+@api_router.post("/user-list/batch")
+async def batch_user_list(batch: UserListBatchRequest, db: Session = Depends(get_db)):
+    """Apply many deletes, updates and adds to the list in a single transaction.
+
+    Adds are upserts: adding an item that is already listed updates its status,
+    rating, notes and progress instead of failing.
+    """
+    total_operations = len(batch.add) + len(batch.update) + len(batch.delete)
+    if total_operations == 0:
+        raise HTTPException(status_code=400, detail="Batch contains no operations")
+    if total_operations > MAX_BATCH_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"Batch cannot contain more than {MAX_BATCH_OPERATIONS} operations")
+    
+    # The last add wins when the same media item appears more than once
+    adds = list({item.media_id: item for item in batch.add}.values())
+    
+    if not db or not db_available:
+        # Use in-memory storage when database is not available
+        from database import memory_storage
+        
+        items_by_id = {i['id']: i for i in memory_storage['user_list']}
+        missing = [list_item_id for list_item_id in [u.id for u in batch.update] + batch.delete
+                   if list_item_id not in items_by_id]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"List items not found: {', '.join(missing)}")
+        
+        version = bump_memory_library_version()
+        before = {}
+        changed = {}
+        
+        deleted_ids = set(batch.delete)
+        for list_item_id in deleted_ids:
+            before[list_item_id] = (items_by_id[list_item_id]['media_type'], items_by_id[list_item_id]['status'])
+            record_memory_tombstone(items_by_id[list_item_id], version)
+        memory_storage['user_list'] = [i for i in memory_storage['user_list'] if i['id'] not in deleted_ids]
+        
+        for update_data in batch.update:
+            if update_data.id in deleted_ids:
+                continue
+            memory_item = items_by_id[update_data.id]
+            before.setdefault(memory_item['id'], (memory_item['media_type'], memory_item['status']))
+            for field, value in update_data.model_dump(exclude={'id'}, exclude_none=True).items():
+                memory_item[field] = value
+            memory_item['updated_at'] = datetime.utcnow().isoformat()
+            changed[memory_item['id']] = memory_item
+        
+        added_ids = []
+        for item in adds:
+            existing_item = next((i for i in memory_storage['user_list'] 
+                                if i['media_id'] == item.media_id), None)
+            if existing_item:
+                before.setdefault(existing_item['id'], (existing_item['media_type'], existing_item['status']))
+                for field in ('status', 'rating', 'notes', 'progress'):
+                    if getattr(item, field) is not None:
+                        existing_item[field] = getattr(item, field)
+                existing_item['updated_at'] = datetime.utcnow().isoformat()
+            else:
+                existing_item = create_memory_list_item(item)
+                memory_storage['user_list'].append(existing_item)
+            added_ids.append(existing_item['id'])
+            changed[existing_item['id']] = existing_item
+        
+        for memory_item in changed.values():
+            memory_item['version'] = version
+        
+        result = {
+            "message": "Batch applied",
+            "added": added_ids,
+            "updated": len(batch.update),
+            "deleted": len(deleted_ids),
+            "entries": [serialize_memory_list_entry(i) for i in changed.values()],
+            "removed": sorted(deleted_ids),
+            "stats_delta": compute_stats_delta(
+                before.values(),
+                [(i['media_type'], i['status']) for i in changed.values()]
+            ),
+            "version": version
+        }
+        await publish_list_change(result["version"], result["stats_delta"], entries=result["entries"], removed=result["removed"])
+        return result
+    
+    try:
+        now = datetime.utcnow()
+        version = bump_library_version(db)
+        
+        # Lock every row the batch touches, remembering its state for the stats
+        # delta, and fail the whole batch on unknown ids
+        before = {}
+        target_ids = {u.id for u in batch.update} | set(batch.delete)
+        if target_ids:
+            rows = db.execute(
+                select(UserList.id, UserList.media_type, UserList.status).where(
+                    UserList.id.in_(target_ids),
+                    UserList.user_id == "demo_user"
+                ).with_for_update()
+            ).all()
+            before.update({row.id: (row.media_type, row.status) for row in rows})
+            missing = sorted(target_ids - set(before))
+            if missing:
+                db.rollback()
+                raise HTTPException(status_code=404, detail=f"List items not found: {', '.join(missing)}")
+        if adds:
+            rows = db.execute(
+                select(UserList.id, UserList.media_type, UserList.status).where(
+                    UserList.media_id.in_([item.media_id for item in adds]),
+                    UserList.user_id == "demo_user"
+                ).with_for_update()
+            ).all()
+            before.update({row.id: (row.media_type, row.status) for row in rows})
+        
+        removed_ids = []
+        if batch.delete:
+            removed = db.execute(
+                delete(UserList).where(
+                    UserList.id.in_(batch.delete),
+                    UserList.user_id == "demo_user"
+                ).returning(UserList.id, UserList.media_id, UserList.media_type, UserList.status)
+            ).all()
+            record_tombstones(db, removed, version)
+            removed_ids = [row.id for row in removed]
+        
+        if batch.update:
+            # One executemany per set of fields sent; fields an update leaves out
+            # are not written, matching the partial-update semantics of PUT /user-list/{id}
+            updates_by_fields = {}
+            for u in batch.update:
+                fields = u.model_dump(exclude={'id'}, exclude_none=True)
+                updates_by_fields.setdefault(tuple(sorted(fields)), []).append(
+                    {"b_id": u.id, **{f"b_{field}": value for field, value in fields.items()}}
+                )
+            for fields, params in updates_by_fields.items():
+                stmt = update(UserList).where(
+                    UserList.id == bindparam("b_id"),
+                    UserList.user_id == "demo_user"
+                ).values({
+                    **{field: bindparam(f"b_{field}", type_=getattr(UserList, field).type) for field in fields},
+                    "version": version,
+                    "updated_at": now
+                })
+                db.connection().execute(stmt, params)
+        
+        added_ids = []
+        if adds:
+            # One upsert per set of optional fields sent; an add of an item already
+            # listed keeps the stored values of the fields it leaves out
+            adds_by_fields = {}
+            for item in adds:
+                fields = tuple(field for field in ("rating", "notes", "progress") if getattr(item, field) is not None)
+                adds_by_fields.setdefault(fields, []).append(item)
+            ids_by_media = {}
+            for fields, items in adds_by_fields.items():
+                stmt = pg_insert(UserList).values([
+                    {
+                        "id": str(uuid.uuid4()),
+                        "user_id": "demo_user",
+                        "media_id": item.media_id,
+                        "media_type": item.media_type,
+                        "status": item.status,
+                        "rating": item.rating,
+                        "notes": item.notes,
+                        "progress": sql_value(item.progress),
+                        "version": version,
+                        "created_at": now,
+                        "updated_at": now
+                    }
+                    for item in items
+                ])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[UserList.user_id, UserList.media_id],
+                    set_={
+                        "status": stmt.excluded.status,
+                        **{field: stmt.excluded[field] for field in fields},
+                        "version": stmt.excluded.version,
+                        "updated_at": stmt.excluded.updated_at
+                    }
+                ).returning(UserList.id, UserList.media_id)
+                ids_by_media.update({row.media_id: row.id for row in db.execute(stmt)})
+            added_ids = [ids_by_media[item.media_id] for item in adds]
+        
+        entries = load_list_entries(db, {u.id for u in batch.update} | set(added_ids))
+        db.commit()
+        
+        result = {
+            "message": "Batch applied",
+            "added": added_ids,
+            "updated": len(batch.update),
+            "deleted": len(removed_ids),
+            "entries": entries,
+            "removed": removed_ids,
+            "stats_delta": compute_stats_delta(
+                before.values(),
+                [(e["list_item"]["media_type"], e["list_item"]["status"]) for e in entries]
+            ),
+            "version": version
+        }
+        await publish_list_change(result["version"], result["stats_delta"], entries=result["entries"], removed=result["removed"])
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Database error in batch_user_list: {str(e)}")
+        raise HTTPException(status_code=500, detail="An error occurred while applying the batch")
+
 @api_router.get("/stats")
-async def get_user_stats(db: Session = Depends(get_db)):
+async def get_user_stats(request: Request, response: Response, db: Session = Depends(get_db)):
+    library_version, _ = get_sync_versions(db)
+    not_modified = conditional_response(request, response, make_etag("stats", library_version))
+    if not_modified:
+        return not_modified
+    
     if not db or not db_available:
-        # Return empty stats when database is not available
-        return {}
+        # Count the in-memory list when database is not available
+        from database import memory_storage
+        return count_stats((i['media_type'], i['status']) for i in memory_storage['user_list'])
         
     try:
         list_items = db.query(UserList).filter(UserList.user_id == "demo_user").all()
         
-        stats = {}
-        for item in list_items:
-            media_type = item.media_type
-            status = item.status
-            
-            if media_type not in stats:
-                stats[media_type] = {}
-            if status not in stats[media_type]:
-                stats[media_type][status] = 0
-            
-            stats[media_type][status] += 1
-        
-        return stats
+        return count_stats((item.media_type, item.status) for item in list_items)
     except Exception as e:
         logging.error(f"Database error in get_user_stats: {str(e)}")
         return {}
 
 @api_router.get("/user-preferences")
-async def get_user_preferences(db: Session = Depends(get_db)):
+async def get_user_preferences(request: Request, response: Response, db: Session = Depends(get_db)):
+    _, preferences_version = get_sync_versions(db)
+    not_modified = conditional_response(request, response, make_etag("preferences", preferences_version))
+    if not_modified:
+        return not_modified
+    
     if not db or not db_available:
-        # Return default preferences when database is not available
-        return {
-            "theme": "dark",
-            "language": "en", 
-            "notifications_enabled": True
-        }
+        # Return in-memory preferences (defaults until updated) when database is not available
+        from database import memory_storage
+        return dict(memory_storage['user_preferences'])
         
     try:
         preferences = db.query(UserPreferences).filter(UserPreferences.user_id == "demo_user").first()
@@ -1171,6 +1919,19 @@ async def get_user_preferences(db: Session = Depends(get_db)):
 
 @api_router.put("/user-preferences")
 async def update_user_preferences(update_data: UserPreferencesUpdate, db: Session = Depends(get_db)):
+    if not db or not db_available:
+        # Use in-memory storage when database is not available
+        from database import memory_storage
+        memory_storage['user_preferences'].update(update_data.model_dump(exclude_none=True))
+        memory_storage['preferences_version'] += 1
+        await forget_user_locale("demo_user")
+        await publish_event("demo_user", "preferences", {
+            "version": memory_storage['preferences_version'],
+            "preferences": dict(memory_storage['user_preferences'])
+        })
+        return {"message": "Preferences updated successfully", "version": memory_storage['preferences_version']}
+    
+    version = bump_sync_version(db, "preferences_version")
     preferences = db.query(UserPreferences).filter(UserPreferences.user_id == "demo_user").first()
     
     if not preferences:
@@ -1185,12 +1946,130 @@ async def update_user_preferences(update_data: UserPreferencesUpdate, db: Sessio
         preferences.notifications_enabled = update_data.notifications_enabled
     
     preferences.updated_at = datetime.utcnow()
+    current = {
+        "theme": preferences.theme,
+        "language": preferences.language,
+        "notifications_enabled": preferences.notifications_enabled
+    }
     db.commit()
     
-    return {"message": "Preferences updated successfully"}
+    # Searches pick up a new language right away
+    await forget_user_locale("demo_user")
+    await publish_event("demo_user", "preferences", {"version": version, "preferences": current})
+    return {"message": "Preferences updated successfully", "version": version}
+
+@api_router.get("/events")
+async def stream_events(request: Request):
+    """Server-sent events stream of the user's list and preference changes.
+
+    The stream opens with a `hello` event carrying the current library and
+    preferences versions. A reconnecting client compares them with its own and
+    catches up through /user-list/changes; after that, `list` events carry the
+    changed entries, removed ids and stats delta of every mutation and
+    `preferences` events the full preferences.
+    """
+    async def event_stream():
+        # Subscribe before reading the versions so nothing falls in between
+        async with broker.subscribe("demo_user") as queue:
+            with session_scope() as db:
+                library_version, preferences_version = get_sync_versions(db)
+            yield format_sse({
+                "type": "hello",
+                "data": {"library_version": library_version, "preferences_version": preferences_version}
+            })
+            
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line; keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(METRICS_REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# Memory tracing for admins; see profiling.py for the X-Profile request profiler
+@api_router.post("/admin/tracemalloc/start", dependencies=[Depends(require_admin)])
+async def start_memory_tracing(frames: int = Query(25, ge=1, le=100)):
+    return start_tracing(frames)
+
+@api_router.post("/admin/tracemalloc/stop", dependencies=[Depends(require_admin)])
+async def stop_memory_tracing():
+    return stop_tracing()
+
+@api_router.post("/admin/tracemalloc/snapshot", dependencies=[Depends(require_admin)])
+async def snapshot_memory(
+    limit: int = Query(25, ge=1, le=500),
+    key_type: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    app_only: bool = Query(True)
+):
+    """Top allocation sites now; the snapshot becomes the baseline for /diff"""
+    if not tracemalloc.is_tracing():
+        raise HTTPException(status_code=409, detail="Memory tracing is not running")
+    return await asyncio.to_thread(take_snapshot, limit, key_type, app_only)
+
+@api_router.get("/admin/tracemalloc/diff", dependencies=[Depends(require_admin)])
+async def diff_memory(
+    limit: int = Query(25, ge=1, le=500),
+    key_type: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    app_only: bool = Query(True)
+):
+    """Allocation growth since the last snapshot"""
+    if not tracemalloc.is_tracing() or "baseline" not in memory_snapshots:
+        raise HTTPException(status_code=409, detail="Take a snapshot first")
+    return await asyncio.to_thread(diff_snapshot, limit, key_type, app_only)
+
+@api_router.get("/admin/slow-queries", dependencies=[Depends(require_admin)])
+async def get_slow_queries(limit: int = Query(50, ge=1, le=1000)):
+    """The slowest recent statements, newest first; see slowquery.py"""
+    return slow_query_log.recent(limit)
+
+@api_router.delete("/admin/slow-queries", dependencies=[Depends(require_admin)])
+async def clear_slow_queries():
+    slow_query_log.clear()
+    return {"message": "Slow query log cleared"}
+
+async def get_graphql_context(db: Session = Depends(get_db)):
+    return create_graphql_context(db, run_search)
 
 # Include the router in the main app
 app.include_router(api_router)
+app.include_router(GraphQLRouter(graphql_schema, context_getter=get_graphql_context), prefix="/api/graphql")
+
+background_tasks = []
+
+@app.on_event("startup")
+async def start_background_jobs():
+    background_tasks.append(asyncio.create_task(monitor_event_loop_lag()))
+    if db_available:
+        background_tasks.append(asyncio.create_task(run_retention_jobs()))
+        # Titles of rows stored before media_item_titles existed, or imported by ingest.py
+        background_tasks.append(asyncio.create_task(asyncio.to_thread(backfill_titles)))
+    if CACHE_WARMING_ENABLED:
+        background_tasks.append(asyncio.create_task(run_cache_warming(refresh_search)))
+    if SUGGEST_ENABLED and db_available:
+        background_tasks.append(asyncio.create_task(run_suggest_index()))
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    for task in background_tasks:
+        task.cancel()
+    if db_available:
+        # Do not lose the accesses recorded since the last flush
+        await asyncio.to_thread(write_access_times, access_tracker.drain())
+
+# Added before CORS so that 429 responses still carry the CORS headers
+if RATE_LIMITING_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -1200,5 +2079,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if admin_enabled():
+    app.add_middleware(ProfilingMiddleware)
+app.add_middleware(InFlightMiddleware)
+app.add_middleware(QueryCountMiddleware)
+# Outermost, so the reported total covers the other middleware too
+app.add_middleware(TimingMiddleware)
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
\ No newline at end of file
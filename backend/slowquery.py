@@ -0,0 +1,195 @@
+import logging
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+
+from sqlalchemy import event
+
+from metrics import counter, histogram
+
+# Slow query log.
+#
+# Every statement slower than SLOW_QUERY_THRESHOLD_MS is kept, with its
+# parameters and the backend line that issued it, in a ring buffer of the
+# last SLOW_QUERY_BUFFER_SIZE entries (GET /api/admin/slow-queries). Slow
+# SELECTs are re-run as EXPLAIN (ANALYZE, BUFFERS) on a separate connection
+# in a background thread - at most once per statement per cooldown - and the
+# plan is attached to the entry. SLOW_QUERY_EXPLAIN=0 turns that off.
+#
+# Independently, the number of statements per request is counted for every
+# request; requests issuing more than SLOW_QUERY_MAX_PER_REQUEST are logged,
+# which is how N+1 loops show up.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+SLOW_QUERY_BUFFER_SIZE = int(os.environ.get('SLOW_QUERY_BUFFER_SIZE', 200))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', '1') != '0'
+SLOW_QUERY_MAX_PER_REQUEST = int(os.environ.get('SLOW_QUERY_MAX_PER_REQUEST', 100))
+EXPLAIN_COOLDOWN_SECONDS = 300
+MAX_PARAMETER_LENGTH = 200
+MAX_STATEMENT_LENGTH = 5000
+MAX_EXPLAINED_STATEMENTS = 1000
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Frames in these files are plumbing, not the caller
+INTERNAL_FILES = {os.path.join(BACKEND_DIR, name) for name in ("slowquery.py", "timing.py", "database.py")}
+
+slow_queries_total = counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_THRESHOLD_MS")
+queries_per_request = histogram(
+    "db_queries_per_request", "Statements issued while handling one request", ["endpoint"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 500, 1000)
+)
+
+# [statement count] of the request being handled
+current_query_count = ContextVar("request_query_count", default=None)
+current_request_path = ContextVar("request_path", default=None)
+
+
+def shorten(value, limit: int):
+    text = repr(value) if not isinstance(value, str) else value
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def format_parameters(parameters):
+    if isinstance(parameters, dict):
+        return {key: shorten(value, MAX_PARAMETER_LENGTH) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [shorten(value, MAX_PARAMETER_LENGTH) for value in parameters]
+    return shorten(parameters, MAX_PARAMETER_LENGTH)
+
+
+def find_call_site():
+    """The innermost backend frame outside the database plumbing"""
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(BACKEND_DIR) and frame.filename not in INTERNAL_FILES:
+            return f"{os.path.basename(frame.filename)}:{frame.lineno} in {frame.name}"
+    return None
+
+
+def explainable(statement: str, executemany: bool):
+    # ANALYZE runs the statement: only plain reads, never anything that writes or locks
+    text = statement.lstrip().lower()
+    return not executemany and text.startswith(("select", "with")) and " for update" not in text and not any(
+        keyword in text for keyword in ("insert ", "update ", "delete ")
+    )
+
+
+class SlowQueryLog:
+    def __init__(self, engine=None, size: int = SLOW_QUERY_BUFFER_SIZE):
+        self.engine = engine
+        self.entries = deque(maxlen=size)
+        self.sequence = 0
+        self.lock = threading.Lock()
+        self.explain_queue = queue.Queue(maxsize=100)
+        self.explained_at = {}
+        self.explain_thread = None
+
+    def add(self, statement, parameters, duration, executemany):
+        with self.lock:
+            self.sequence += 1
+            entry = {
+                "id": self.sequence,
+                "at": datetime.utcnow().isoformat() + "Z",
+                "duration_ms": round(duration * 1000, 2),
+                "statement": shorten(statement, MAX_STATEMENT_LENGTH),
+                "parameters": format_parameters(parameters),
+                "executemany": executemany,
+                "call_site": find_call_site(),
+                "request_path": current_request_path.get(),
+                "explain": None
+            }
+            self.entries.append(entry)
+        slow_queries_total.inc()
+        logging.warning(f"Slow query ({entry['duration_ms']} ms) at {entry['call_site']}: {shorten(statement, 300)}")
+        if SLOW_QUERY_EXPLAIN and self.engine is not None and explainable(statement, executemany):
+            self.schedule_explain(entry, statement, parameters)
+
+    def schedule_explain(self, entry, statement, parameters):
+        now = time.monotonic()
+        if now - self.explained_at.get(statement, -EXPLAIN_COOLDOWN_SECONDS) < EXPLAIN_COOLDOWN_SECONDS:
+            entry["explain"] = "skipped: explained recently"
+            return
+        if len(self.explained_at) >= MAX_EXPLAINED_STATEMENTS:
+            self.explained_at.clear()
+        self.explained_at[statement] = now
+        if self.explain_thread is None:
+            self.explain_thread = threading.Thread(target=self.run_explains, name="slow-query-explain", daemon=True)
+            self.explain_thread.start()
+        try:
+            self.explain_queue.put_nowait((entry, statement, parameters))
+        except queue.Full:
+            entry["explain"] = "skipped: explain queue full"
+
+    def run_explains(self):
+        while True:
+            entry, statement, parameters = self.explain_queue.get()
+            try:
+                with self.engine.connect() as conn:
+                    rows = conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters).fetchall()
+                    conn.rollback()
+                entry["explain"] = "\n".join(row[0] for row in rows)
+            except Exception as e:
+                entry["explain"] = f"failed: {str(e)}"
+
+    def recent(self, limit: int):
+        with self.lock:
+            return list(self.entries)[-limit:][::-1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+slow_query_log = SlowQueryLog()
+
+
+def install_slow_query_log(engine):
+    """Time every statement on `engine`; count it for the current request and log it if slow"""
+    if engine is None:
+        return
+    # EXPLAIN (ANALYZE, BUFFERS) is PostgreSQL syntax
+    slow_query_log.engine = engine if engine.dialect.name == "postgresql" else None
+    threshold = SLOW_QUERY_THRESHOLD_MS / 1000
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_statement(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_statement(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("slow_query_started")
+        if not started:
+            return
+        duration = time.perf_counter() - started.pop()
+        count = current_query_count.get()
+        if count is not None:
+            count[0] += 1
+        if duration >= threshold:
+            slow_query_log.add(statement, parameters, duration, executemany)
+
+
+class QueryCountMiddleware:
+    """ASGI middleware counting the statements issued by each request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        count = [0]
+        count_token = current_query_count.set(count)
+        path_token = current_request_path.set(scope["path"])
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_query_count.reset(count_token)
+            current_request_path.reset(path_token)
+            # The router stores the matched endpoint in the scope
+            endpoint = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            queries_per_request.observe(count[0], endpoint=endpoint)
+            if count[0] > SLOW_QUERY_MAX_PER_REQUEST:
+                logging.warning(f"{scope['method']} {scope['path']} issued {count[0]} queries")
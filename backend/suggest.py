@@ -0,0 +1,329 @@
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+from array import array
+from bisect import insort
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from database import MediaItem, MediaItemTitle, session_scope
+from metrics import counter, gauge
+from titles import TITLED_ITEMS_KEY, normalize_title
+
+# Typeahead suggestions.
+#
+# An in-process index over the titles of media_items and their alternate
+# titles (media_item_titles), answering GET /api/suggest without touching the
+# database or a provider. Every word of a normalized title is indexed by its
+# first 1..GRAM_LENGTH characters; a posting list holds the title entries
+# having a word with that prefix, most popular first. A query scans the
+# posting list of its most selective word, keeps the entries whose words
+# start with every query word, and stops after enough candidates, so the
+# cost does not grow with the catalog. Titles starting with the query rank
+# before those that only contain it, then by popularity.
+#
+# Popularity is the provider's popularity score where there is one (TMDB,
+# ingested exports), otherwise the rating.
+#
+# The index is built from the database at startup and rebuilt every
+# SUGGEST_REBUILD_INTERVAL seconds (picking up ingest.py runs and retention's
+# evictions). In between, sessions that write titles (titles.store_titles)
+# record the media items on commit, and those are re-read and added within
+# about a second. Without a database the titles of search results are indexed
+# as they are returned.
+SUGGEST_ENABLED = os.environ.get('SUGGEST_INDEX', '1') != '0'
+REBUILD_INTERVAL_SECONDS = int(os.environ.get('SUGGEST_REBUILD_INTERVAL', 21600))
+REFRESH_INTERVAL_SECONDS = 1.0
+# More pending items than this are cheaper to pick up with a rebuild
+REBUILD_PENDING_THRESHOLD = 50000
+REBUILD_RETRY_SECONDS = 60
+REFRESH_BATCH_SIZE = 2000
+LOAD_BATCH_SIZE = 10000
+GRAM_LENGTH = 3
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+CANDIDATES_PER_RESULT = 4
+# Bounds the work of a query whose words are all common
+MAX_SCANNED_ENTRIES = 5000
+
+index_titles = gauge("suggest_index_titles", "Title forms in the typeahead index")
+index_items = gauge("suggest_index_items", "Media items in the typeahead index")
+index_builds = counter("suggest_index_builds_total", "Typeahead index builds and refreshes", ["kind", "outcome"])
+
+
+class SuggestIndex:
+    """Word-prefix index over title forms, posting lists ordered by popularity"""
+
+    def __init__(self):
+        # Per media item (slot), keyed by (media_type, external_id)
+        self.slots = {}
+        self.item_ids = []
+        self.item_media_types = []
+        self.item_titles = []
+        self.item_years = array('H')  # 0 when unknown
+        self.item_popularity = array('d')
+        self.item_forms = []
+        # Per title form (entry)
+        self.entry_slots = array('I')
+        self.entry_forms = []
+        self.entry_titles = []
+        # (media_type, word prefix) -> entries, and (None, word prefix) over all media types
+        self.postings = {}
+
+    def __len__(self):
+        return len(self.entry_slots)
+
+    def entry_rank(self, entry: int):
+        return -self.item_popularity[self.entry_slots[entry]]
+
+    def add(self, item_id: str, external_id: str, media_type: str, title: str, year, popularity, forms=()):
+        """Add or update a media item; `forms` are its other (normalized, title) forms"""
+        key = (media_type, external_id)
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = len(self.item_ids)
+            self.slots[key] = slot
+            self.item_ids.append(item_id)
+            self.item_media_types.append(media_type)
+            self.item_titles.append(title)
+            self.item_years.append(year or 0)
+            self.item_popularity.append(popularity or 0)
+            self.item_forms.append(())
+        else:
+            # A changed popularity leaves the item's entries where they are until the next rebuild
+            self.item_ids[slot] = item_id
+            self.item_titles[slot] = title
+            self.item_years[slot] = year or 0
+            self.item_popularity[slot] = popularity or 0
+
+        known = self.item_forms[slot]
+        # The stored forms usually include the display title's
+        normalized_title = next((normalized for normalized, text in forms if text == title), None)
+        new_forms = {}
+        for normalized, text in [(normalized_title or normalize_title(title), title), *forms]:
+            if normalized and normalized not in known:
+                new_forms.setdefault(normalized, text)
+        if not new_forms:
+            return
+        self.item_forms[slot] = known + tuple(new_forms)
+        popularity = self.item_popularity[slot]
+        for normalized, text in new_forms.items():
+            entry = len(self.entry_slots)
+            self.entry_slots.append(slot)
+            self.entry_forms.append(normalized)
+            self.entry_titles.append(text)
+            grams = {word[:length] for word in normalized.split() for length in range(1, GRAM_LENGTH + 1)}
+            for key in itertools.chain(((media_type, gram) for gram in grams), ((None, gram) for gram in grams)):
+                posting = self.postings.get(key)
+                if posting is None:
+                    self.postings[key] = array('I', [entry])
+                elif self.item_popularity[self.entry_slots[posting[-1]]] >= popularity:
+                    # Items arrive most popular first when the index is built
+                    posting.append(entry)
+                else:
+                    insort(posting, entry, key=self.entry_rank)
+
+    def suggest(self, query: str, media_type: str = None, limit: int = DEFAULT_LIMIT, excluded=frozenset()):
+        """Items with a title whose words start with every word of `query`; any media type when None
+
+        Items whose id is in `excluded` are skipped.
+        """
+        words = normalize_title(query).split()
+        if not words:
+            return []
+        phrase = " ".join(words)
+        # The posting list of the query word with the fewest entries
+        posting = min((self.postings.get((media_type, word[:GRAM_LENGTH]), ()) for word in set(words)), key=len)
+        found = {}  # slot -> (starts with the query, entry)
+        for entry in itertools.islice(posting, MAX_SCANNED_ENTRIES):
+            slot = self.entry_slots[entry]
+            if (slot in found and found[slot][0]) or self.item_ids[slot] in excluded:
+                continue
+            form = self.entry_forms[entry]
+            # Substring tests reject most entries before the word-by-word check
+            if not all(word in form for word in words):
+                continue
+            form_words = form.split()
+            if not all(any(form_word.startswith(word) for form_word in form_words) for word in words):
+                continue
+            leading = form.startswith(phrase)
+            if slot not in found or leading:
+                found[slot] = (leading, entry)
+                if len(found) >= limit * CANDIDATES_PER_RESULT:
+                    break
+
+        ranked = sorted(found.items(), key=lambda match: (not match[1][0], -self.item_popularity[match[0]]))
+        suggestions = []
+        for slot, (_, entry) in ranked[:limit]:
+            title = self.item_titles[slot]
+            matched = self.entry_titles[entry]
+            suggestions.append({
+                "id": self.item_ids[slot],
+                "title": title,
+                # Set when the query matched an alternate title
+                "matched_title": matched if matched != title else None,
+                "media_type": self.item_media_types[slot],
+                "year": self.item_years[slot] or None,
+                "popularity": self.item_popularity[slot]
+            })
+        return suggestions
+
+
+def item_popularity(popularity, vote_average, rating):
+    if popularity is not None:
+        return popularity
+    if vote_average is not None:
+        return vote_average
+    # IGDB rates out of 100
+    return rating / 10 if rating is not None else 0
+
+
+POPULARITY = func.coalesce(
+    MediaItem.additional_data["popularity"].as_float(), MediaItem.vote_average, MediaItem.rating / 10, 0
+)
+
+
+def load_items(db, media_item_ids=None):
+    """(id, external_id, media_type, title, year, popularity, forms) of media items, most popular first"""
+    query = (
+        select(MediaItem.id, MediaItem.external_id, MediaItem.media_type, MediaItem.title, MediaItem.year,
+               POPULARITY, MediaItemTitle.normalized_title, MediaItemTitle.title)
+        .outerjoin(MediaItemTitle, MediaItemTitle.media_item_id == MediaItem.id)
+        .where(MediaItem.external_id.is_not(None), MediaItem.title.is_not(None))
+        .order_by(POPULARITY.desc(), MediaItem.id)
+        .execution_options(yield_per=LOAD_BATCH_SIZE)
+    )
+    if media_item_ids is not None:
+        query = query.where(MediaItem.id.in_(media_item_ids))
+    for _, rows in itertools.groupby(db.execute(query), key=lambda row: row[0]):
+        rows = list(rows)
+        item_id, external_id, media_type, title, year, popularity = rows[0][:6]
+        forms = [(normalized, text) for *_, normalized, text in rows if normalized]
+        yield item_id, external_id, media_type, title, year, popularity, forms
+
+
+def build_index():
+    index = SuggestIndex()
+    with session_scope() as db:
+        if db is not None:
+            for item in load_items(db):
+                index.add(*item)
+    return index
+
+
+def read_items(media_item_ids):
+    with session_scope() as db:
+        if db is None:
+            return []
+        return list(load_items(db, media_item_ids))
+
+
+class Suggester:
+    """The current index, and the media items written since it was last refreshed"""
+
+    def __init__(self):
+        self.index = SuggestIndex()
+        self.pending = set()
+        # Ids evicted by retention since the index was built
+        self.evicted = set()
+        # Set while run_suggest_index runs, the only one emptying the sets above
+        self.active = False
+        self.lock = threading.Lock()
+
+    def mark(self, media_item_ids):
+        if not self.active:
+            return
+        with self.lock:
+            self.pending.update(media_item_ids)
+
+    def take_pending(self):
+        with self.lock:
+            media_item_ids, self.pending = self.pending, set()
+        return media_item_ids
+
+    def forget(self, media_item_ids):
+        """Stop suggesting evicted media items until the next rebuild, which leaves them out"""
+        if not self.active:
+            return
+        with self.lock:
+            self.evicted.update(media_item_ids)
+
+    def suggest(self, query: str, media_type: str = None, limit: int = DEFAULT_LIMIT):
+        return self.index.suggest(query, media_type, limit, self.evicted)
+
+    def add_results(self, results):
+        """Index search results (MediaItemResponse) directly; used without a database"""
+        for result in results:
+            self.index.add(result.id, result.external_id, result.media_type, result.title, result.year,
+                           item_popularity(None, result.vote_average, result.rating))
+        self.update_gauges()
+
+    def update_gauges(self):
+        index_titles.set(len(self.index))
+        index_items.set(len(self.index.item_ids))
+
+    async def rebuild(self):
+        # Items written while the build runs stay pending and are added afterwards,
+        # and items evicted meanwhile stay excluded
+        self.take_pending()
+        with self.lock:
+            self.evicted = set()
+        started = time.monotonic()
+        self.index = await asyncio.to_thread(build_index)
+        self.update_gauges()
+        logging.info(f"Built the suggestion index: {len(self.index)} titles of {len(self.index.item_ids)} media items "
+                     f"in {time.monotonic() - started:.1f}s")
+
+    async def refresh(self):
+        media_item_ids = list(self.take_pending())
+        for start in range(0, len(media_item_ids), REFRESH_BATCH_SIZE):
+            for item in await asyncio.to_thread(read_items, media_item_ids[start:start + REFRESH_BATCH_SIZE]):
+                self.index.add(*item)
+        if media_item_ids:
+            self.update_gauges()
+
+
+suggester = Suggester()
+
+
+@event.listens_for(Session, "after_commit")
+def mark_committed_titles(session):
+    media_item_ids = session.info.pop(TITLED_ITEMS_KEY, None)
+    if media_item_ids:
+        suggester.mark(media_item_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_rolled_back_titles(session):
+    session.info.pop(TITLED_ITEMS_KEY, None)
+
+
+async def run_suggest_index():
+    """Build the index, then keep adding written items and rebuild it periodically"""
+    next_build = 0
+    suggester.active = True
+    try:
+        while True:
+            rebuild = time.monotonic() >= next_build or len(suggester.pending) > REBUILD_PENDING_THRESHOLD
+            kind = "rebuild" if rebuild else "refresh"
+            try:
+                if rebuild:
+                    await suggester.rebuild()
+                    next_build = time.monotonic() + REBUILD_INTERVAL_SECONDS
+                    index_builds.inc(kind=kind, outcome="ok")
+                elif suggester.pending:
+                    await suggester.refresh()
+                    index_builds.inc(kind=kind, outcome="ok")
+            except Exception as e:
+                # Items of a failed refresh are picked up by the next rebuild
+                index_builds.inc(kind=kind, outcome="error")
+                logging.error(f"Suggestion index {kind} failed: {str(e)}")
+                if rebuild:
+                    next_build = time.monotonic() + REBUILD_RETRY_SECONDS
+            await asyncio.sleep(REFRESH_INTERVAL_SECONDS)
+    finally:
+        suggester.active = False
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import random
+import time
+from contextvars import ContextVar
+from datetime import datetime
+
+from sqlalchemy import event
+from starlette.responses import JSONResponse
+
+# Per-request timing breakdown.
+#
+# A sampled request collects named spans - "db" for every statement, one per
+# provider ("tmdb", "anilist", ...) plus "<provider>-wait" for time queued for a
+# provider slot (outbound.py), "upsert" for persisting provider results and
+# "serialize" for JSON encoding - and reports them as a Server-Timing header
+# and one JSON line on the media_trakker.access logger. TIMING_SAMPLE_RATE is
+# the sampled fraction of requests (0 turns timing off; unsampled requests pay
+# one random() call and every span is a shared no-op).
+TIMING_SAMPLE_RATE = float(os.environ.get('TIMING_SAMPLE_RATE', 0))
+
+access_logger = logging.getLogger("media_trakker.access")
+# Independent of the root level, which is WARNING if anything logged before basicConfig
+access_logger.setLevel(logging.INFO)
+current_timings = ContextVar("request_timings", default=None)
+
+
+class Timings:
+    """Total seconds and count per span name for one request"""
+
+    def __init__(self):
+        self.spans = {}
+
+    def add(self, name: str, seconds: float):
+        span = self.spans.get(name)
+        if span is None:
+            self.spans[name] = [seconds, 1]
+        else:
+            span[0] += seconds
+            span[1] += 1
+
+    def server_timing(self, total: float):
+        entries = [f"{name};dur={seconds * 1000:.1f};desc=\"{count}x\"" for name, (seconds, count) in self.spans.items()]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+    def as_dict(self):
+        return {name: {"ms": round(seconds * 1000, 2), "count": count} for name, (seconds, count) in self.spans.items()}
+
+
+class Span:
+    __slots__ = ("name", "timings", "started")
+
+    def __init__(self, name: str, timings: Timings):
+        self.name = name
+        self.timings = timings
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timings.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+def span(name: str):
+    """Context manager timing a block into the current request's `name` span, if sampled"""
+    timings = current_timings.get()
+    if timings is None:
+        return NOOP_SPAN
+    return Span(name, timings)
+
+
+def record(name: str, seconds: float):
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse whose encoding is reported as the "serialize" span"""
+
+    def render(self, content) -> bytes:
+        with span("serialize"):
+            return super().render(content)
+
+
+def install_db_timing(engine):
+    """Report every statement run on `engine` as the "db" span of the request running it"""
+    if engine is None:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_statement(conn, cursor, statement, parameters, context, executemany):
+        if current_timings.get() is not None:
+            conn.info.setdefault("timing_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_statement(conn, cursor, statement, parameters, context, executemany):
+        timings = current_timings.get()
+        if timings is not None and conn.info.get("timing_started"):
+            timings.add("db", time.perf_counter() - conn.info["timing_started"].pop())
+
+
+class TimingMiddleware:
+    """ASGI middleware adding Server-Timing and a JSON access log line to sampled requests"""
+
+    def __init__(self, app, sample_rate: float = TIMING_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        timings = Timings()
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.server_timing(time.perf_counter() - started).encode("latin-1")))
+                headers.append((b"timing-allow-origin", b"*"))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_timings.reset(token)
+            client = scope.get("client")
+            access_logger.info(json.dumps({
+                "ts": datetime.utcnow().isoformat() + "Z",
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                "client": client[0] if client else None,
+                "spans": timings.as_dict()
+            }))
@@ -0,0 +1,108 @@
+import logging
+import unicodedata
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from database import MediaItem, MediaItemTitle, session_scope
+
+# Alternate titles of media items.
+#
+# media_items keeps one display title, but a title can be searched in other
+# forms: AniList's english, romaji and native titles and synonyms, and TMDB's
+# original title. Every known form is kept in media_item_titles, normalized so
+# that case, Unicode width and compatibility forms, punctuation and symbols do
+# not matter ("Kaguya-sama: Love Is War" and "kaguya sama love is war" are the
+# same). Search matches normalized queries against it by prefix.
+BACKFILL_BATCH_SIZE = 5000
+# Session.info key of the media items whose titles the session wrote; the
+# suggestion index re-reads them once the session commits (suggest.py)
+TITLED_ITEMS_KEY = "titled_media_items"
+
+
+def normalize_title(title):
+    """Case-folded NFKC form of a title, with punctuation and symbols removed and spaces collapsed"""
+    if not title:
+        return ""
+    text = unicodedata.normalize("NFKC", unicodedata.normalize("NFKC", title).casefold())
+    text = "".join(" " if unicodedata.category(char)[0] in "PS" else char for char in text)
+    return " ".join(text.split())
+
+
+def tmdb_titles(details):
+    """(kind, title) pairs of a TMDB movie or TV details payload"""
+    return [
+        ("title", details.get("title") or details.get("name")),
+        ("original", details.get("original_title") or details.get("original_name"))
+    ]
+
+
+def anilist_titles(item):
+    title = item.get("title") or {}
+    return [(kind, title.get(kind)) for kind in ("english", "romaji", "native")] + [
+        ("synonym", synonym) for synonym in item.get("synonyms") or []
+    ]
+
+
+def store_titles(db, entries, keep_empty: bool = False):
+    """Add (media_item_id, media_type, kind, title) entries, ignoring forms already known; the caller commits"""
+    rows = {}
+    for media_item_id, media_type, kind, title in entries:
+        normalized = normalize_title(title)
+        if normalized or keep_empty:
+            rows.setdefault((media_item_id, normalized), {
+                "media_item_id": media_item_id,
+                "normalized_title": normalized,
+                "title": title,
+                "kind": kind,
+                "media_type": media_type
+            })
+    if rows:
+        db.execute(pg_insert(MediaItemTitle).values(list(rows.values())).on_conflict_do_nothing(
+            index_elements=["media_item_id", "normalized_title"]
+        ))
+        db.info.setdefault(TITLED_ITEMS_KEY, set()).update(media_item_id for media_item_id, _ in rows)
+
+
+def store_item_titles(db, media_item, titles):
+    """Record a stored media item's display title and the given (kind, title) forms"""
+    try:
+        store_titles(db, [
+            (media_item.id, media_item.media_type, kind, title)
+            for kind, title in [("title", media_item.title)] + list(titles)
+        ])
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Error storing alternate titles: {str(e)}")
+
+
+def backfill_batch(batch_size: int):
+    with session_scope() as db:
+        if db is None:
+            return 0
+        rows = db.execute(
+            select(MediaItem.id, MediaItem.media_type, MediaItem.title)
+            .where(~select(MediaItemTitle.media_item_id).where(MediaItemTitle.media_item_id == MediaItem.id).exists())
+            .limit(batch_size)
+        ).all()
+        # Titles that normalize to nothing are kept as "", so their rows are not selected again
+        store_titles(db, [(media_id, media_type, "title", title) for media_id, media_type, title in rows], keep_empty=True)
+        db.commit()
+        return len(rows)
+
+
+def backfill_titles(batch_size: int = BACKFILL_BATCH_SIZE):
+    """Index the display title of rows that have no titles yet (rows from before this table, imports)"""
+    total = 0
+    try:
+        while True:
+            count = backfill_batch(batch_size)
+            total += count
+            if count < batch_size:
+                break
+    except Exception as e:
+        logging.error(f"Title backfill failed: {str(e)}")
+    if total:
+        logging.info(f"Indexed the titles of {total} media items")
+    return total
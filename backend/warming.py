@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from cache import cache
+from database import MediaItem, db_available, session_scope
+from metrics import counter
+from outbound import BACKGROUND, outbound_priority
+from providers import (
+    TMDB_API_KEY, get_tmdb_feed, get_anilist_feed, get_movie_details, get_tv_details,
+    media_data_from_tmdb_movie, media_data_from_tmdb_tv, media_data_from_anilist
+)
+from retention import access_tracker
+from titles import anilist_titles, store_titles, tmdb_titles
+
+# Background cache warming.
+#
+# Fills media_items from the provider feeds (TMDB trending/popular, AniList
+# trending and the current season) so that popular titles are found by the
+# database search without a provider round trip, and keeps the search cache
+# entries of the most frequent queries fresh so they never expire in front of
+# a user. Warming only runs while no interactive search is in flight, spaces
+# its provider calls out per provider and queues them in the background class.
+CACHE_WARMING_ENABLED = os.environ.get('CACHE_WARMING', '1') != '0'
+FEED_INTERVAL_SECONDS = int(os.environ.get('CACHE_WARM_FEED_INTERVAL', 21600))
+# Below SEARCH_CACHE_TTL, so a refreshed entry is replaced before it expires
+QUERY_INTERVAL_SECONDS = int(os.environ.get('CACHE_WARM_QUERY_INTERVAL', 3000))
+TOP_QUERIES = int(os.environ.get('CACHE_WARM_TOP_QUERIES', 100))
+STARTUP_DELAY_SECONDS = 60
+QUERY_LOG_MAX_ENTRIES = 10000
+UPSERT_BATCH_SIZE = 500
+# Minimum spacing of warming calls per provider, well inside the published
+# limits (TMDB ~40/s, AniList 90/min) so interactive traffic keeps its headroom
+PROVIDER_CALL_INTERVAL = {"tmdb": 0.25, "anilist": 1.0, "google_books": 1.0, "igdb": 0.5}
+SEARCH_PROVIDERS = {"movie": "tmdb", "tv": "tmdb", "anime": "anilist", "manga": "anilist", "book": "google_books", "game": "igdb"}
+FOREGROUND_POLL_INTERVAL = 0.05
+
+TMDB_FEEDS = [
+    ("movie", "trending/movie/week"),
+    ("movie", "movie/popular"),
+    ("tv", "trending/tv/week"),
+    ("tv", "tv/popular"),
+]
+
+warmed_items = counter("cache_warming_items_total", "media_items rows written by cache warming", ["feed"])
+warmed_queries = counter("cache_warming_queries_total", "Search cache entries refreshed by cache warming")
+warming_errors = counter("cache_warming_errors_total", "Failed cache warming steps", ["step"])
+
+
+class QueryLog:
+    """Counts first-page searches per (media_type, normalized query)"""
+
+    def __init__(self, max_entries: int = QUERY_LOG_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.counts = Counter()
+
+    def record(self, media_type: str, normalized_query: str):
+        self.counts[(media_type, normalized_query)] += 1
+        if len(self.counts) > self.max_entries * 2:
+            self.counts = Counter(dict(self.counts.most_common(self.max_entries)))
+
+    def top(self, n: int):
+        return [key for key, _ in self.counts.most_common(n)]
+
+    def decay(self):
+        # Halve after every warming round so yesterday's popular queries fade out
+        self.counts = Counter({key: count // 2 for key, count in self.counts.items() if count > 1})
+
+
+class ForegroundTraffic:
+    """Number of interactive searches in flight; warming waits while it is non-zero"""
+
+    def __init__(self):
+        self.active = 0
+
+    @contextmanager
+    def track(self):
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+
+    async def wait_until_idle(self):
+        while self.active:
+            await asyncio.sleep(FOREGROUND_POLL_INTERVAL)
+
+
+class ProviderThrottle:
+    """Spaces out background calls to each provider"""
+
+    def __init__(self, intervals):
+        self.intervals = intervals
+        self.last_call = {}
+
+    async def wait(self, provider: str):
+        delay = self.last_call.get(provider, 0) + self.intervals.get(provider, 1.0) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await foreground.wait_until_idle()
+        self.last_call[provider] = time.monotonic()
+
+
+query_log = QueryLog()
+foreground = ForegroundTraffic()
+throttle = ProviderThrottle(PROVIDER_CALL_INTERVAL)
+
+MEDIA_ITEM_DATA_COLUMNS = [
+    column.name for column in MediaItem.__table__.columns
+    if column.name not in ("id", "additional_data", "catalog_source", "last_accessed_at", "created_at", "updated_at")
+]
+
+
+def upsert_media_items(db, rows):
+    """Insert or refresh media_items rows in batches; returns {(external_id, media_type): id}
+
+    A row's optional "alternate_titles" ((kind, title) pairs) are added to media_item_titles.
+    """
+    # One row per key: a statement may not update the same row twice
+    unique_rows = {(row["external_id"], row["media_type"]): row for row in rows}
+    ids = {}
+    now = datetime.utcnow()
+    values = [
+        {"id": str(uuid.uuid4()), **{name: row.get(name) for name in MEDIA_ITEM_DATA_COLUMNS}, "created_at": now, "updated_at": now}
+        for row in unique_rows.values()
+    ]
+    for start in range(0, len(values), UPSERT_BATCH_SIZE):
+        statement = pg_insert(MediaItem).values(values[start:start + UPSERT_BATCH_SIZE])
+        statement = statement.on_conflict_do_update(
+            index_elements=["external_id", "media_type"],
+            set_={**{name: statement.excluded[name] for name in MEDIA_ITEM_DATA_COLUMNS}, "updated_at": statement.excluded.updated_at}
+        ).returning(MediaItem.id, MediaItem.external_id, MediaItem.media_type)
+        for media_id, external_id, media_type in db.execute(statement):
+            ids[(external_id, media_type)] = media_id
+    store_titles(db, [
+        (ids[key], row["media_type"], kind, title)
+        for key, row in unique_rows.items() if key in ids
+        for kind, title in [("title", row.get("title"))] + row.get("alternate_titles", [])
+    ])
+    db.commit()
+    return ids
+
+
+def store_media_items(rows):
+    if not rows:
+        return {}
+    with session_scope() as db:
+        if db is None:
+            return {}
+        return upsert_media_items(db, rows)
+
+
+def find_media_items(media_type: str, external_ids):
+    with session_scope() as db:
+        if db is None:
+            return {}
+        rows = db.execute(
+            select(MediaItem.external_id, MediaItem.id).where(
+                MediaItem.media_type == media_type, MediaItem.external_id.in_(external_ids)
+            )
+        ).all()
+        return dict(rows)
+
+
+def current_anilist_season(today=None):
+    today = today or datetime.utcnow()
+    if today.month == 12:
+        return "WINTER", today.year + 1
+    return ["WINTER", "SPRING", "SUMMER", "FALL"][today.month // 3], today.year
+
+
+async def warm_tmdb_feed(media_type: str, path: str):
+    await throttle.wait("tmdb")
+    results = await get_tmdb_feed(path)
+    external_ids = [str(result["id"]) for result in results if result.get("id")]
+    existing = await asyncio.to_thread(find_media_items, media_type, external_ids)
+    # Trending counts as an access, so retention keeps these rows
+    access_tracker.touch(existing.values())
+
+    # The list payload has genre ids only; rows are built from the details, like search does
+    get_details, to_media_data = (
+        (get_movie_details, media_data_from_tmdb_movie) if media_type == "movie"
+        else (get_tv_details, media_data_from_tmdb_tv)
+    )
+    rows = []
+    for external_id in external_ids:
+        if external_id in existing:
+            continue
+        await throttle.wait("tmdb")
+        details = await get_details(int(external_id))
+        if "id" in details:
+            rows.append({**to_media_data(details), "alternate_titles": tmdb_titles(details)})
+    stored = await asyncio.to_thread(store_media_items, rows)
+    access_tracker.touch(stored.values())
+    warmed_items.inc(len(stored), feed=path)
+
+
+async def warm_anilist_feed(media_type: str, sort: str, season=None, season_year=None):
+    await throttle.wait("anilist")
+    media = await get_anilist_feed(media_type, sort, season, season_year)
+    rows = [{**media_data_from_anilist(item, media_type), "alternate_titles": anilist_titles(item)} for item in media]
+    stored = await asyncio.to_thread(store_media_items, rows)
+    access_tracker.touch(stored.values())
+    warmed_items.inc(len(stored), feed=f"anilist/{media_type}/{season or sort}".lower())
+
+
+async def warm_feeds():
+    if not db_available:
+        return
+    feeds = []
+    if TMDB_API_KEY:
+        feeds += [(warm_tmdb_feed, (media_type, path)) for media_type, path in TMDB_FEEDS]
+    season, season_year = current_anilist_season()
+    feeds += [
+        (warm_anilist_feed, ("anime", "TRENDING_DESC")),
+        (warm_anilist_feed, ("anime", "POPULARITY_DESC", season, season_year)),
+        (warm_anilist_feed, ("manga", "TRENDING_DESC")),
+    ]
+    for warm, args in feeds:
+        try:
+            await warm(*args)
+        except Exception as e:
+            warming_errors.inc(step="feed")
+            logging.error(f"Cache warming feed {args} failed: {str(e)}")
+
+
+async def warm_queries(refresh_search):
+    for media_type, normalized_query in query_log.top(TOP_QUERIES):
+        await throttle.wait(SEARCH_PROVIDERS[media_type])
+        try:
+            await refresh_search(normalized_query, media_type)
+            warmed_queries.inc()
+        except Exception as e:
+            warming_errors.inc(step="query")
+            logging.error(f"Cache warming of {media_type} search failed: {str(e)}")
+    query_log.decay()
+
+
+async def claim(step: str, ttl: int):
+    """With a shared cache tier, only one worker runs each step per interval"""
+    if cache.shared is None:
+        return True
+    try:
+        return await cache.shared.add(cache.full_key("lock", f"warming:{step}"), os.getpid(), ttl)
+    except Exception as e:
+        logging.error(f"Shared cache lock failed: {str(e)}")
+        return True
+
+
+async def run_cache_warming(refresh_search):
+    """Background loop; `refresh_search(query, media_type)` reloads one search cache entry"""
+    next_feeds = time.monotonic() + STARTUP_DELAY_SECONDS
+    next_queries = time.monotonic() + QUERY_INTERVAL_SECONDS
+    with outbound_priority(BACKGROUND):
+        while True:
+            await asyncio.sleep(max(min(next_feeds, next_queries) - time.monotonic(), 0))
+            if time.monotonic() >= next_feeds:
+                next_feeds = time.monotonic() + FEED_INTERVAL_SECONDS
+                if await claim("feeds", FEED_INTERVAL_SECONDS):
+                    await warm_feeds()
+            if time.monotonic() >= next_queries:
+                next_queries = time.monotonic() + QUERY_INTERVAL_SECONDS
+                # Every worker logs its own queries, so each refreshes its own top list
+                await warm_queries(refresh_search)
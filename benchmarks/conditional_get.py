@@ -0,0 +1,67 @@
+"""Latency of conditional GETs (304) against full responses (200).
+
+Runs the API in-process and times /api/user-list, /api/stats and
+/api/user-preferences with and without a matching If-None-Match header.
+Uses PostgreSQL when POSTGRES_URL is reachable, the in-memory fallback otherwise.
+
+    python benchmarks/conditional_get.py --items 1000 --requests 500
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import httpx
+import server
+
+ENDPOINTS = ["/api/user-list", "/api/stats", "/api/user-preferences"]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def seed_list(client, items):
+    for start in range(0, items, server.MAX_BATCH_OPERATIONS):
+        batch = [
+            {"media_id": f"bench-{i}", "media_type": "movie", "status": "planning", "title": f"Bench title {i}"}
+            for i in range(start, min(items, start + server.MAX_BATCH_OPERATIONS))
+        ]
+        response = await client.post("/api/user-list/batch", json={"add": batch})
+        response.raise_for_status()
+
+
+async def time_requests(client, path, headers, count):
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = await client.get(path, headers=headers)
+        samples.append((time.perf_counter() - started) * 1e6)
+        assert response.status_code in (200, 304), response.status_code
+    return samples
+
+
+async def main(items, count):
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await seed_list(client, items)
+        print(f"{'endpoint':<24}{'status':>8}{'p50 us':>12}{'p95 us':>12}{'p99 us':>12}")
+        for path in ENDPOINTS:
+            etag = (await client.get(path)).headers["etag"]
+            for label, headers in (("200", {}), ("304", {"If-None-Match": etag})):
+                samples = await time_requests(client, path, headers, count)
+                print(f"{path:<24}{label:>8}{statistics.median(samples):>12.1f}"
+                      f"{percentile(samples, 95):>12.1f}{percentile(samples, 99):>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=1000, help="list entries to seed")
+    parser.add_argument("--requests", type=int, default=500, help="timed requests per case")
+    args = parser.parse_args()
+    asyncio.run(main(args.items, args.requests))
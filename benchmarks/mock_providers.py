@@ -0,0 +1,213 @@
+"""Deterministic local stand-ins for TMDB, AniList, Google Books and IGDB.
+
+An httpx transport answering provider calls with generated payloads of the
+same shape as the real APIs, after a configurable latency and failing a
+configurable fraction of calls. Ids and titles are derived from the query,
+so the same search always returns the same results.
+
+    import providers
+    providers.set_transport_factory(MockProviders(latency=0.05, error_rate=0.01).transport)
+"""
+import asyncio
+import json
+import random
+import zlib
+
+import httpx
+
+PROVIDERS = ("tmdb", "anilist", "google_books", "igdb")
+GENRES = ["Action", "Adventure", "Comedy", "Drama", "Fantasy", "Horror", "Mystery", "Romance", "Sci-Fi", "Thriller"]
+PLATFORMS = ["PC", "PlayStation 5", "Xbox Series X|S", "Nintendo Switch"]
+TMDB_RESULTS_PER_PAGE = 20
+PAGE_SIZE = 10
+
+
+def parse_per_provider(value, default: float):
+    """"0.05" applies to every provider; "tmdb=0.08,igdb=0.2" sets them one by one"""
+    values = dict.fromkeys(PROVIDERS, default)
+    if value is None:
+        return values
+    if "=" not in str(value):
+        return dict.fromkeys(PROVIDERS, float(value))
+    for part in filter(None, str(value).split(",")):
+        name, number = part.split("=", 1)
+        values[name.strip()] = float(number)
+    return values
+
+
+def stable_id(*parts):
+    return zlib.crc32("|".join(str(part) for part in parts).encode()) % 10000000 + 1
+
+
+def pick(items, seed: int, count: int = 2):
+    return [items[(seed + offset * 7) % len(items)] for offset in range(count)]
+
+
+def tmdb_movie(movie_id: int, title: str = None):
+    return {
+        "id": movie_id,
+        "title": title or f"Movie {movie_id}",
+        "original_title": title or f"Movie {movie_id}",
+        "release_date": f"{1970 + movie_id % 55}-0{1 + movie_id % 9}-1{movie_id % 9}",
+        "genres": [{"id": 1, "name": genre} for genre in pick(GENRES, movie_id)],
+        "poster_path": f"/poster{movie_id}.jpg",
+        "backdrop_path": f"/backdrop{movie_id}.jpg",
+        "overview": f"Overview of movie {movie_id}. " * 8,
+        "vote_average": round(4 + movie_id % 60 / 10, 1),
+        "runtime": 90 + movie_id % 60
+    }
+
+
+def tmdb_tv(tv_id: int, title: str = None):
+    return {
+        "id": tv_id,
+        "name": title or f"Show {tv_id}",
+        "original_name": title or f"Show {tv_id}",
+        "first_air_date": f"{1980 + tv_id % 45}-0{1 + tv_id % 9}-1{tv_id % 9}",
+        "genres": [{"id": 1, "name": genre} for genre in pick(GENRES, tv_id)],
+        "poster_path": f"/poster{tv_id}.jpg",
+        "backdrop_path": f"/backdrop{tv_id}.jpg",
+        "overview": f"Overview of show {tv_id}. " * 8,
+        "vote_average": round(4 + tv_id % 60 / 10, 1),
+        "number_of_seasons": 1 + tv_id % 8,
+        "number_of_episodes": 8 + tv_id % 120
+    }
+
+
+def anilist_media(media_id: int, title: str, media_type: str):
+    return {
+        "id": media_id,
+        "title": {"romaji": f"{title} (romaji)", "english": title, "native": f"{title} (native)"},
+        "format": "TV" if media_type == "ANIME" else "MANGA",
+        "status": "FINISHED",
+        "episodes": 12 + media_id % 14 if media_type == "ANIME" else None,
+        "chapters": None if media_type == "ANIME" else 20 + media_id % 200,
+        "volumes": None if media_type == "ANIME" else 1 + media_id % 30,
+        "genres": pick(GENRES, media_id),
+        "averageScore": 50 + media_id % 45,
+        "startDate": {"year": 1990 + media_id % 35, "month": 4, "day": 1},
+        "endDate": {"year": 1991 + media_id % 35, "month": 3, "day": 28},
+        "coverImage": {"large": f"https://img.example/anilist/{media_id}.jpg", "medium": None},
+        "bannerImage": None,
+        "description": f"Description of {title}. " * 8,
+        "studios": {"nodes": [{"name": f"Studio {media_id % 40}"}]}
+    }
+
+
+def google_book(book_id: int, title: str):
+    return {
+        "id": f"book{book_id}",
+        "volumeInfo": {
+            "title": title,
+            "authors": [f"Author {book_id % 500}"],
+            "publisher": f"Publisher {book_id % 50}",
+            "publishedDate": f"{1950 + book_id % 75}-01-01",
+            "description": f"Description of {title}. " * 8,
+            "pageCount": 100 + book_id % 700,
+            "categories": pick(GENRES, book_id, 1),
+            "averageRating": 1 + book_id % 40 / 10,
+            "imageLinks": {"thumbnail": f"https://img.example/books/{book_id}.jpg"}
+        }
+    }
+
+
+def igdb_game(game_id: int, title: str):
+    return {
+        "id": game_id,
+        "name": title,
+        "summary": f"Summary of {title}. " * 8,
+        "cover": {"url": f"//images.igdb.com/t_thumb/{game_id}.jpg", "image_id": f"co{game_id}"},
+        "platforms": [{"name": platform} for platform in pick(PLATFORMS, game_id)],
+        "involved_companies": [
+            {"company": {"name": f"Developer {game_id % 80}"}, "developer": True, "publisher": False},
+            {"company": {"name": f"Publisher {game_id % 30}"}, "developer": False, "publisher": True}
+        ],
+        "first_release_date": 946684800 + game_id % 800 * 86400 * 10,
+        "rating": 50 + game_id % 50,
+        "game_modes": [{"name": "Single player"}],
+        "genres": [{"name": genre} for genre in pick(GENRES, game_id)],
+        "release_dates": [{"human": "2015", "y": 2000 + game_id % 25}],
+        "screenshots": [{"image_id": f"sc{game_id}"}]
+    }
+
+
+def titles(query: str, page: int, count: int):
+    base = (query or "feed").strip().title()
+    return [(stable_id(query, page, index), f"{base} {(page - 1) * count + index + 1}") for index in range(count)]
+
+
+class MockProviders:
+    """Generates provider responses in process"""
+
+    def __init__(self, latency=0.05, error_rate=0.0, jitter: float = 0.5, seed: int = 1):
+        self.latency = parse_per_provider(latency, 0.05)
+        self.error_rate = parse_per_provider(error_rate, 0.0)
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.calls = dict.fromkeys(PROVIDERS, 0)
+        self.errors = dict.fromkeys(PROVIDERS, 0)
+
+    def transport(self, provider: str):
+        """Transport factory for providers.set_transport_factory"""
+        return MockTransport(self, provider)
+
+    def delay(self, provider: str):
+        latency = self.latency.get(provider, 0.0)
+        return latency * self.random.uniform(1 - self.jitter, 1 + self.jitter) if latency else 0.0
+
+    def respond(self, provider: str, request: httpx.Request):
+        self.calls[provider] = self.calls.get(provider, 0) + 1
+        if self.random.random() < self.error_rate.get(provider, 0.0):
+            self.errors[provider] = self.errors.get(provider, 0) + 1
+            return httpx.Response(503, json={"status_message": "Mock provider error"})
+        host, path = request.url.host, request.url.path
+        if host == "api.themoviedb.org":
+            return httpx.Response(200, json=self.tmdb(path, request.url.params))
+        if host == "graphql.anilist.co":
+            return httpx.Response(200, json=self.anilist(json.loads(request.content)["variables"]))
+        if host == "www.googleapis.com":
+            params = request.url.params
+            page = int(params.get("startIndex", 0)) // PAGE_SIZE + 1
+            return httpx.Response(200, json={"items": [google_book(i, t) for i, t in titles(params.get("q"), page, PAGE_SIZE)]})
+        if host == "id.twitch.tv":
+            return httpx.Response(200, json={"access_token": "mock-token", "expires_in": 5000000, "token_type": "bearer"})
+        if host == "api.igdb.com":
+            body = request.content.decode()
+            query = body.split('search "', 1)[1].split('"', 1)[0] if 'search "' in body else ""
+            offset = int(body.split("offset", 1)[1].strip(" ;\n")) if "offset" in body else 0
+            return httpx.Response(200, json=[igdb_game(i, t) for i, t in titles(query, offset // PAGE_SIZE + 1, PAGE_SIZE)])
+        return httpx.Response(404, json={"status_message": f"No mock for {host}{path}"})
+
+    def tmdb(self, path: str, params):
+        page = int(params.get("page", 1))
+        parts = path.strip("/").split("/")[1:]
+        if parts[0] == "search":
+            return {"page": page, "results": [
+                {"id": item_id, "title": title, "name": title}
+                for item_id, title in titles(params.get("query"), page, TMDB_RESULTS_PER_PAGE)
+            ]}
+        if len(parts) == 2 and parts[1].isdigit():
+            item_id = int(parts[1])
+            return tmdb_movie(item_id) if parts[0] == "movie" else tmdb_tv(item_id)
+        # Feeds: trending/movie/week, movie/popular, tv/top_rated, ...
+        build = tmdb_tv if "tv" in parts else tmdb_movie
+        return {"page": page, "results": [build(item_id, title) for item_id, title in titles("/".join(parts), page, TMDB_RESULTS_PER_PAGE)]}
+
+    def anilist(self, variables):
+        media_type = variables.get("type", "ANIME")
+        query = variables.get("search") or "-".join(variables.get("sort") or [])
+        count = variables.get("perPage", PAGE_SIZE)
+        media = [anilist_media(i, t, media_type) for i, t in titles(query, variables.get("page", 1), count)]
+        return {"data": {"Page": {"media": media}}}
+
+
+class MockTransport(httpx.AsyncBaseTransport):
+    def __init__(self, providers: MockProviders, provider: str):
+        self.providers = providers
+        self.provider = provider
+
+    async def handle_async_request(self, request):
+        delay = self.providers.delay(self.provider)
+        if delay:
+            await asyncio.sleep(delay)
+        return self.providers.respond(self.provider, request)
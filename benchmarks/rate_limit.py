@@ -0,0 +1,75 @@
+"""Overhead of the rate limiting middleware on the allowed path.
+
+Times the middleware in front of a no-op ASGI app against the no-op app
+alone, plus the bucket update by itself, with in-process buckets and
+limits high enough that every request is allowed.
+
+    python benchmarks/rate_limit.py --requests 1000000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from ratelimit import RateLimitMiddleware, TokenBuckets
+
+SCOPE = {
+    "type": "http",
+    "method": "GET",
+    "path": "/api/search",
+    "headers": [],
+    "client": ("203.0.113.7", 50000),
+}
+
+
+async def noop_app(scope, receive, send):
+    pass
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def time_app(app, count):
+    started = time.perf_counter_ns()
+    for _ in range(count):
+        await app(SCOPE, receive, send)
+    return (time.perf_counter_ns() - started) / count
+
+
+def time_take(count):
+    buckets = TokenBuckets(rate=1e9, burst=10 ** 9)
+    take = buckets.take
+    started = time.perf_counter_ns()
+    for _ in range(count):
+        take("203.0.113.7", time.monotonic())
+    return (time.perf_counter_ns() - started) / count
+
+
+async def main(count):
+    middleware = RateLimitMiddleware(noop_app, limits={"search": (1e9, 10 ** 9)})
+    # Warm up both paths before measuring
+    await time_app(noop_app, count // 10)
+    await time_app(middleware, count // 10)
+
+    baseline = min([await time_app(noop_app, count) for _ in range(3)])
+    limited = min([await time_app(middleware, count) for _ in range(3)])
+    take = min(time_take(count) for _ in range(3))
+    print(f"{'no-op app':<28}{baseline:>10.0f} ns/request")
+    print(f"{'with rate limiting':<28}{limited:>10.0f} ns/request")
+    print(f"{'added overhead':<28}{limited - baseline:>10.0f} ns/request")
+    print(f"{'bucket take alone':<28}{take:>10.0f} ns/call")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000000)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
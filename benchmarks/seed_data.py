@@ -0,0 +1,273 @@
+"""Fill PostgreSQL with a synthetic catalog and user libraries for scale testing.
+
+Generates media_items across the six media types, with plausible titles,
+genres, platforms, authors and studios, and a library for each of --users
+synthetic users. Library sizes are log-normal: most users have a few dozen
+items, a few have thousands. Popular titles appear in many libraries
+(--popularity-skew). Rows are bulk-loaded with COPY (default) or batched
+multi-row INSERTs (--method insert), --batch-size rows per transaction.
+
+Output is deterministic for a given --seed. Synthetic rows use "syn-"
+external ids and "synthetic-" user ids, so --clear removes exactly them.
+
+    python benchmarks/seed_data.py --items 2000000 --users 5000
+    python benchmarks/seed_data.py --clear
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from sqlalchemy import delete, text
+
+import database
+from database import MediaItem, UserList
+
+EXTERNAL_ID_PREFIX = "syn-"
+USER_ID_PREFIX = "synthetic-"
+# Deterministic media_items ids, so libraries can refer to items without keeping them in memory
+ID_NAMESPACE = uuid.UUID("6f1c1a52-9f3e-4d55-8b0e-3c2f4a7d9e10")
+MEDIA_TYPE_WEIGHTS = {"movie": 0.3, "tv": 0.2, "anime": 0.1, "manga": 0.1, "book": 0.2, "game": 0.1}
+STATUSES = {
+    "movie": {"planning": 5, "completed": 4, "watching": 1, "dropped": 1},
+    "tv": {"planning": 3, "watching": 3, "completed": 3, "paused": 1, "dropped": 1},
+    "anime": {"planning": 3, "watching": 3, "completed": 3, "paused": 1, "dropped": 1},
+    "manga": {"planning": 3, "reading": 4, "completed": 2, "paused": 1, "dropped": 1},
+    "book": {"planning": 5, "reading": 2, "completed": 3, "dropped": 1},
+    "game": {"planning": 3, "playing": 3, "completed": 3, "paused": 1, "dropped": 1}
+}
+GENRES = {
+    "movie": ["Action", "Adventure", "Animation", "Comedy", "Crime", "Documentary", "Drama", "Family", "Fantasy",
+              "History", "Horror", "Music", "Mystery", "Romance", "Science Fiction", "Thriller", "War", "Western"],
+    "tv": ["Action & Adventure", "Animation", "Comedy", "Crime", "Documentary", "Drama", "Family", "Kids", "Mystery",
+           "Reality", "Sci-Fi & Fantasy", "Soap", "Talk", "War & Politics"],
+    "anime": ["Action", "Adventure", "Comedy", "Drama", "Ecchi", "Fantasy", "Mecha", "Music", "Mystery",
+              "Psychological", "Romance", "Sci-Fi", "Slice of Life", "Sports", "Supernatural", "Thriller"],
+    "manga": ["Action", "Adventure", "Comedy", "Drama", "Fantasy", "Horror", "Mystery", "Psychological",
+              "Romance", "Sci-Fi", "Slice of Life", "Sports", "Supernatural"],
+    "book": ["Fiction", "Fantasy", "Science Fiction", "Mystery", "Thriller", "Romance", "Biography", "History",
+             "Self-Help", "Business & Economics", "Poetry", "Young Adult Fiction", "Juvenile Fiction"],
+    "game": ["Adventure", "Arcade", "Fighting", "Indie", "Platform", "Puzzle", "Racing", "Role-playing (RPG)",
+             "Shooter", "Simulator", "Sport", "Strategy", "Tactical", "Visual Novel"]
+}
+PLATFORMS = ["PC (Microsoft Windows)", "PlayStation 5", "PlayStation 4", "Xbox Series X|S", "Xbox One",
+             "Nintendo Switch", "Mac", "Linux", "iOS", "Android"]
+ADJECTIVES = ["Silent", "Crimson", "Hidden", "Last", "Broken", "Golden", "Endless", "Forgotten", "Midnight",
+              "Iron", "Hollow", "Distant", "Wild", "Frozen", "Burning", "Electric", "Secret", "Lost", "Bright", "Fallen"]
+NOUNS = ["Kingdom", "River", "Empire", "Garden", "Signal", "Horizon", "Crown", "Shadow", "Harbor", "Frontier",
+         "Orchard", "Machine", "Sea", "Tower", "Storm", "Library", "Circus", "Citadel", "Voyage", "Archive"]
+PATTERNS = ["The {adjective} {noun}", "{adjective} {noun}", "{noun} of the {adjective} {noun2}",
+            "The {noun} and the {noun2}", "{adjective} {noun}: {noun2} Rising", "Return to the {noun}"]
+FIRST_NAMES = ["Ada", "Hiro", "Maya", "Jonas", "Amara", "Lucas", "Sora", "Elena", "Kofi", "Ingrid", "Ravi",
+               "Chloe", "Mateo", "Yuki", "Noor", "Felix", "Lena", "Omar", "Aiko", "Priya"]
+LAST_NAMES = ["Okafor", "Tanaka", "Lindqvist", "Moreau", "Castillo", "Nakamura", "Haddad", "Fischer",
+              "Kowalski", "Osei", "Reyes", "Novak", "Sato", "Bergström", "Ivanova", "Mensah", "Park", "Costa"]
+COMPANIES = ["Northlight", "Bluefin", "Red Lantern", "Paper Crane", "Ironwood", "Starfall", "Moonrise",
+             "Tidewater", "Clockwork", "Kestrel", "Aurora", "Granite"]
+MEDIA_ITEM_COLUMNS = [
+    "id", "external_id", "title", "media_type", "year", "genres", "poster_path", "overview", "backdrop_path",
+    "vote_average", "release_date", "seasons", "episodes", "chapters", "volumes", "authors", "publisher",
+    "page_count", "platforms", "developers", "publishers", "release_year", "rating", "game_modes",
+    "created_at", "updated_at"
+]
+USER_LIST_COLUMNS = [
+    "id", "user_id", "media_id", "media_type", "status", "rating", "notes", "progress", "created_at", "updated_at"
+]
+JSON_COLUMNS = {"genres", "authors", "platforms", "developers", "publishers", "game_modes", "progress"}
+
+
+def media_item_id(index: int):
+    return str(uuid.uuid5(ID_NAMESPACE, str(index)))
+
+
+def media_type_of(index: int):
+    """Media type of item `index`; a fixed interleaving so libraries can tell it without a lookup"""
+    position = (index * 0.6180339887) % 1
+    for media_type, weight in MEDIA_TYPE_WEIGHTS.items():
+        if position < weight:
+            return media_type
+        position -= weight
+    return "game"
+
+
+def weighted_choice(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def person(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def make_title(rng, index: int):
+    title = rng.choice(PATTERNS).format(
+        adjective=rng.choice(ADJECTIVES), noun=rng.choice(NOUNS), noun2=rng.choice(NOUNS)
+    )
+    # Sequels and remakes keep titles from being unique, like real catalogs
+    return title if rng.random() < 0.8 else f"{title} {rng.choice(['II', 'III', '2', 'Reborn', 'Origins'])}"
+
+
+def make_media_item(index: int, seed: int, now: str):
+    rng = random.Random(seed * 1000003 + index)
+    media_type = media_type_of(index)
+    year = int(min(2025, max(1920, rng.gauss(2008, 14))))
+    row = {
+        "id": media_item_id(index),
+        "external_id": f"{EXTERNAL_ID_PREFIX}{index}",
+        "title": make_title(rng, index),
+        "media_type": media_type,
+        "year": year,
+        "genres": rng.sample(GENRES[media_type], rng.randint(1, 3)),
+        "poster_path": f"https://img.example/{media_type}/{index}.jpg",
+        "overview": f"A {rng.choice(ADJECTIVES).lower()} story about a {rng.choice(NOUNS).lower()}. " * rng.randint(2, 6),
+        "backdrop_path": None,
+        "vote_average": round(min(10.0, max(1.0, rng.gauss(6.6, 1.2))), 1),
+        "release_date": f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "seasons": None, "episodes": None, "chapters": None, "volumes": None,
+        "authors": None, "publisher": None, "page_count": None,
+        "platforms": None, "developers": None, "publishers": None,
+        "release_year": None, "rating": None, "game_modes": None,
+        "created_at": now, "updated_at": now
+    }
+    if media_type == "tv":
+        row.update(seasons=rng.randint(1, 12), episodes=rng.randint(6, 250))
+    elif media_type == "anime":
+        row.update(episodes=rng.choice([12, 13, 24, 26, 50, rng.randint(1, 500)]), developers=[f"{rng.choice(COMPANIES)} Studio"])
+    elif media_type == "manga":
+        row.update(chapters=rng.randint(10, 1100), volumes=rng.randint(1, 100), authors=[person(rng)])
+    elif media_type == "book":
+        row.update(authors=[person(rng) for _ in range(1 if rng.random() < 0.9 else 2)],
+                   publisher=f"{rng.choice(COMPANIES)} Press", page_count=rng.randint(90, 1200))
+    elif media_type == "game":
+        row.update(platforms=rng.sample(PLATFORMS, rng.randint(1, 4)), developers=[f"{rng.choice(COMPANIES)} Games"],
+                   publishers=[f"{rng.choice(COMPANIES)} Interactive"], release_year=year,
+                   rating=round(rng.uniform(40, 95), 1), game_modes=["Single player"])
+    return row
+
+
+def make_progress(rng, media_type: str, status: str):
+    if status == "planning":
+        return None
+    if media_type in ("tv", "anime"):
+        return {"episode": rng.randint(1, 24), "season": rng.randint(1, 3)}
+    if media_type == "manga":
+        return {"chapter": rng.randint(1, 300)}
+    if media_type == "book":
+        return {"page": rng.randint(1, 600)}
+    return None
+
+
+def library_rows(user: int, args, now: str):
+    """One user's library: a log-normal size, items drawn with a bias towards popular ones"""
+    rng = random.Random(args.seed * 7919 + user)
+    size = min(args.items // 2, max(1, int(rng.lognormvariate(math.log(args.median_library), args.library_spread))))
+    chosen = set()
+    while len(chosen) < size:
+        # Low indexes are the popular titles
+        chosen.add(min(args.items - 1, int(args.items * rng.random() ** args.popularity_skew)))
+    for index in chosen:
+        media_type = media_type_of(index)
+        status = weighted_choice(rng, STATUSES[media_type])
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "user_id": f"{USER_ID_PREFIX}{user}",
+            "media_id": media_item_id(index),
+            "media_type": media_type,
+            "status": status,
+            "rating": rng.randint(1, 10) if status == "completed" and rng.random() < 0.6 else None,
+            "notes": None,
+            "progress": make_progress(rng, media_type, status),
+            "created_at": now,
+            "updated_at": now
+        }
+
+
+def batches(rows, size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def copy_rows(table: str, columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([json.dumps(row[column]) if column in JSON_COLUMNS and row[column] is not None else row[column]
+                         for column in columns])
+    buffer.seek(0)
+    connection = database.engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def insert_rows(table, rows):
+    with database.engine.begin() as conn:
+        conn.execute(table.insert(), rows)
+
+
+def load(name: str, table, columns, rows, args):
+    started = time.perf_counter()
+    loaded = 0
+    for batch in batches(rows, args.batch_size):
+        if args.method == "copy":
+            copy_rows(table.name, columns, batch)
+        else:
+            insert_rows(table, batch)
+        loaded += len(batch)
+        elapsed = time.perf_counter() - started
+        print(f"\r{name}: {loaded} rows, {loaded / elapsed:.0f} rows/s", end="", flush=True)
+    print()
+    return loaded
+
+
+def clear():
+    with database.engine.begin() as conn:
+        lists = conn.execute(delete(UserList).where(UserList.user_id.like(f"{USER_ID_PREFIX}%"))).rowcount
+        items = conn.execute(delete(MediaItem).where(MediaItem.external_id.like(f"{EXTERNAL_ID_PREFIX}%"))).rowcount
+    print(f"Removed {items} media items and {lists} list entries")
+
+
+def main(args):
+    if not database.db_available:
+        sys.exit("PostgreSQL is not reachable at POSTGRES_URL")
+    if args.clear:
+        clear()
+        return
+    now = datetime.utcnow().isoformat()
+    load("media_items", MediaItem.__table__, MEDIA_ITEM_COLUMNS,
+         (make_media_item(index, args.seed, now) for index in range(args.items)), args)
+    load("user_lists", UserList.__table__, USER_LIST_COLUMNS,
+         (row for user in range(args.users) for row in library_rows(user, args, now)), args)
+    with database.engine.begin() as conn:
+        conn.execute(text("ANALYZE media_items, user_lists"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--median-library", type=float, default=60)
+    parser.add_argument("--library-spread", type=float, default=1.2, help="sigma of the log-normal library size")
+    parser.add_argument("--popularity-skew", type=float, default=3.0, help="higher puts more entries on popular titles")
+    parser.add_argument("--method", choices=["copy", "insert"], default="copy")
+    parser.add_argument("--batch-size", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--clear", action="store_true", help="remove previously generated rows")
+    main(parser.parse_args())
@@ -0,0 +1,139 @@
+"""Memory use and query latency of the typeahead index (backend/suggest.py).
+
+Builds a SuggestIndex from --titles synthetic media items (titles from
+seed_data.py, --alternate-share of them with an alternate title, log-normal
+popularity), added most popular first as the server's build does, and reports
+the memory it holds, scaled to a million title forms, and the latency of
+suggestion queries:
+
+  prefix-1     a single letter
+  prefix-3     the first three letters of a title word
+  word-prefix  a full word and the start of the next one
+  typed        a title typed out letter by letter, every intermediate query
+  no-match     a word that no title contains
+
+each with and without a media type.
+
+Memory is the growth of the resident set (Linux); --tracemalloc counts the
+allocations exactly instead, at the cost of a much slower build.
+
+    python benchmarks/suggest_index.py --titles 1000000
+"""
+import argparse
+import gc
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from suggest import SuggestIndex
+from titles import normalize_title
+
+from seed_data import EXTERNAL_ID_PREFIX, make_title, media_item_id, media_type_of
+
+MEDIA_TYPES = ["movie", "tv", "anime", "manga", "book", "game"]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def make_items(args):
+    rng = random.Random(args.seed)
+    items = []
+    for index in range(args.titles):
+        title = make_title(rng, index)
+        forms = []
+        if rng.random() < args.alternate_share:
+            alternate = make_title(rng, index)
+            forms.append((normalize_title(alternate), alternate))
+        popularity = round(math.exp(rng.gauss(1.5, 1.5)), 3)
+        items.append((media_item_id(index), f"{EXTERNAL_ID_PREFIX}{index}", media_type_of(index),
+                      title, rng.randint(1950, 2025), popularity, forms))
+    items.sort(key=lambda item: -item[5])
+    return items
+
+
+def make_queries(items, rng, count):
+    titles = [normalize_title(rng.choice(items)[3]) for _ in range(count)]
+    queries = {"prefix-1": [], "prefix-3": [], "word-prefix": [], "typed": [], "no-match": []}
+    for title in titles:
+        words = title.split()
+        queries["prefix-1"].append(rng.choice(words)[:1])
+        queries["prefix-3"].append(rng.choice(words)[:3])
+        if len(words) > 1:
+            start = rng.randrange(len(words) - 1)
+            queries["word-prefix"].append(f"{words[start]} {words[start + 1][:2]}")
+        queries["typed"].extend(title[:length] for length in range(1, len(title) + 1))
+        queries["no-match"].append(f"zq{rng.randint(0, 99999)}")
+    return queries
+
+
+def resident_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def time_queries(index, queries, media_type):
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        index.suggest(query, media_type)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main(args):
+    items = make_items(args)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+    else:
+        gc.collect()
+        before = resident_bytes()
+    started = time.perf_counter()
+    index = SuggestIndex()
+    for item in items:
+        index.add(*item)
+    build_seconds = time.perf_counter() - started
+    if args.tracemalloc:
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    else:
+        gc.collect()
+        after = resident_bytes()
+
+    forms = len(index)
+    size = after - before
+    print(f"{len(index.item_ids)} items, {forms} title forms, {len(index.postings)} posting lists, "
+          f"built in {build_seconds:.1f}s{' (traced)' if args.tracemalloc else ''}")
+    print(f"memory: {size / 2**20:.1f} MiB, {size / forms:.0f} bytes per title form, "
+          f"{size / forms * 1e6 / 2**20:.0f} MiB per million title forms")
+
+    queries = make_queries(items, random.Random(args.seed + 1), args.queries)
+    print(f"\n{'queries':<24}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for media_type in [None, args.media_type]:
+        for name, group in queries.items():
+            samples = time_queries(index, group, media_type)
+            label = f"{name}/{media_type or 'all'}"
+            print(f"{label:<24}{len(samples):>8}" + "".join(
+                f"{value * 1000:>10.3f}" for value in
+                (percentile(samples, 50), percentile(samples, 95), percentile(samples, 99), max(samples))
+            ))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--titles", type=int, default=1000000)
+    parser.add_argument("--alternate-share", type=float, default=0.3, help="share of items with an alternate title")
+    parser.add_argument("--queries", type=int, default=500, help="titles queries are drawn from, per group")
+    parser.add_argument("--media-type", choices=MEDIA_TYPES, default="anime", help="media type of the filtered runs")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tracemalloc", action="store_true", help="measure traced allocations instead of the resident set")
+    main(parser.parse_args())
@@ -0,0 +1,239 @@
+"""Offline load test of the API with mocked providers.
+
+Runs the ASGI app in-process with every provider call answered by the local
+stand-ins in mock_providers.py, and reports latency percentiles and
+throughput for:
+
+  search-hit/<type>    the same search repeated (result cache hits)
+  search-miss/<type>   a new search every request (provider calls and upserts)
+  user-list/<n>        GET /api/user-list with n listed items
+  stats/<n>            GET /api/stats with n listed items
+  library-query/<n>    GET /api/user-list/query, a text search with filters and a sort
+  update/<n>           PUT /api/user-list/{id}
+  progress/<n>         POST /api/user-list/{id}/progress
+  add-delete/<n>       POST /api/user-list followed by DELETE
+
+Each scenario runs for --duration seconds with --concurrency requests in
+flight. Results can be stored as a baseline and later runs compared with it;
+the exit status is 1 when a scenario's p95 or throughput regressed by more
+than --tolerance.
+
+Uses PostgreSQL when POSTGRES_URL is reachable, the in-memory fallback
+otherwise. Point POSTGRES_URL at a scratch database: the suite replaces the
+demo user's library.
+
+    python benchmarks/suite.py --duration 5 --save-baseline
+    python benchmarks/suite.py --duration 5 --provider-latency tmdb=0.08,anilist=0.15 --provider-error-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "backend"))
+# Neither would let a load test measure the API itself
+os.environ.setdefault("RATE_LIMITING", "0")
+os.environ.setdefault("CACHE_WARMING", "0")
+
+import httpx
+import providers
+import server
+from database import memory_storage
+
+from mock_providers import MockProviders
+
+MEDIA_TYPES = ["movie", "tv", "anime", "manga", "book", "game"]
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(samples, errors, elapsed):
+    if not samples:
+        return {"requests": 0, "errors": errors, "throughput": 0.0, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "throughput": round(len(samples) / elapsed, 1),
+        "p50_ms": round(percentile(samples, 50), 2),
+        "p95_ms": round(percentile(samples, 95), 2),
+        "p99_ms": round(percentile(samples, 99), 2)
+    }
+
+
+async def run_scenario(make_request, duration, concurrency):
+    """Call make_request(sequence) from `concurrency` workers for `duration` seconds"""
+    samples = []
+    errors = 0
+    sequence = iter(range(10 ** 12))
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await make_request(next(sequence))
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            samples.append((time.perf_counter() - started) * 1000)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(samples, errors, time.perf_counter() - started)
+
+
+def list_item(index):
+    return {
+        "media_id": f"bench-{index}",
+        "media_type": MEDIA_TYPES[index % len(MEDIA_TYPES)],
+        "status": ["planning", "watching", "completed", "dropped"][index % 4],
+        "title": f"Bench title {index}",
+        "progress": {"episode": index % 24},
+        "genres": ["Drama"]
+    }
+
+
+async def reset_library(client, size):
+    """Replace the demo library with `size` generated items; returns their list ids"""
+    if not server.db_available:
+        # The batch endpoint checks adds one by one against the whole in-memory list
+        memory_storage['user_list'] = []
+        for index in range(size):
+            memory_storage['user_list'].append(server.create_memory_list_item(server.UserListItemCreate(**list_item(index))))
+        memory_storage['library_version'] += 1
+        return [item['id'] for item in memory_storage['user_list']]
+
+    existing = [entry["id"] for entry in (await client.get("/api/user-list")).json()]
+    for start in range(0, len(existing), server.MAX_BATCH_OPERATIONS):
+        response = await client.post("/api/user-list/batch", json={"delete": existing[start:start + server.MAX_BATCH_OPERATIONS]})
+        response.raise_for_status()
+    for start in range(0, size, server.MAX_BATCH_OPERATIONS):
+        batch = [list_item(index) for index in range(start, min(size, start + server.MAX_BATCH_OPERATIONS))]
+        response = await client.post("/api/user-list/batch", json={"add": batch})
+        response.raise_for_status()
+    return [entry["id"] for entry in (await client.get("/api/user-list")).json()]
+
+
+async def search_scenarios(client, args):
+    results = {}
+    for media_type in args.media_types:
+        hit_query = f"bench {media_type}"
+        await client.get("/api/search", params={"query": hit_query, "media_type": media_type})
+        results[f"search-hit/{media_type}"] = await run_scenario(
+            lambda i: client.get("/api/search", params={"query": hit_query, "media_type": media_type}),
+            args.duration, args.concurrency
+        )
+        results[f"search-miss/{media_type}"] = await run_scenario(
+            lambda i: client.get("/api/search", params={"query": f"bench miss {args.run_id} {i}", "media_type": media_type}),
+            args.duration, args.concurrency
+        )
+    return results
+
+
+async def library_scenarios(client, args):
+    results = {}
+    for size in args.sizes:
+        ids = await reset_library(client, size)
+        results[f"user-list/{size}"] = await run_scenario(lambda i: client.get("/api/user-list"), args.duration, args.concurrency)
+        results[f"stats/{size}"] = await run_scenario(lambda i: client.get("/api/stats"), args.duration, args.concurrency)
+        results[f"library-query/{size}"] = await run_scenario(
+            lambda i: client.get("/api/user-list/query", params={
+                "q": f"title {i % 100}", "genre": "Drama", "status": ["watching", "completed"], "sort": "title"
+            }),
+            args.duration, args.concurrency
+        )
+        results[f"update/{size}"] = await run_scenario(
+            lambda i: client.put(f"/api/user-list/{ids[i % len(ids)]}", json={"rating": i % 10}),
+            args.duration, args.concurrency
+        )
+        results[f"progress/{size}"] = await run_scenario(
+            lambda i: client.post(f"/api/user-list/{ids[i % len(ids)]}/progress", json={"episode": 1}),
+            args.duration, args.concurrency
+        )
+
+        async def add_delete(i):
+            response = await client.post("/api/user-list", json=list_item(size + 1 + i))
+            if response.status_code >= 400 or "id" not in response.json():
+                return response
+            return await client.delete(f"/api/user-list/{response.json()['id']}")
+
+        results[f"add-delete/{size}"] = await run_scenario(add_delete, args.duration, args.concurrency)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print changes against the baseline; returns the scenarios that regressed"""
+    regressions = []
+    print(f"\n{'scenario':<22}{'p95 base':>10}{'p95 now':>10}{'change':>9}{'tput base':>11}{'tput now':>10}{'change':>9}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not base.get("p95_ms") or not result.get("p95_ms"):
+            continue
+        p95_change = result["p95_ms"] / base["p95_ms"] - 1
+        throughput_change = result["throughput"] / base["throughput"] - 1 if base["throughput"] else 0.0
+        regressed = p95_change > tolerance or throughput_change < -tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<22}{base['p95_ms']:>10.1f}{result['p95_ms']:>10.1f}{p95_change:>+9.0%}"
+              f"{base['throughput']:>11.1f}{result['throughput']:>10.1f}{throughput_change:>+9.0%}"
+              f"{'  REGRESSED' if regressed else ''}")
+    return regressions
+
+
+async def main(args):
+    mock = MockProviders(latency=args.provider_latency, error_rate=args.provider_error_rate, seed=args.seed)
+    providers.set_transport_factory(mock.transport)
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        results = {}
+        if "search" in args.groups:
+            results.update(await search_scenarios(client, args))
+        if "library" in args.groups:
+            results.update(await library_scenarios(client, args))
+
+    storage = "postgresql" if server.db_available else "memory"
+    print(f"storage: {storage}, concurrency: {args.concurrency}, provider calls: {sum(mock.calls.values())}"
+          f" ({sum(mock.errors.values())} failed)")
+    print(f"{'scenario':<22}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, result in results.items():
+        percentiles = "".join(f"{result[key]:>10.1f}" if result[key] is not None else f"{'-':>10}" for key in ("p50_ms", "p95_ms", "p99_ms"))
+        print(f"{name:<22}{result['requests']:>10}{result['errors']:>8}{result['throughput']:>10.1f}{percentiles}")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"storage": storage, "concurrency": args.concurrency, "results": results}, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--groups", default="search,library", type=lambda value: value.split(","))
+    parser.add_argument("--media-types", default=",".join(MEDIA_TYPES), type=lambda value: value.split(","))
+    parser.add_argument("--sizes", default="10,1000,50000", type=lambda value: [int(size) for size in value.split(",")])
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--provider-latency", default="0.05", help='seconds, e.g. "0.05" or "tmdb=0.08,igdb=0.2"')
+    parser.add_argument("--provider-error-rate", default="0", help='fraction of failed calls, same format')
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+    # Keeps search-miss queries new across runs sharing a cache backend
+    args.run_id = int(time.time())
+    sys.exit(asyncio.run(main(args)))
@@ -1178,6 +1178,37 @@ function App() {
     }
   };
 
+  // Mutation responses carry the changed entry and a stats delta, so local
+  // state is patched in place instead of refetching the list and stats
+  const applyStatsDelta = (statsDelta) => {
+    setStats(prev => {
+      const next = { ...prev };
+      Object.entries(statsDelta || {}).forEach(([mediaType, counts]) => {
+        const typeStats = { ...(next[mediaType] || {}) };
+        Object.entries(counts).forEach(([status, count]) => {
+          typeStats[status] = (typeStats[status] || 0) + count;
+          if (typeStats[status] <= 0) delete typeStats[status];
+        });
+        if (Object.keys(typeStats).length > 0) {
+          next[mediaType] = typeStats;
+        } else {
+          delete next[mediaType];
+        }
+      });
+      return next;
+    });
+  };
+
+  const applyListEntry = (entry) => {
+    setUserListItems(prev => {
+      const index = prev.findIndex(item => item.list_item.id === entry.list_item.id);
+      if (index === -1) return [...prev, entry];
+      const next = [...prev];
+      next[index] = entry;
+      return next;
+    });
+  };
+
   const handleSearch = async (query, mediaType) => {
     // Update the loading state for the specific media type
     setMediaStates(prev => ({
@@ -1235,9 +1266,13 @@ function App() {
         game_modes: mediaItem.game_modes || []
       });
       
-      // Reload user list and stats
-      await loadUserList();
-      await loadStats();
+      if (response.data.entry && response.data.entry.media_item) {
+        applyListEntry(response.data.entry);
+        applyStatsDelta(response.data.stats_delta);
+      } else {
+        await loadUserList();
+        await loadStats();
+      }
       
       alert('Added to your list!');
     } catch (error) {
@@ -1252,9 +1287,14 @@ function App() {
 
   const handleUpdateItem = async (listItemId, updateData) => {
     try {
-      await axios.put(`${API}/user-list/${listItemId}`, updateData);
-      await loadUserList();
-      await loadStats();
+      const response = await axios.put(`${API}/user-list/${listItemId}`, updateData);
+      if (response.data.entry && response.data.entry.media_item) {
+        applyListEntry(response.data.entry);
+        applyStatsDelta(response.data.stats_delta);
+      } else {
+        await loadUserList();
+        await loadStats();
+      }
     } catch (error) {
       console.error('Error updating item:', error);
     }
@@ -1262,9 +1302,14 @@ function App() {
 
   const handleRemoveItem = async (listItemId) => {
     try {
-      await axios.delete(`${API}/user-list/${listItemId}`);
-      await loadUserList();
-      await loadStats();
+      const response = await axios.delete(`${API}/user-list/${listItemId}`);
+      if (response.data.stats_delta) {
+        setUserListItems(prev => prev.filter(item => item.list_item.id !== listItemId));
+        applyStatsDelta(response.data.stats_delta);
+      } else {
+        await loadUserList();
+        await loadStats();
+      }
     } catch (error) {
       console.error('Error removing item:', error);
     }
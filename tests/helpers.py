@@ -0,0 +1,9 @@
+import pytest
+
+import database
+
+requires_db = pytest.mark.skipif(not database.db_available, reason="needs TEST_POSTGRES_URL")
+
+
+def list_item(media_id: str, **fields):
+    return {"media_id": media_id, "media_type": "tv", "status": "watching", "title": f"Title {media_id}", **fields}
@@ -0,0 +1,65 @@
+from tests.helpers import list_item
+
+
+def stored_entries(client):
+    return {entry["list_item"]["id"]: entry["list_item"] for entry in client.get("/api/user-list").json()}
+
+
+def test_update_without_progress_keeps_progress(client, media_item):
+    media_item("m1")
+    list_item_id = client.post("/api/user-list", json=list_item("m1", progress={"episode": 3}, notes="good")).json()["id"]
+
+    response = client.post("/api/user-list/batch", json={"update": [{"id": list_item_id, "status": "paused"}]})
+
+    assert response.status_code == 200
+    stored = stored_entries(client)[list_item_id]
+    assert stored["status"] == "paused"
+    assert stored["progress"] == {"episode": 3}
+    assert stored["notes"] == "good"
+
+
+def test_updates_sending_different_fields(client, media_item):
+    ids = [client.post("/api/user-list", json=list_item(media_item(f"m{n}"), progress={"episode": n})).json()["id"]
+           for n in range(3)]
+
+    client.post("/api/user-list/batch", json={"update": [
+        {"id": ids[0], "rating": 8},
+        {"id": ids[1], "progress": {"episode": 10}},
+        {"id": ids[2], "rating": 5, "status": "completed"}
+    ]})
+
+    stored = stored_entries(client)
+    assert (stored[ids[0]]["rating"], stored[ids[0]]["progress"]) == (8, {"episode": 0})
+    assert (stored[ids[1]]["rating"], stored[ids[1]]["progress"]) == (None, {"episode": 10})
+    assert (stored[ids[2]]["status"], stored[ids[2]]["progress"]) == ("completed", {"episode": 2})
+
+
+def test_add_of_listed_item_keeps_fields_left_out(client, media_item):
+    media_item("m1")
+    media_item("m2")
+    list_item_id = client.post("/api/user-list", json=list_item("m1", progress={"episode": 3}, rating=7)).json()["id"]
+
+    response = client.post("/api/user-list/batch", json={"add": [
+        list_item("m2"),
+        list_item("m1", status="completed")
+    ]})
+
+    added = response.json()["added"]
+    assert len(added) == 2 and added[1] == list_item_id
+    stored = stored_entries(client)
+    assert stored[list_item_id]["status"] == "completed"
+    assert stored[list_item_id]["progress"] == {"episode": 3}
+    assert stored[list_item_id]["rating"] == 7
+    assert stored[added[0]]["progress"] is None
+
+
+def test_unknown_ids_fail_the_whole_batch(client, media_item):
+    list_item_id = client.post("/api/user-list", json=list_item(media_item("m1"))).json()["id"]
+
+    response = client.post("/api/user-list/batch", json={
+        "update": [{"id": list_item_id, "status": "dropped"}],
+        "delete": ["missing"]
+    })
+
+    assert response.status_code == 404
+    assert stored_entries(client)[list_item_id]["status"] == "watching"
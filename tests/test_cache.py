@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import server
+from cache import LocalLRUCache, SQLiteCache, TieredCache
+
+
+def test_sqlite_tier_round_trip(tmp_path):
+    shared = SQLiteCache(str(tmp_path / "cache.db"))
+
+    async def run():
+        assert await shared.add("lock", 1, 30) is True
+        assert await shared.add("lock", 2, 30) is False
+        await shared.set("key", {"results": [1]}, 60)
+        value = await shared.get("key")
+        await shared.delete("key")
+        return value, await shared.get("key")
+
+    assert asyncio.run(run()) == ({"results": [1]}, None)
+
+
+def test_ttl_may_depend_on_the_loaded_value():
+    cache = TieredCache(LocalLRUCache())
+
+    async def load():
+        return {"results": []}
+
+    asyncio.run(cache.get_or_load("search", "q", load, ttl=lambda value: 60 if not value["results"] else 3600))
+
+    _, expires_at = cache.local.entries[cache.full_key("search", "q")]
+    assert expires_at - time.monotonic() <= 60
+
+
+def test_empty_searches_are_cached_briefly():
+    assert server.search_ttl({"results": []}) == server.PROVIDER_ERROR_CACHE_TTL
+    assert server.search_ttl({"results": [{"id": "m1"}]}) == server.SEARCH_CACHE_TTL
+
+
+def test_lock_serializes_holders(tmp_path):
+    cache = TieredCache(LocalLRUCache(), SQLiteCache(str(tmp_path / "cache.db")))
+    order = []
+
+    async def hold(name):
+        async with cache.lock("storage") as locked:
+            order.append((name, "in", locked))
+            await asyncio.sleep(0.1)
+            order.append((name, "out", locked))
+
+    async def run():
+        await asyncio.gather(hold("a"), hold("b"))
+
+    asyncio.run(run())
+
+    assert [step[:2] for step in order] in ([("a", "in"), ("a", "out"), ("b", "in"), ("b", "out")],
+                                            [("b", "in"), ("b", "out"), ("a", "in"), ("a", "out")])
+    assert all(locked for *_, locked in order)
+
+
+def test_coalesced_callers_are_not_reported_as_cached():
+    cache = TieredCache(LocalLRUCache())
+
+    async def load():
+        await asyncio.sleep(0.05)
+        return {"results": [1]}
+
+    async def run():
+        loads = await asyncio.gather(*(cache.get_or_load("search", "q", load, ttl=60) for _ in range(3)))
+        return loads, await cache.get_or_load("search", "q", load, ttl=60)
+
+    loads, later = asyncio.run(run())
+
+    assert [cached for _, cached in loads] == [False, False, False]
+    assert later[1] is True
+    assert cache.stats["search"] == {"miss": 1, "coalesced": 2, "hit": 1}
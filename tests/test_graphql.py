@@ -0,0 +1,28 @@
+import uuid
+
+import server
+
+SEARCH_QUERY = """
+query Search($query: String!) {
+  search(query: $query, mediaType: "tv") { source results { id title genres } }
+}
+"""
+
+
+def test_search_returns_results_fresh_and_cached(client, media_item, monkeypatch):
+    media_item("m1")
+
+    async def search_sources(query, media_type, page, db, locale=None):
+        return {"results": [server.MediaItemResponse(id="m1", external_id="m1", title="Title m1",
+                                                     media_type="tv", genres=["Drama"])],
+                "source": "external"}
+    monkeypatch.setattr(server, "search_sources", search_sources)
+    variables = {"query": f"graphql {uuid.uuid4()}"}
+
+    responses = [client.post("/api/graphql", json={"query": SEARCH_QUERY, "variables": variables}).json()
+                 for _ in range(2)]
+
+    for response in responses:
+        assert "errors" not in response
+        assert response["data"]["search"]["results"] == [{"id": "m1", "title": "Title m1", "genres": ["Drama"]}]
+    assert [response["data"]["search"]["source"] for response in responses] == ["external", "cache"]
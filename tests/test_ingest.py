@@ -0,0 +1,38 @@
+import gzip
+import json
+
+from sqlalchemy import text
+
+import database
+import ingest
+from database import MediaItem
+from tests.helpers import requires_db
+
+
+def write_export(path, records):
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    return str(path)
+
+
+@requires_db
+def test_ingest_only_refreshes_popularity_of_existing_rows(client, db, media_item, tmp_path):
+    with database.engine.begin() as conn:
+        conn.execute(text("TRUNCATE catalog_ingest_state"))
+    media_item("searched", media_type="movie", external_id="1", title="Localized", additional_data={"popularity": 10.0})
+    media_item("steady", media_type="movie", external_id="2", title="Steady", additional_data={"popularity": 50.0})
+    path = write_export(tmp_path / "movie_ids.json.gz", [
+        {"id": 1, "original_title": "Original", "popularity": 20.0},
+        {"id": 2, "original_title": "Steady", "popularity": 50.5},
+        {"id": 3, "original_title": "New", "popularity": 1.0},
+    ])
+
+    state = ingest.ingest("tmdb-movie", path, "movie_ids.json.gz")
+
+    assert (state["rows_inserted"], state["rows_updated"]) == (1, 1)
+    rows = {row.external_id: row for row in db.query(MediaItem)}
+    assert rows["1"].title == "Localized" and rows["1"].catalog_source is None
+    assert rows["1"].additional_data["popularity"] == 20.0
+    assert rows["2"].additional_data["popularity"] == 50.0
+    assert rows["3"].catalog_source == "tmdb-movie"
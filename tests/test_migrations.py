@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect, text
+
+import database
+from database import UserList
+from tests.helpers import requires_db
+
+
+def without_index(name):
+    with database.engine.begin() as conn:
+        conn.execute(text(f"DROP INDEX {name}"))
+
+
+def index_names(table):
+    return {index["name"] for index in inspect(database.engine).get_indexes(table)}
+
+
+@requires_db
+def test_duplicate_list_entries_keep_the_newest(client, db, media_item):
+    media_item("m1")
+    without_index("uq_user_lists_user_media")
+    now = datetime.utcnow()
+    db.add_all([
+        UserList(id="old", user_id="demo_user", media_id="m1", media_type="tv", status="planning", updated_at=now - timedelta(days=1)),
+        UserList(id="new", user_id="demo_user", media_id="m1", media_type="tv", status="watching", updated_at=now),
+        UserList(id="other-user", user_id="someone", media_id="m1", media_type="tv", status="planning", updated_at=now),
+    ])
+    db.commit()
+
+    database.create_tables()
+
+    db.expire_all()
+    assert sorted(row.id for row in db.query(UserList)) == ["new", "other-user"]
+    assert "uq_user_lists_user_media" in index_names("user_lists")
+
+
+@requires_db
+def test_duplicate_media_items_merge_list_entries(client, db, media_item):
+    without_index("uq_media_items_external")
+    now = datetime.utcnow()
+    media_item("first", external_id="ext", created_at=now - timedelta(days=1))
+    media_item("second", external_id="ext", created_at=now)
+    db.add_all([
+        UserList(id="on-first", user_id="demo_user", media_id="first", media_type="tv", status="planning", updated_at=now - timedelta(days=1)),
+        UserList(id="on-second", user_id="demo_user", media_id="second", media_type="tv", status="watching", updated_at=now),
+        UserList(id="other-user", user_id="someone", media_id="second", media_type="tv", status="planning", updated_at=now),
+    ])
+    db.commit()
+
+    database.create_tables()
+
+    db.expire_all()
+    assert [row.id for row in db.query(database.MediaItem)] == ["first"]
+    assert {row.id: row.media_id for row in db.query(UserList)} == {"on-second": "first", "other-user": "first"}
+    assert "uq_media_items_external" in index_names("media_items")
@@ -0,0 +1,44 @@
+from sqlalchemy import text
+
+import database
+from tests.helpers import list_item, requires_db
+
+
+def test_increment_starts_from_no_progress(client, media_item):
+    list_item_id = client.post("/api/user-list", json=list_item(media_item("m1", episodes=12))).json()["id"]
+
+    response = client.post(f"/api/user-list/{list_item_id}/progress", json={"episode": 1})
+
+    assert response.status_code == 200
+    assert response.json()["progress"] == {"episode": 1}
+
+
+@requires_db
+def test_increment_stops_at_last_episode(client, media_item):
+    list_item_id = client.post("/api/user-list", json=list_item(media_item("m1", episodes=2),
+                                                                progress={"episode": 1})).json()["id"]
+
+    body = client.post(f"/api/user-list/{list_item_id}/progress", json={"episode": 5}).json()
+
+    assert body["progress"] == {"episode": 2}
+    assert body["status"] == "completed"
+
+
+@requires_db
+def test_increment_replaces_json_null_progress(client, media_item):
+    list_item_id = client.post("/api/user-list", json=list_item(media_item("m1"))).json()["id"]
+    with database.engine.begin() as conn:
+        conn.execute(text("UPDATE user_lists SET progress = 'null'::json WHERE id = :id"), {"id": list_item_id})
+
+    response = client.post(f"/api/user-list/{list_item_id}/progress", json={"episode": 1})
+
+    assert response.json()["progress"] == {"episode": 1}
+
+
+def test_add_then_batch_update_then_increment(client, media_item):
+    list_item_id = client.post("/api/user-list", json=list_item(media_item("m1"))).json()["id"]
+    client.post("/api/user-list/batch", json={"update": [{"id": list_item_id, "rating": 9}]})
+
+    body = client.post(f"/api/user-list/{list_item_id}/progress", json={"episode": 1, "season": 2}).json()
+
+    assert body["progress"] == {"episode": 1, "season": 2}
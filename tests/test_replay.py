@@ -0,0 +1,44 @@
+import asyncio
+
+import httpx
+
+from replay import RecordingStore, ReplayTransport
+
+TOKEN_URL = "https://auth.example/token"
+
+
+def network(calls):
+    def handle(request):
+        calls.append(str(request.url))
+        return httpx.Response(200, json={"access_token": "secret", "expires_in": 60})
+    return httpx.MockTransport(handle)
+
+
+def post(transport, url):
+    async def call():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await client.post(url, params={"client_secret": "s"})
+    return asyncio.run(call())
+
+
+def test_token_requests_are_not_recorded(tmp_path):
+    store = RecordingStore(str(tmp_path / "recordings.sqlite3"))
+    calls = []
+    transport = ReplayTransport("igdb", network(calls), mode="record", store=store, credential_urls={TOKEN_URL})
+
+    post(transport, TOKEN_URL)
+    post(transport, "https://api.example/games")
+
+    assert len(calls) == 2
+    assert store.connect().execute("SELECT url FROM recordings").fetchall() == [("https://api.example/games",)]
+
+
+def test_replay_only_answers_token_requests_with_a_placeholder(tmp_path):
+    calls = []
+    transport = ReplayTransport("igdb", network(calls), mode="replay-only",
+                                store=RecordingStore(str(tmp_path / "recordings.sqlite3")), credential_urls={TOKEN_URL})
+
+    response = post(transport, TOKEN_URL)
+
+    assert calls == []
+    assert response.json()["access_token"] == "replay"
@@ -0,0 +1,62 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import retention
+import server
+from database import MediaItem
+from suggest import SuggestIndex, Suggester
+from tests.helpers import list_item, requires_db
+
+
+@requires_db
+def test_compaction_keeps_the_most_recently_accessed_rows(client, db, media_item, monkeypatch):
+    now = datetime.utcnow()
+    for age in range(5):
+        media_item(f"m{age}", last_accessed_at=now - timedelta(hours=age))
+    media_item("listed", last_accessed_at=now - timedelta(days=400))
+    media_item("catalog", last_accessed_at=now - timedelta(days=400), catalog_source="tmdb-tv")
+    client.post("/api/user-list", json=list_item("listed"))
+    monkeypatch.setattr(retention, "MEDIA_ITEM_MAX_UNREFERENCED", 2)
+    forgotten = []
+    monkeypatch.setattr(retention.suggester, "forget", forgotten.extend)
+
+    assert retention.compact_media_items() == 3
+
+    assert sorted(row.id for row in db.query(MediaItem)) == ["catalog", "listed", "m0", "m1"]
+    assert sorted(forgotten) == ["m2", "m3", "m4"]
+
+
+@requires_db
+def test_capacity_eviction_spares_recently_accessed_rows(client, db, media_item, monkeypatch):
+    now = datetime.utcnow()
+    media_item("fresh", last_accessed_at=now - timedelta(seconds=30))
+    media_item("recent", last_accessed_at=now - timedelta(minutes=5))
+    media_item("idle", last_accessed_at=now - timedelta(days=1))
+    monkeypatch.setattr(retention, "MEDIA_ITEM_MAX_UNREFERENCED", 1)
+
+    assert retention.compact_media_items() == 1
+
+    assert sorted(row.id for row in db.query(MediaItem)) == ["fresh", "recent"]
+
+
+@requires_db
+def test_cached_search_leaves_out_evicted_rows(client, media_item, monkeypatch):
+    response = {"results": [{"id": "kept"}, {"id": "evicted"}], "source": "external"}
+    media_item("kept")
+    monkeypatch.setattr(server.cache, "get_or_load", lambda *args, **kwargs: asyncio.sleep(0, (response, True)))
+
+    results = asyncio.run(server.run_search("query", "tv", 1, "en"))["results"]
+
+    assert [result["id"] for result in results] == ["kept"]
+
+
+def test_forgotten_items_are_not_suggested():
+    suggester = Suggester()
+    suggester.active = True
+    suggester.index = SuggestIndex()
+    suggester.index.add("m1", "1", "tv", "Dark", 2017, 5)
+    suggester.index.add("m2", "2", "tv", "Dark Matter", 2015, 3)
+
+    suggester.forget(["m1"])
+
+    assert [suggestion["id"] for suggestion in suggester.suggest("dark")] == ["m2"]
@@ -0,0 +1,93 @@
+import server
+from tests.helpers import list_item, requires_db
+
+
+def change_ids(body):
+    return [change["list_item"]["id"] for change in body["changes"]]
+
+
+def test_list_etag_answers_304_until_the_library_changes(client, media_item):
+    client.post("/api/user-list", json=list_item(media_item("m1")))
+    etag = client.get("/api/user-list").headers["ETag"]
+
+    assert client.get("/api/user-list", headers={"If-None-Match": etag}).status_code == 304
+
+    client.post("/api/user-list", json=list_item(media_item("m2")))
+    response = client.get("/api/user-list", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_list_etag_depends_on_the_filter(client, media_item):
+    client.post("/api/user-list", json=list_item(media_item("m1")))
+
+    assert client.get("/api/user-list").headers["ETag"] != client.get("/api/user-list?status=watching").headers["ETag"]
+
+
+def test_stats_and_preferences_etags(client):
+    stats_etag = client.get("/api/stats").headers["ETag"]
+    preferences_etag = client.get("/api/user-preferences").headers["ETag"]
+
+    assert client.get("/api/stats", headers={"If-None-Match": stats_etag}).status_code == 304
+    assert client.get("/api/user-preferences", headers={"If-None-Match": f"W/{preferences_etag}"}).status_code == 304
+
+
+def test_changes_since_zero_resets(client, media_item):
+    list_item_id = client.post("/api/user-list", json=list_item(media_item("m1"))).json()["id"]
+
+    body = client.get("/api/user-list/changes?since=0").json()
+
+    assert (body["version"], body["reset"]) == (1, True)
+    assert change_ids(body) == [list_item_id]
+
+
+def test_changes_report_updates_and_removals_after_since(client, media_item):
+    first = client.post("/api/user-list", json=list_item(media_item("m1"))).json()["id"]
+    second = client.post("/api/user-list", json=list_item(media_item("m2"))).json()["id"]
+    since = client.get("/api/user-list/changes?since=0").json()["version"]
+
+    client.put(f"/api/user-list/{first}", json={"status": "completed"})
+    client.delete(f"/api/user-list/{second}")
+    body = client.get(f"/api/user-list/changes?since={since}").json()
+
+    assert (body["version"], body["reset"]) == (since + 2, False)
+    assert change_ids(body) == [first]
+    assert [removal["id"] for removal in body["removed"]] == [second]
+    assert client.get(f"/api/user-list/changes?since={body['version']}").json()["changes"] == []
+
+
+def test_changes_ahead_of_the_server_reset(client, media_item):
+    client.post("/api/user-list", json=list_item(media_item("m1")))
+
+    assert client.get("/api/user-list/changes?since=99").json()["reset"] is True
+
+
+@requires_db
+def test_filling_a_listed_catalog_row_changes_the_library(client, db, media_item):
+    media_item("m1", media_type="movie", external_id="129", title="Sen to Chihiro", catalog_source="tmdb-movie")
+    list_item_id = client.post("/api/user-list", json=list_item("m1", media_type="movie")).json()["id"]
+    list_response = client.get("/api/user-list")
+    since = client.get("/api/user-list/changes?since=0").json()["version"]
+
+    server.create_media_item_from_tmdb_movie({"id": 129, "title": "Spirited Away", "overview": "A girl...", "genres": []}, db)
+
+    response = client.get("/api/user-list", headers={"If-None-Match": list_response.headers["ETag"]})
+    assert response.status_code == 200
+    assert response.json()[0]["media_item"]["overview"] == "A girl..."
+    assert response.json()[0]["list_item"]["updated_at"] == list_response.json()[0]["list_item"]["updated_at"]
+    assert change_ids(client.get(f"/api/user-list/changes?since={since}").json()) == [list_item_id]
+
+
+@requires_db
+def test_library_query_etag_follows_listed_media_rows(client, db, media_item):
+    media_item("m1", media_type="movie", external_id="129", title="Sen to Chihiro", catalog_source="tmdb-movie")
+    client.post("/api/user-list", json=list_item("m1", media_type="movie"))
+    url = "/api/user-list/query?q=spirited"
+    etag = client.get(url).headers["ETag"]
+    assert client.get(url).json()["total"] == 0
+
+    server.create_media_item_from_tmdb_movie({"id": 129, "title": "Spirited Away", "overview": "A girl...", "genres": []}, db)
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["total"] == 1
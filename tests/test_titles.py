@@ -0,0 +1,38 @@
+import server
+from suggest import suggester
+from database import MediaItemTitle
+from tests.helpers import requires_db
+
+
+def stored_titles(db, media_item_id):
+    return {row.normalized_title for row in db.query(MediaItemTitle).filter(MediaItemTitle.media_item_id == media_item_id)}
+
+
+@requires_db
+def test_anilist_titles_of_existing_row_are_stored(client, db, media_item):
+    media_item("m1", media_type="anime", external_id="21", title="One Piece")
+    item = {"id": 21, "title": {"english": "One Piece", "romaji": "One Piece", "native": "ワンピース"},
+            "synonyms": ["OP"], "genres": []}
+
+    assert server.create_media_item_from_anilist(item, "ANIME", db).id == "m1"
+
+    assert stored_titles(db, "m1") == {"one piece", "ワンピース", "op"}
+
+
+@requires_db
+def test_tmdb_titles_of_existing_row_are_stored(client, db, media_item):
+    media_item("m1", media_type="movie", external_id="129", title="Spirited Away", overview="Already filled")
+    movie = {"id": 129, "title": "Spirited Away", "original_title": "千と千尋の神隠し", "genres": []}
+
+    assert server.create_media_item_from_tmdb_movie(movie, db).id == "m1"
+
+    assert stored_titles(db, "m1") == {"spirited away", "千と千尋の神隠し"}
+
+
+@requires_db
+def test_title_writes_are_not_kept_without_the_index_job(client, db, media_item):
+    media_item("m1", media_type="movie", external_id="129", title="Spirited Away")
+
+    server.create_media_item_from_tmdb_movie({"id": 129, "title": "Spirited Away", "genres": []}, db)
+
+    assert not suggester.active and suggester.pending == set()
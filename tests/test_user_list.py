@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+import database
+import server
+from cache import SQLiteCache
+from database import UserList, UserSyncState
+from tests.helpers import list_item, requires_db
+
+
+def test_add_stores_entry_and_bumps_version(client, media_item):
+    media_item("m1")
+    response = client.post("/api/user-list", json=list_item("m1", progress={"episode": 3}))
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["message"] == "Item added to list"
+    assert body["version"] == 1
+    assert body["entry"]["list_item"]["progress"] == {"episode": 3}
+    listed = client.get("/api/user-list").json()
+    assert [entry["list_item"]["id"] for entry in listed] == [body["id"]]
+
+
+@requires_db
+def test_add_writes_row(client, db):
+    body = client.post("/api/user-list", json=list_item("m1")).json()
+
+    row = db.get(UserList, body["id"])
+    assert row is not None and row.media_id == "m1" and row.version == 1
+    assert db.get(UserSyncState, "demo_user").library_version == 1
+
+
+def test_add_twice_is_rejected(client):
+    client.post("/api/user-list", json=list_item("m1"))
+    response = client.post("/api/user-list", json=list_item("m1"))
+
+    assert response.status_code == 400
+
+
+def test_mutations_bump_library_version(client):
+    list_item_id = client.post("/api/user-list", json=list_item("m1")).json()["id"]
+    client.post("/api/user-list", json=list_item("m2"))
+
+    assert client.put(f"/api/user-list/{list_item_id}", json={"status": "completed"}).json()["version"] == 3
+    assert client.delete(f"/api/user-list/{list_item_id}").json()["version"] == 4
+    if database.db_available:
+        with database.session_scope() as db:
+            assert db.get(UserSyncState, "demo_user").library_version == 4
+
+
+@pytest.mark.skipif(database.db_available, reason="in-memory fallback only")
+def test_fallback_writes_are_published_to_the_shared_tier(client, tmp_path, monkeypatch):
+    shared = SQLiteCache(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(server.cache, "shared", shared)
+
+    client.post("/api/user-list", json=list_item("m1"))
+
+    snapshot = asyncio.run(shared.get(server.cache.full_key("fallback", "memory_storage")))
+    assert snapshot["library_version"] == 1
+    assert asyncio.run(shared.get(server.cache.full_key("lock", "fallback:memory_storage"))) is None